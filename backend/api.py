@@ -1,12 +1,17 @@
 ﻿import os
 import uuid
+import asyncio
+import hashlib
+import base64
+import re
+import time
 import requests
 from typing import Union, List, Dict, Any
 from dotenv import load_dotenv
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from docx import Document
 from docx.shared import Inches, Pt, RGBColor
@@ -16,10 +21,35 @@ from datetime import datetime
 
 # LangChain - OpenAI
 from langchain_openai import ChatOpenAI
-from langchain_core.output_parsers import StrOutputParser
 
 # Import Schema va Prompts tu file schema.py
-from schema import HRM_SCHEMA_ENHANCED, ANSWER_PROMPT, get_schema_by_role, get_sql_prompt_by_role
+from schema import HRM_SCHEMA_ENHANCED, ANSWER_PROMPT, get_static_schema_by_role, get_session_context, get_sql_prompt_by_role
+from core.llm_executor import Deadline, LLMDeadlineExceeded, LLMExecutor
+from core.model_router import ModelRouter
+
+from services.auth_cache import CredentialIndex, issue_token, verify_token, resolve_role
+from services.background import run_daily_at, run_periodically
+from services.reference_cache import ReferenceCache
+from services.dept_project_index import DepartmentProjectIndex
+from services.progress_snapshot import LatestProgressSnapshot
+from services.live_counters import LiveCounters
+from services.dashboard_hub import DashboardHub
+from services.single_flight import SingleFlight
+from services.intent_engine import IntentEngine, data_scope
+from services.answer_templates import AnswerRenderer
+from services.wire_format import dumps, negotiate_encoding
+from services.hrm_result import HRMResult, raw_rows, rejected
+from services.hrm_replica import HRMReplica
+from services.change_capture import ChangeCapture
+from services.query_guard import QueryGuard
+from services.row_scope import scope_violation
+from services.query_telemetry import QueryTelemetry, set_caller
+from services.briefing_cache import BriefingCache
+from services.circuit_breaker import CircuitBreaker, CircuitOpen, CLOSED
+from services.write_queue import DONE, FAILED, Rejected, WriteQueue
+from services.leave_index import LeaveIndex
+from services.admission import AdmissionController, BULK, DEFAULT_LANES, Overloaded, StaleResponses, classify, set_lane
+from core.schema_hrm import HRM_SCHEMA
 
 # ==========================================================
 # 1. SETUP & CAU HINH
@@ -32,6 +62,90 @@ if not os.environ.get("OPENAI_API_KEY"):
 
 HRM_API_URL = "https://hrm.icss.com.vn/ICSS/api/execute-sql"
 
+# Chu ky nap lai chi muc dang nhap (giay)
+AUTH_CACHE_REFRESH_SECONDS = int(os.environ.get("AUTH_CACHE_REFRESH_SECONDS", 300))
+
+# Du lieu tham chieu (nhan vien / du an): tuoi toi da va chu ky lam moi nen (giay)
+REFERENCE_CACHE_MAX_AGE_SECONDS = int(os.environ.get("REFERENCE_CACHE_MAX_AGE_SECONDS", 3600))
+REFERENCE_CACHE_REFRESH_SECONDS = int(os.environ.get("REFERENCE_CACHE_REFRESH_SECONDS", 600))
+
+# Chi muc phong ban -> du an: bo sung du an moi / nap lai toan bo (giay)
+DEPT_PROJECT_INCREMENTAL_SECONDS = int(os.environ.get("DEPT_PROJECT_INCREMENTAL_SECONDS", 60))
+DEPT_PROJECT_FULL_REFRESH_SECONDS = int(os.environ.get("DEPT_PROJECT_FULL_REFRESH_SECONDS", 1800))
+
+# Snapshot tien do moi nhat: doc thay doi / doi soat toan bo (giay)
+PROGRESS_INCREMENTAL_SECONDS = int(os.environ.get("PROGRESS_INCREMENTAL_SECONDS", 30))
+PROGRESS_FULL_REFRESH_SECONDS = int(os.environ.get("PROGRESS_FULL_REFRESH_SECONDS", 3600))
+
+# Bo dem check-in / nghi phep / cong viec: doc thay doi / doi soat toan bo (giay)
+LIVE_COUNTERS_TICK_SECONDS = int(os.environ.get("LIVE_COUNTERS_TICK_SECONDS", 15))
+LIVE_COUNTERS_RECONCILE_SECONDS = int(os.environ.get("LIVE_COUNTERS_RECONCILE_SECONDS", 900))
+
+# Ban sao doc cac bang HRM (SQLite trong bo nho): chu ky nap lai toan bo / tuoi toi da truoc khi quay ve API (giay)
+REPLICA_REFRESH_SECONDS = int(os.environ.get("REPLICA_REFRESH_SECONDS", 21600))
+REPLICA_MAX_STALENESS_SECONDS = int(os.environ.get("REPLICA_MAX_STALENESS_SECONDS", 900))
+# Bang du lieu trong ngay (check-in, don nghi phep): nguong qua han rieng, chat hon
+REPLICA_LIVE_STALENESS_SECONDS = int(os.environ.get("REPLICA_LIVE_STALENESS_SECONDS", 60))
+REPLICA_LIVE_TABLES = ("cham_cong", "don_nghi_phep")
+# Dong bo tang dan ban sao: doc thay doi / doi soat dong bi xoa (giay), kich thuoc lo
+CHANGE_CAPTURE_POLL_SECONDS = int(os.environ.get("CHANGE_CAPTURE_POLL_SECONDS", 30))
+CHANGE_CAPTURE_RECONCILE_SECONDS = int(os.environ.get("CHANGE_CAPTURE_RECONCILE_SECONDS", 1800))
+CHANGE_CAPTURE_BATCH_SIZE = int(os.environ.get("CHANGE_CAPTURE_BATCH_SIZE", 500))
+# Bang khong co cot cap nhat (nhanvien, cong_viec, du_an...): doc lai ca bang moi N giay (< REPLICA_MAX_STALENESS_SECONDS)
+CHANGE_CAPTURE_TABLE_RELOAD_SECONDS = int(os.environ.get("CHANGE_CAPTURE_TABLE_RELOAD_SECONDS", 600))
+
+# Bang ket qua chat (dang cot): so dong gui ve de xem truoc; file Word: so dong toi da
+CHAT_PREVIEW_ROWS = int(os.environ.get("CHAT_PREVIEW_ROWS", 50))
+WORD_EXPORT_MAX_ROWS = int(os.environ.get("WORD_EXPORT_MAX_ROWS", 5000))
+
+# SQL do LLM sinh: cham_cong toan cong ty khong co dieu kien ngay chi quet N ngay gan nhat
+QUERY_GUARD_CHAM_CONG_DAYS = int(os.environ.get("QUERY_GUARD_CHAM_CONG_DAYS", 90))
+
+# Thong ke cau lenh HRM theo mau: file snapshot va chu ky ghi (giay)
+QUERY_TELEMETRY_SNAPSHOT_PATH = os.environ.get("QUERY_TELEMETRY_SNAPSHOT_PATH", "./static/telemetry/hrm_queries.json")
+QUERY_TELEMETRY_SNAPSHOT_SECONDS = int(os.environ.get("QUERY_TELEMETRY_SNAPSHOT_SECONDS", 300))
+
+# Tinh san briefing: cac moc gio trong ngay (truoc gio lam, sau khung check-in) va tuoi toi da (giay)
+BRIEFING_PREWARM_TIMES = os.environ.get("BRIEFING_PREWARM_TIMES", "07:40,08:20").split(",")
+BRIEFING_CACHE_MAX_AGE_SECONDS = int(os.environ.get("BRIEFING_CACHE_MAX_AGE_SECONDS", 10800))
+
+# Admission control: so slot goi HRM / LLM dong thoi toan he thong (chia theo lan uu tien)
+HRM_MAX_CONCURRENCY = int(os.environ.get("HRM_MAX_CONCURRENCY", 12))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 12))
+
+# Circuit breaker HRM API: ty le loi / ty le goi cham (giay) trong cua so gan nhat -> ngat mach, thoi gian ngat (giay)
+HRM_BREAKER_WINDOW = int(os.environ.get("HRM_BREAKER_WINDOW", 20))
+HRM_BREAKER_FAILURE_RATE = float(os.environ.get("HRM_BREAKER_FAILURE_RATE", 0.5))
+HRM_BREAKER_SLOW_CALL_SECONDS = float(os.environ.get("HRM_BREAKER_SLOW_CALL_SECONDS", 8))
+HRM_BREAKER_OPEN_SECONDS = float(os.environ.get("HRM_BREAKER_OPEN_SECONDS", 30))
+# Timeout ket noi / doc response HRM (giay)
+HRM_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("HRM_CONNECT_TIMEOUT_SECONDS", 5))
+HRM_READ_TIMEOUT_SECONDS = float(os.environ.get("HRM_READ_TIMEOUT_SECONDS", 30))
+
+# Hang doi ghi HRM (write-behind): file log append-only, chu ky gui (giay), so item moi lo, so lan thu toi da
+WRITE_QUEUE_LOG_PATH = os.environ.get("WRITE_QUEUE_LOG_PATH", "./static/write_queue/hrm_writes.log")
+WRITE_QUEUE_DRAIN_SECONDS = float(os.environ.get("WRITE_QUEUE_DRAIN_SECONDS", 1))
+WRITE_QUEUE_BATCH_SIZE = int(os.environ.get("WRITE_QUEUE_BATCH_SIZE", 50))
+WRITE_QUEUE_MAX_ATTEMPTS = int(os.environ.get("WRITE_QUEUE_MAX_ATTEMPTS", 8))
+# Gui lai cong viec: bo qua neu da co cong viec giong het (ten, nguoi giao, han, du an) tao trong N gio gan day
+WRITE_QUEUE_DEDUPE_HOURS = int(os.environ.get("WRITE_QUEUE_DEDUPE_HOURS", 24))
+
+# Chi muc khoang nghi phep theo nhan vien (kiem tra trung / so ngay phep): chu ky nap lai toan bo (giay)
+LEAVE_INDEX_REFRESH_SECONDS = int(os.environ.get("LEAVE_INDEX_REFRESH_SECONDS", 300))
+
+# Heartbeat cho luong SSE dashboard (giay)
+DASHBOARD_HEARTBEAT_SECONDS = int(os.environ.get("DASHBOARD_HEARTBEAT_SECONDS", 15))
+
+# Deadline tong cho mot request /chat va ngan sach tung buoc goi LLM (giay)
+CHAT_DEADLINE_SECONDS = float(os.environ.get("CHAT_DEADLINE_SECONDS", 25))
+LLM_EXTRACT_BUDGET_SECONDS = float(os.environ.get("LLM_EXTRACT_BUDGET_SECONDS", 4))
+LLM_SQL_BUDGET_SECONDS = float(os.environ.get("LLM_SQL_BUDGET_SECONDS", 12))
+LLM_ANSWER_BUDGET_SECONDS = float(os.environ.get("LLM_ANSWER_BUDGET_SECONDS", 12))
+# Do tre hedging khi chua du mau p95 (giay)
+LLM_HEDGE_DEFAULT_DELAY_SECONDS = float(os.environ.get("LLM_HEDGE_DEFAULT_DELAY_SECONDS", 2.5))
+# So loi goi LLM bi bo lai (thua hedge / het deadline) con chay toi da truoc khi ngung hedge
+LLM_MAX_ABANDONED_CALLS = int(os.environ.get("LLM_MAX_ABANDONED_CALLS", 4))
+
 app = FastAPI(title="ICS HRM SQL Chatbot API", version="3.0 - OpenAI")
 
 app.add_middleware(
@@ -42,6 +156,67 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def tag_hrm_queries(request: Request, call_next):
+    """Gắn endpoint / role cho thống kê câu lệnh HRM phát sinh trong request này."""
+    session = get_session(request.headers.get("authorization"))
+    set_caller(endpoint=f"{request.method} {request.url.path}",
+               role=session['role'] if session else request.query_params.get("role"))
+    return await call_next(request)
+
+# Làn ưu tiên: interactive (/chat, /login, ghi) > dashboard > bulk (xuất file, giao việc hàng loạt) > job nền
+admission = AdmissionController(DEFAULT_LANES, {"hrm": HRM_MAX_CONCURRENCY, "llm": LLM_MAX_CONCURRENCY})
+# Response GET thành công gần nhất của làn dashboard, trả lại khi làn bị quá tải
+stale_responses = StaleResponses()
+
+def stale_response(request: Request, lane: str) -> Union[Response, None]:
+    """Response thành công gần nhất của request này (đánh dấu X-Served-Stale); None nếu làn không cho phép / chưa có."""
+    if not admission.lanes[lane].serve_stale:
+        return None
+    entry = stale_responses.get(stale_key(request))
+    if entry is None:
+        return None
+    body, media_type, saved_at = entry
+    admission.record_stale(lane)
+    return Response(content=body, media_type=media_type,
+                    headers={"X-Served-Stale": "1", "Age": str(int(time.time() - saved_at))})
+
+def shed_response(request: Request, lane: str, error: Exception) -> Response:
+    """Quá tải / HRM ngắt mạch: trả bản cũ gần nhất nếu làn cho phép, không thì 503 + Retry-After."""
+    stale = stale_response(request, lane)
+    if stale is not None:
+        return stale
+    print(f"[ADMISSION] Từ chối {request.method} {request.url.path}: {error}")
+    if isinstance(error, CircuitOpen):
+        return JSONResponse(status_code=503, headers={"Retry-After": str(int(error.retry_after))},
+                            content={"detail": "Hệ thống dữ liệu đang gián đoạn, vui lòng thử lại sau."})
+    return JSONResponse(status_code=503, headers={"Retry-After": "2"},
+                        content={"detail": "Hệ thống đang quá tải, vui lòng thử lại sau."})
+
+def stale_key(request: Request) -> str:
+    return "|".join((request.url.path, request.url.query, request.headers.get("accept", ""),
+                     request.headers.get("accept-encoding", ""), request.headers.get("authorization", "")))
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Xếp request vào làn ưu tiên; làn thấp bị bỏ / trả bản cũ trước khi làn cao phải chờ."""
+    lane = classify(request.method, request.url.path)
+    if lane is None:
+        return await call_next(request)
+    try:
+        async with admission.admit(lane):
+            response = await call_next(request)
+    except (Overloaded, CircuitOpen) as e:
+        return shed_response(request, lane, e)
+    if response.status_code in (502, 503, 504):
+        # HRM lỗi / chậm: dữ liệu thật gần nhất thay cho trang lỗi
+        return stale_response(request, lane) or response
+    if admission.lanes[lane].serve_stale and request.method == "GET" and response.status_code == 200:
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        stale_responses.put(stale_key(request), body, response.headers.get("content-type"))
+        return Response(content=body, status_code=response.status_code, headers=dict(response.headers))
+    return response
+
 # Tao thu muc luu file tam
 EXPORT_DIR = "./static/reports"
 if not os.path.exists(EXPORT_DIR):
@@ -53,8 +228,33 @@ if not os.path.exists(EXPORT_DIR):
 llm = ChatOpenAI(
     model="gpt-4o-mini",
     temperature=0,
-    max_tokens=600
+    max_tokens=600,
+    # Stream kèm usage để đo time-to-first-token và số token đọc từ prompt cache
+    stream_usage=True,
+    # Retry / hedging do llm_executor đảm nhận; timeout chặn thread bị bỏ rơi sau deadline
+    timeout=CHAT_DEADLINE_SECONDS,
+    max_retries=0
+)
+
+# Model nhanh (Groq) cho các bước rẻ; thiếu GROQ_API_KEY thì mọi bước dùng OpenAI
+try:
+    from core.llm import get_llm
+    fast_llm = get_llm()
+except Exception as e:
+    print(f"[LLM] Khong khoi tao duoc model nhanh (Groq), dung OpenAI cho moi buoc: {e}")
+    fast_llm = None
+
+llm_executor = LLMExecutor(
+    stage_budgets={
+        "extract_name": LLM_EXTRACT_BUDGET_SECONDS,
+        "sql": LLM_SQL_BUDGET_SECONDS,
+        "answer": LLM_ANSWER_BUDGET_SECONDS,
+    },
+    hedge_default_delay=LLM_HEDGE_DEFAULT_DELAY_SECONDS,
+    slot=lambda: admission.slot("llm"),
+    max_abandoned=LLM_MAX_ABANDONED_CALLS,
 )
+model_router = ModelRouter(strong=llm, fast=fast_llm, executor=llm_executor)
 
 # ==========================================================
 # 3. PYDANTIC MODELS (Request / Response)
@@ -69,6 +269,7 @@ class ChatRequest(BaseModel):
     role: Union[str, None] = None  # 'admin', 'manager', 'employee'
     phong_ban_id: Union[int, None] = None
     conversation_history: Union[List[ConversationMessage], None] = None  # Context Memory
+    compact: bool = False  # True: data trả về dạng cột {columns, rows}
 
 class LoginRequest(BaseModel):
     username: str
@@ -78,10 +279,11 @@ class LoginResponse(BaseModel):
     success: bool
     message: str
     user: Union[Dict, None] = None
+    token: Union[str, None] = None  # Session token ky HMAC (user_id, role, phong_ban_id)
 
 class ChatResponse(BaseModel):
     sql: Union[str, None]
-    data: Union[List, Dict, Any, None]
+    data: Any = None  # HRMResult trong pipeline; chat_http_response serialize thành list dict / dạng cột
     answer: str
     download_url: Union[str, None] = None
 
@@ -109,6 +311,11 @@ def create_word_report(data, title="BÁO CÁO HRM", filename_prefix="report", qu
     
     if isinstance(data, dict):
         data = [data]
+    if not isinstance(data, HRMResult):
+        data = HRMResult.decode(data)
+    total = len(data)
+    # Chỉ đọc đoạn dòng cần ghi (không sao chép / dựng dict cho cả kết quả)
+    rows = data.slice(0, WORD_EXPORT_MAX_ROWS)
     
     doc = Document()
     
@@ -138,9 +345,11 @@ def create_word_report(data, title="BÁO CÁO HRM", filename_prefix="report", qu
         doc.add_paragraph()
     
     section_num = 3 if question and summary else (2 if question or summary else 1)
-    doc.add_heading(f"{section_num}. Dữ liệu chi tiết ({len(data)} bản ghi)", level=1)
+    doc.add_heading(f"{section_num}. Dữ liệu chi tiết ({total} bản ghi)", level=1)
+    if len(rows) < total:
+        doc.add_paragraph(f"(Hiển thị {len(rows)}/{total} bản ghi đầu tiên)")
     
-    headers = list(data[0].keys())
+    headers = list(rows.columns)
     
     table = doc.add_table(rows=1, cols=len(headers))
     table.style = 'Table Grid'
@@ -154,10 +363,10 @@ def create_word_report(data, title="BÁO CÁO HRM", filename_prefix="report", qu
                 run.font.bold = True
                 run.font.size = Pt(10)
         
-    for item in data:
+    for item in rows:
         row_cells = table.add_row().cells
         for i, h in enumerate(headers):
-            cell_value = item.get(h, '')
+            cell_value = item[i]
             row_cells[i].text = str(cell_value) if cell_value is not None else ''
             for paragraph in row_cells[i].paragraphs:
                 for run in paragraph.runs:
@@ -205,57 +414,234 @@ def validate_sql(sql: str) -> str:
     
     return sql_clean
 
+_SESSION_PLACEHOLDER = re.compile(r"\{+\s*(user_id|dept_id)\s*\}+")
+
+def bind_session_scope(sql: str, role: str, user_id: Union[int, None], dept_id: Union[int, None]) -> str:
+    """
+    Prompt dùng chung theo role nên LLM có thể chép nguyên {user_id} / {dept_id} vào SQL:
+    thay bằng giá trị của phiên; placeholder không có giá trị (admin / thiếu phòng ban) -> NO_PERMISSION.
+    Employee / manager: mỗi bảng phải có điều kiện trên đúng cột phạm vi của bảng đó (row_scope),
+    thiếu thì coi như truy cập ngoài phạm vi -> NO_PERMISSION.
+    """
+    if not sql or "NO_PERMISSION" in sql or "NO_DATA" in sql:
+        return sql
+    values = {}
+    if role != 'admin' and user_id is not None:
+        values["user_id"] = int(user_id)
+    if role == 'manager' and dept_id is not None:
+        values["dept_id"] = int(dept_id)
+    unresolved = {m.group(1) for m in _SESSION_PLACEHOLDER.finditer(sql)} - set(values)
+    if unresolved:
+        print(f"[SCOPE] Placeholder không có giá trị ({', '.join(sorted(unresolved))}): {sql[:200]}")
+        return "NO_PERMISSION"
+    sql = _SESSION_PLACEHOLDER.sub(lambda m: str(values[m.group(1)]), sql)
+    if role == 'admin':
+        return sql
+    table = scope_violation(sql, role, values.get("user_id"), values.get("dept_id"))
+    if table is not None:
+        print(f"[SCOPE] Bảng {table} thiếu điều kiện phạm vi cho {role}: {sql[:200]}")
+        return "NO_PERMISSION"
+    return sql
+
+# Thống kê thời gian / số dòng / byte theo mẫu câu lệnh HRM (xem /admin/query-stats)
+query_telemetry = QueryTelemetry(QUERY_TELEMETRY_SNAPSHOT_PATH)
+# Ngắt mạch khi HRM lỗi / chậm: lời gọi sau đó trả CircuitOpen ngay thay vì chờ timeout
+hrm_breaker = CircuitBreaker(
+    "HRM", window=HRM_BREAKER_WINDOW, failure_rate=HRM_BREAKER_FAILURE_RATE,
+    slow_call_seconds=HRM_BREAKER_SLOW_CALL_SECONDS, open_seconds=HRM_BREAKER_OPEN_SECONDS
+)
+
 def execute_sql_api(sql: str) -> Any:
     if not sql: return None
 
     print(f"\n[DEBUG SQL]: {sql}")
 
+    started = time.perf_counter()
+    size = 0
+    result: Any = None
     try:
         payload = {"command": sql}
-        res = requests.post(HRM_API_URL, json=payload, timeout=30)
+        # Giữ slot HRM theo làn của request / job hiện tại (Overloaded nếu chờ quá ngân sách)
+        with admission.slot("hrm"):
+            hrm_breaker.before_call()
+            call_started = time.perf_counter()
+            try:
+                res = requests.post(HRM_API_URL, json=payload,
+                                    timeout=(HRM_CONNECT_TIMEOUT_SECONDS, HRM_READ_TIMEOUT_SECONDS))
+            except Exception as e:
+                hrm_breaker.record(False, time.perf_counter() - call_started, str(e))
+                raise
+            hrm_breaker.record(res.status_code < 500, time.perf_counter() - call_started, f"HTTP {res.status_code}")
+        size = len(res.content)
         
         if res.status_code == 200:
             try:
                 result = res.json()
-                # Kiểm tra nếu server trả về lỗi
-                if isinstance(result, dict) and result.get('success') == False:
-                    error_msg = result.get('error', 'Unknown error')
+                # Kiểm tra nếu server trả về lỗi (raw_rows là nơi duy nhất đọc dạng response)
+                _rows, error_msg = raw_rows(result)
+                if error_msg is not None:
                     print(f"[API REJECTED]: {error_msg}")
                     print(f"[PROBLEM SQL]: {sql}")
-                return result
             except:
-                return res.text
+                result = res.text
         else:
             print(f"API Error {res.status_code}: {res.text}")
-            return f"Lỗi từ hệ thống dữ liệu: {res.text}"
+            result = f"Lỗi từ hệ thống dữ liệu: {res.text}"
+    except (Overloaded, CircuitOpen):
+        raise
     except Exception as e:
         print(f"Connection Error: {e}")
-        return "Lỗi kết nối đến máy chủ dữ liệu."
+        result = "Lỗi kết nối đến máy chủ dữ liệu."
+
+    rows, error = raw_rows(result)
+    query_telemetry.record(sql, time.perf_counter() - started, len(rows) if rows is not None else None,
+                           size, error=error is not None)
+    return result
+
+def query_hrm(sql: str) -> HRMResult:
+    """Chạy SQL trên HRM và giải mã về HRMResult (cột + tuple, hoặc biến thể lỗi)."""
+    return HRMResult.decode(execute_sql_api(sql))
+
+# Bản sao đọc: SELECT của chat / analytics chạy cục bộ, bảng quá hạn hoặc cú pháp lạ -> API từ xa
+hrm_replica = HRMReplica(lambda sql: raw_rows(execute_sql_api(sql)), HRM_SCHEMA,
+                         max_staleness=REPLICA_MAX_STALENESS_SECONDS,
+                         table_staleness={t: REPLICA_LIVE_STALENESS_SECONDS for t in REPLICA_LIVE_TABLES})
+# Đồng bộ tăng dần theo high-water mark từng bảng; đối soát checksum cho dòng bị xóa
+change_capture = ChangeCapture(lambda sql: raw_rows(execute_sql_api(sql)), hrm_replica,
+                               batch_size=CHANGE_CAPTURE_BATCH_SIZE,
+                               table_reload_seconds=CHANGE_CAPTURE_TABLE_RELOAD_SECONDS)
+
+def query_hrm_read(sql: str) -> HRMResult:
+    """SELECT chỉ đọc: thử bản sao cục bộ trước, không được thì gọi HRM như query_hrm.
+    HRM đang ngắt mạch -> chấp nhận bản sao đã quá max_staleness."""
+    result = hrm_replica.query(sql, allow_stale=hrm_breaker.state != CLOSED)
+    return result if result is not None else query_hrm(sql)
+
+def stale_note(result: Any) -> str:
+    """Ghi chú cuối câu trả lời khi dữ liệu lấy từ bản sao quá hạn (HRM đang gián đoạn)."""
+    age = getattr(result, "stale_seconds", None)
+    if not age:
+        return ""
+    return (f"\n\n(Lưu ý: hệ thống HRM đang gián đoạn, dữ liệu trên được cập nhật cách đây "
+            f"khoảng {max(1, int(age // 60))} phút.)")
+
+def extract_rows(result: Any) -> list:
+    """Danh sách dòng (dict) gốc từ response HRM, không sao chép; rỗng nếu lỗi."""
+    rows, _error = raw_rows(result)
+    return rows or []
+
+def get_session(authorization: Union[str, None]) -> Union[Dict, None]:
+    """Giải mã header `Authorization: Bearer <token>`; None nếu thiếu hoặc không hợp lệ."""
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return None
+    return verify_token(authorization[7:].strip())
+
+# ==========================================================
+# 5B. CHI MUC TRONG BO NHO (phong ban -> du an, tien do moi nhat, bo dem)
+# ==========================================================
+dept_project_index = DepartmentProjectIndex(lambda sql: extract_rows(execute_sql_api(sql)))
+progress_snapshot = LatestProgressSnapshot(lambda sql: extract_rows(execute_sql_api(sql)))
+live_counters = LiveCounters(lambda sql: extract_rows(execute_sql_api(sql)))
+
+# Khoảng nghỉ phép (đã duyệt + chờ duyệt) theo nhân viên: kiểm tra đơn mới, đếm người nghỉ theo ngày
+leave_index = LeaveIndex(lambda sql: raw_rows(execute_sql_api(sql)))
+
+def refresh_leave_index() -> bool:
+    """
+    Nạp lại chỉ mục nghỉ phép, phủ quyết định duyệt còn nằm trong hàng đợi ghi.
+    Đơn chưa ghi xuống HRM đã được giữ chỗ theo write id (create_leave_request), không lấy lại từ hàng đợi.
+    """
+    return leave_index.refresh(
+        lambda: {int(p['request_id']): bool(p['approved']) for p in write_queue.pending("leave_approve")}
+    )
+
+def ensure_leave_index() -> bool:
+    if not leave_index.ready:
+        refresh_leave_index()
+    return leave_index.ready
+
+def ensure_live_counters() -> bool:
+    """Đối soát ngay nếu bộ đếm chưa nạp (hoặc đã sang ngày mới mà job nền chưa chạy)."""
+    if not live_counters.ready:
+        if live_counters.loaded_at:
+            live_counters.tick()
+        else:
+            live_counters.reconcile()
+    return live_counters.ready
+
+def ensure_dept_project_index() -> bool:
+    """Nạp chỉ mục nếu job nền chưa kịp chạy; False nếu HRM không trả dữ liệu."""
+    if not dept_project_index.ready:
+        dept_project_index.refresh()
+    return dept_project_index.ready
+
+def get_dept_projects_summary(dept_id: int) -> Union[Dict, None]:
+    """Tổng hợp dự án của phòng từ chỉ mục + snapshot tiến độ, không truy vấn HRM."""
+    if not ensure_dept_project_index():
+        return None
+    if not progress_snapshot.ready:
+        progress_snapshot.refresh()
+    
+    stats = dept_project_index.project_stats(dept_id)
+    overdue = stats["overdue"]
+    
+    details = "; ".join(
+        f"{p.get('ten_du_an')} (Leader: {p.get('lead_name') or 'N/A'}, Progress: {progress_snapshot.project_progress(p['id'])}%)"
+        for p in overdue
+    )
+    return {
+        "total_projects": stats["total_projects"],
+        "overdue_projects": len(overdue),
+        "overdue_projects_details": details
+    }
+
+# Phần briefing giống nhau giữa các lượt đăng nhập (việc, phép, tổng hợp phòng / công ty) tính sẵn theo lịch
+briefing_cache = BriefingCache(query_hrm_read, get_dept_projects_summary, max_age=BRIEFING_CACHE_MAX_AGE_SECONDS)
+
+
+def invalidate_briefing_on_change(table: str, rows: List[dict]):
+    """Change capture thấy công việc / phép năm đổi (kể cả sửa trực tiếp trên HRM) -> bỏ entry briefing liên quan."""
+    if table in ("ngay_phep_nam", "cong_viec_nguoi_nhan"):
+        briefing_cache.invalidate_users({int(r["nhan_vien_id"]) for r in rows if r.get("nhan_vien_id") is not None})
+    elif table == "cong_viec":
+        ids = ", ".join(str(int(r["id"])) for r in rows if r.get("id") is not None)
+        if ids:
+            assignees = hrm_replica.local_rows(
+                f'SELECT DISTINCT nhan_vien_id FROM "cong_viec_nguoi_nhan" WHERE cong_viec_id IN ({ids})'
+            ) if hrm_replica.loaded("cong_viec_nguoi_nhan") else []
+            briefing_cache.invalidate_users({row[0] for row in assignees if row[0] is not None})
+
+
+change_capture.subscribe(invalidate_briefing_on_change)
 
 # ==========================================================
 # 6. DAILY BRIEFING ENDPOINT
 # ==========================================================
 @app.post("/briefing", response_model=BriefingResponse)
-async def get_daily_briefing(req: BriefingRequest):
+def get_daily_briefing(req: BriefingRequest, authorization: Union[str, None] = Header(None)):
     """
     API lấy thông tin tóm tắt hàng ngày cho user.
     Trả về thông tin khác nhau tùy theo role.
+    Nếu có session token hợp lệ thì tin theo token thay vì body.
     """
     try:
-        user_id = req.user_id
-        role = req.role
-        dept_id = req.phong_ban_id
+        session = get_session(authorization)
+        user_id = session['user_id'] if session else req.user_id
+        role = session['role'] if session else req.role
+        dept_id = session['phong_ban_id'] if session else req.phong_ban_id
+        set_caller(role=role)
         
         print(f"\n[BRIEFING] User: {user_id}, Role: {role}, Dept: {dept_id}")
         
+        # Phần tính sẵn (tên, việc, phép); chưa có / đã cũ thì truy vấn trực tiếp như trước
+        cached = briefing_cache.personal(user_id)
+        
         # Lấy thông tin user
-        user_sql = f"SELECT ho_ten, chuc_vu FROM nhanvien WHERE id = {user_id}"
-        user_result = execute_sql_api(user_sql)
-        user_name = "Bạn"
-        if isinstance(user_result, dict) and user_result.get('data'):
-            user_name = user_result['data'][0].get('ho_ten', 'Bạn')
-        elif isinstance(user_result, list) and len(user_result) > 0:
-            user_name = user_result[0].get('ho_ten', 'Bạn')
+        if cached:
+            user_name = cached['name'] or 'Bạn'
+        else:
+            user_sql = f"SELECT ho_ten, chuc_vu FROM nhanvien WHERE id = {user_id}"
+            user_name = query_hrm(user_sql).scalar('ho_ten', 'Bạn')
         
         # Xác định lời chào theo thời gian
         hour = datetime.now().hour
@@ -270,7 +656,7 @@ async def get_daily_briefing(req: BriefingRequest):
         
         # === THÔNG TIN CHUNG CHO TẤT CẢ ROLE ===
         
-        # 1. Trạng thái check-in hôm nay (chỉ dành cho Employee & Manager)
+        # 1. Trạng thái check-in hôm nay (chỉ dành cho Employee & Manager) - luôn đọc trực tiếp (bản sao đọc)
         checkin_status = None
         if role != 'admin':
             checkin_sql = f"""
@@ -278,22 +664,10 @@ async def get_daily_briefing(req: BriefingRequest):
             FROM cham_cong 
             WHERE nhan_vien_id = {user_id} AND ngay = CURDATE()
             """
-            checkin_result = execute_sql_api(checkin_sql)
+            checkin_result = query_hrm_read(checkin_sql)
             
-            if isinstance(checkin_result, dict) and checkin_result.get('data'):
-                data = checkin_result['data']
-                if len(data) > 0:
-                    check_in = data[0].get('check_in', '')
-                    is_late = check_in and check_in >= '08:06:00'
-                    checkin_status = {
-                        "checked_in": bool(check_in),
-                        "check_in_time": check_in,
-                        "check_out_time": None,
-                        "is_late": is_late,
-                        "status_text": "Đi muộn" if is_late else "Đúng giờ" if check_in else "Chưa check-in"
-                    }
-            elif isinstance(checkin_result, list) and len(checkin_result) > 0:
-                check_in = checkin_result[0].get('check_in', '')
+            if len(checkin_result) > 0:
+                check_in = checkin_result.scalar('check_in', '')
                 is_late = check_in and check_in >= '08:06:00'
                 checkin_status = {
                     "checked_in": bool(check_in),
@@ -316,6 +690,7 @@ async def get_daily_briefing(req: BriefingRequest):
             checkin_status = None
         
         # 2. Công việc cần làm hôm nay
+        tasks_today = cached['tasks_today'] if cached else None
         tasks_sql = f"""
         SELECT cv.ten_cong_viec, cv.han_hoan_thanh, cv.muc_do_uu_tien, cv.trang_thai
         FROM cong_viec cv
@@ -325,13 +700,8 @@ async def get_daily_briefing(req: BriefingRequest):
         ORDER BY cv.muc_do_uu_tien DESC, cv.han_hoan_thanh ASC
         LIMIT 5
         """
-        tasks_result = execute_sql_api(tasks_sql)
-        tasks_today = []
-        
-        if isinstance(tasks_result, dict) and tasks_result.get('data'):
-            tasks_today = tasks_result['data']
-        elif isinstance(tasks_result, list):
-            tasks_today = tasks_result
+        if tasks_today is None:
+            tasks_today = query_hrm(tasks_sql).dicts()
         
         # 3. Số ngày phép còn lại
         leave_sql = f"""
@@ -339,15 +709,7 @@ async def get_daily_briefing(req: BriefingRequest):
         FROM ngay_phep_nam
         WHERE nhan_vien_id = {user_id} AND nam = YEAR(CURDATE())
         """
-        leave_result = execute_sql_api(leave_sql)
-        leave_balance = None
-        
-        if isinstance(leave_result, dict) and leave_result.get('data'):
-            data = leave_result['data']
-            if len(data) > 0:
-                leave_balance = data[0]
-        elif isinstance(leave_result, list) and len(leave_result) > 0:
-            leave_balance = leave_result[0]
+        leave_balance = cached['leave_balance'] if cached else query_hrm(leave_sql).first()
         
         
         alerts = []
@@ -358,110 +720,28 @@ async def get_daily_briefing(req: BriefingRequest):
         
         # === THÔNG TIN CHO MANAGER ===
         if role == 'manager' and dept_id:
-            # Tình hình phòng ban
-            team_checkin_sql = f"""
-            SELECT 
-                (SELECT COUNT(*) FROM nhanvien WHERE phong_ban_id = {dept_id}) as total,
-                (SELECT COUNT(DISTINCT c.nhan_vien_id) 
-                 FROM cham_cong c 
-                 JOIN nhanvien nv ON c.nhan_vien_id = nv.id 
-                 WHERE nv.phong_ban_id = {dept_id} AND c.ngay = CURDATE()) as checked_in,
-                (SELECT COUNT(DISTINCT dnp.nhan_vien_id) 
-                 FROM don_nghi_phep dnp 
-                 JOIN nhanvien nv ON dnp.nhan_vien_id = nv.id 
-                 WHERE nv.phong_ban_id = {dept_id} 
-                 AND CURDATE() BETWEEN dnp.tu_ngay AND dnp.den_ngay 
-                 AND dnp.trang_thai = 'da_duyet') as on_leave
-            """
-            team_result = execute_sql_api(team_checkin_sql)
-            
-            if isinstance(team_result, dict) and team_result.get('data'):
-                data = team_result['data'][0] if team_result['data'] else {}
-                team_summary = {
-                    "total_employees": data.get('total', 0),
-                    "checked_in": data.get('checked_in', 0),
-                    "on_leave": data.get('on_leave', 0),
-                    "not_checked_in": data.get('total', 0) - data.get('checked_in', 0) - data.get('on_leave', 0)
-                }
-            elif isinstance(team_result, list) and len(team_result) > 0:
-                data = team_result[0]
+            # Tình hình phòng ban + công việc phòng ban (đọc từ bộ đếm trong bộ nhớ)
+            if ensure_live_counters():
+                total = live_counters.employees(dept_id)
+                checked_in = live_counters.checked_in(dept_id)
+                # Người nghỉ hôm nay: tra chỉ mục khoảng nghỉ (gồm cả quyết định vừa duyệt)
+                on_leave = leave_index.on_leave(dept_id=dept_id) if ensure_leave_index() else live_counters.on_leave(dept_id)
                 team_summary = {
-                    "total_employees": data.get('total', 0),
-                    "checked_in": data.get('checked_in', 0),
-                    "on_leave": data.get('on_leave', 0),
-                    "not_checked_in": data.get('total', 0) - data.get('checked_in', 0) - data.get('on_leave', 0)
-                }
-            
-            # Công việc phòng ban
-            dept_tasks_sql = f"""
-            SELECT 
-                COUNT(DISTINCT cv.id) as total_tasks,
-                COUNT(DISTINCT CASE WHEN cv.trang_thai = 'Đã hoàn thành' THEN cv.id END) as completed_tasks,
-                COUNT(DISTINCT CASE WHEN cv.trang_thai != 'Đã hoàn thành' AND cv.han_hoan_thanh < CURDATE() THEN cv.id END) as overdue_tasks
-            FROM cong_viec cv
-            JOIN cong_viec_nguoi_nhan cvnn ON cv.id = cvnn.cong_viec_id
-            JOIN nhanvien nv ON cvnn.nhan_vien_id = nv.id
-            WHERE nv.phong_ban_id = {dept_id}
-            """
-            dept_tasks_result = execute_sql_api(dept_tasks_sql)
-            
-            if isinstance(dept_tasks_result, dict) and dept_tasks_result.get('data'):
-                data = dept_tasks_result['data'][0] if dept_tasks_result['data'] else {}
-                dept_tasks_summary = {
-                    "total_tasks": data.get('total_tasks', 0),
-                    "completed_tasks": data.get('completed_tasks', 0),
-                    "overdue_tasks": data.get('overdue_tasks', 0)
+                    "total_employees": total,
+                    "checked_in": checked_in,
+                    "on_leave": on_leave,
+                    "not_checked_in": total - checked_in - on_leave
                 }
-            elif isinstance(dept_tasks_result, list) and len(dept_tasks_result) > 0:
-                data = dept_tasks_result[0]
+                
+                task_counts = live_counters.tasks(dept_id)
                 dept_tasks_summary = {
-                    "total_tasks": data.get('total_tasks', 0),
-                    "completed_tasks": data.get('completed_tasks', 0),
-                    "overdue_tasks": data.get('overdue_tasks', 0)
+                    "total_tasks": task_counts["total"],
+                    "completed_tasks": task_counts["completed"],
+                    "overdue_tasks": task_counts["overdue"]
                 }
             
-            # Dự án phòng ban
-            dept_name_sql = f"SELECT ten_phong FROM phong_ban WHERE id = {dept_id}"
-            dept_name_result = execute_sql_api(dept_name_sql)
-            dept_name = ""
-            if isinstance(dept_name_result, dict) and dept_name_result.get('data'):
-                dept_name = dept_name_result['data'][0].get('ten_phong', '')
-            elif isinstance(dept_name_result, list) and len(dept_name_result) > 0:
-                dept_name = dept_name_result[0].get('ten_phong', '')
-            
-            # Cải thiện: Thêm thông tin Leader và tiến độ dự án (Luật 25)
-            dept_projects_sql = f"""
-            SELECT 
-                COUNT(DISTINCT d.id) as total_projects,
-                COUNT(DISTINCT CASE WHEN d.ngay_ket_thuc < CURDATE() AND d.trang_thai_duan NOT IN ('Đã hoàn thành', 'Kết thúc', 'Tạm ngưng') THEN d.id END) as overdue_projects,
-                STRING_AGG(DISTINCT CASE WHEN d.ngay_ket_thuc < CURDATE() AND d.trang_thai_duan NOT IN ('Đã hoàn thành', 'Kết thúc', 'Tạm ngưng')
-                    THEN d.ten_du_an + ' (Leader: ' + ISNULL(nv.ho_ten, 'N/A') + ', Progress: ' + CAST(ISNULL(CAST(ROUND(AVG(td.phan_tram), 0) AS INT), 0) AS VARCHAR) + '%)'
-                    ELSE NULL END, '; ') as overdue_projects_details
-            FROM du_an d
-            LEFT JOIN nhanvien nv ON d.lead_id = nv.id
-            LEFT JOIN cong_viec cv ON d.id = cv.du_an_id
-            LEFT JOIN cong_viec_tien_do td ON cv.id = td.cong_viec_id 
-                AND td.thoi_gian_cap_nhat = (SELECT MAX(thoi_gian_cap_nhat) FROM cong_viec_tien_do WHERE cong_viec_id = cv.id)
-            WHERE d.phong_ban LIKE '%{dept_name}%' 
-                AND d.trang_thai_duan NOT IN ('Đã hoàn thành', 'Kết thúc')
-            GROUP BY d.id, d.ten_du_an, nv.ho_ten
-            """
-            dept_projects_result = execute_sql_api(dept_projects_sql)
-            
-            if isinstance(dept_projects_result, dict) and dept_projects_result.get('data'):
-                data = dept_projects_result['data'][0] if dept_projects_result['data'] else {}
-                dept_projects_summary = {
-                    "total_projects": data.get('total_projects', 0),
-                    "overdue_projects": data.get('overdue_projects', 0),
-                    "overdue_projects_details": data.get('overdue_projects_details', '')
-                }
-            elif isinstance(dept_projects_result, list) and len(dept_projects_result) > 0:
-                data = dept_projects_result[0]
-                dept_projects_summary = {
-                    "total_projects": data.get('total_projects', 0),
-                    "overdue_projects": data.get('overdue_projects', 0),
-                    "overdue_projects_details": data.get('overdue_projects_details', '')
-                }
+            # Dự án phòng ban (tra chỉ mục phòng ban -> dự án, kèm Leader và tiến độ - Luật 25)
+            dept_projects_summary = briefing_cache.dept_projects(dept_id) or get_dept_projects_summary(dept_id)
             
             # Alerts
             if dept_tasks_summary and dept_tasks_summary.get('overdue_tasks', 0) > 0:
@@ -485,65 +765,22 @@ async def get_daily_briefing(req: BriefingRequest):
         
         # === THÔNG TIN CHO ADMIN ===
         if role == 'admin':
-            company_sql = """
-            SELECT 
-                (SELECT COUNT(*) FROM nhanvien WHERE trang_thai_lam_viec LIKE '%Đang%' OR trang_thai_lam_viec IS NULL) as total_employees,
-                (SELECT COUNT(DISTINCT nhan_vien_id) FROM cham_cong WHERE DATE(ngay) = CURDATE()) as checked_in_today,
-                (SELECT COUNT(*) FROM du_an WHERE trang_thai_duan LIKE '%Đang%' OR trang_thai_duan LIKE '%thực hiện%') as active_projects,
-                (SELECT COUNT(*) FROM cong_viec WHERE trang_thai != 'Đã hoàn thành' AND han_hoan_thanh < CURDATE()) as overdue_tasks,
-                (SELECT COUNT(*) FROM du_an WHERE ngay_ket_thuc < CURDATE() AND trang_thai_duan NOT IN ('Đã hoàn thành', 'Tạm ngưng')) as overdue_projects
-            """
-            company_result = execute_sql_api(company_sql)
-            
-            print(f"[BRIEFING ADMIN] Company result type: {type(company_result)}")
-            print(f"[BRIEFING ADMIN] Company result: {company_result}")
+            data = briefing_cache.company()
+            if data is None:
+                # Cùng câu SQL với bản tính sẵn -> số liệu không lệch giữa hai đường
+                company_result = query_hrm(BriefingCache.COMPANY_SQL)
+                data = company_result.first() or {}
+                print(f"[BRIEFING ADMIN] Company result: {company_result}")
             
-            if isinstance(company_result, dict) and company_result.get('data'):
-                data = company_result['data'][0] if company_result['data'] else {}
-                company_summary = {
-                    "total_employees": data.get('total_employees', 0) or 0,
-                    "checked_in_today": data.get('checked_in_today', 0) or 0,
-                    "active_projects": data.get('active_projects', 0) or 0,
-                    "overdue_tasks": data.get('overdue_tasks', 0) or 0,
-                    "overdue_projects": data.get('overdue_projects', 0) or 0
-                }
-            elif isinstance(company_result, list) and len(company_result) > 0:
-                data = company_result[0]
-                company_summary = {
-                    "total_employees": data.get('total_employees', 0) or 0,
-                    "checked_in_today": data.get('checked_in_today', 0) or 0,
-                    "active_projects": data.get('active_projects', 0) or 0,
-                    "overdue_tasks": data.get('overdue_tasks', 0) or 0,
-                    "overdue_projects": data.get('overdue_projects', 0) or 0
-                }
-            else:
-                # Fallback - query từng thứ riêng
-                try:
-                    total_sql = "SELECT COUNT(*) as cnt FROM nhanvien WHERE trang_thai_lam_viec LIKE '%Đang%' OR trang_thai_lam_viec IS NULL"
-                    total_res = execute_sql_api(total_sql)
-                    total_emp = (total_res[0].get('cnt', 0) if isinstance(total_res, list) else 
-                                total_res.get('data', [{}])[0].get('cnt', 0)) if total_res else 0
-                    
-                    checkin_sql = "SELECT COUNT(DISTINCT nhan_vien_id) as cnt FROM cham_cong WHERE DATE(ngay) = CURDATE()"
-                    checkin_res = execute_sql_api(checkin_sql)
-                    checked_in = (checkin_res[0].get('cnt', 0) if isinstance(checkin_res, list) else 
-                                 checkin_res.get('data', [{}])[0].get('cnt', 0)) if checkin_res else 0
-                    
-                    company_summary = {
-                        "total_employees": total_emp or 0,
-                        "checked_in_today": checked_in or 0,
-                        "active_projects": 0,
-                        "overdue_tasks": 0,
-                        "overdue_projects": 0
-                    }
-                except:
-                    company_summary = {
-                        "total_employees": 0,
-                        "checked_in_today": 0,
-                        "active_projects": 0,
-                        "overdue_tasks": 0,
-                        "overdue_projects": 0
-                    }
+            # Check-in hôm nay và công việc trễ hạn lấy từ bộ đếm trong bộ nhớ
+            counters_ready = ensure_live_counters()
+            company_summary = {
+                "total_employees": data.get('total_employees', 0) or 0,
+                "checked_in_today": live_counters.checked_in() if counters_ready else 0,
+                "active_projects": data.get('active_projects', 0) or 0,
+                "overdue_tasks": live_counters.tasks()["overdue"] if counters_ready else 0,
+                "overdue_projects": data.get('overdue_projects', 0) or 0
+            }
             
             print(f"[BRIEFING ADMIN] Final company_summary: {company_summary}")
             
@@ -595,6 +832,11 @@ class LeaveApproveRequest(BaseModel):
     admin_id: int
     approved: bool
 
+class LeaveBulkApproveRequest(BaseModel):
+    request_ids: List[int]
+    admin_id: int
+    approved: bool
+
 class TaskAssignRequest(BaseModel):
     ten_cong_viec: str
     mo_ta: str = ""
@@ -604,48 +846,144 @@ class TaskAssignRequest(BaseModel):
     han_hoan_thanh: str  # YYYY-MM-DD
     muc_do_uu_tien: str = "Trung bình"
 
+class BulkTaskAssignRequest(BaseModel):
+    tasks: List[TaskAssignRequest]  # Nhiều công việc một lần (vd: import sprint)
+
+# --- Write-behind queue cho các endpoint ghi ---
+LEAVE_STATUS = {True: "Đã duyệt", False: "Từ chối"}
+
+def execute_write(sql: str) -> list:
+    """Chạy câu lệnh ghi; HRM từ chối -> Rejected (không thử lại), lỗi kết nối -> RuntimeError (thử lại)."""
+    raw = execute_sql_api(sql)
+    rows, error = raw_rows(raw)
+    if error is None:
+        return rows
+    if rejected(raw):
+        raise Rejected(error)
+    raise RuntimeError(error)
+
+def write_leave_requests(payloads: List[Dict]) -> List[None]:
+    """
+    Một câu INSERT ... SELECT cho cả lô đơn nghỉ phép.
+    Bỏ qua dòng đã có đơn cùng nhân viên / khoảng ngày chưa bị từ chối: gửi lại sau khi hết giờ chờ
+    (lần trước thực ra đã ghi) không sinh đơn trùng; đơn trùng khoảng thật đã bị chặn ở leave_index.
+    """
+    values = "\n        UNION ALL ".join(
+        f"SELECT {int(p['nhanvien_id'])} AS nhanvien_id, '{sql_str(p['tu_ngay'])}' AS tu_ngay, "
+        f"'{sql_str(p['den_ngay'])}' AS den_ngay, N'{sql_str(p['ly_do'])}' AS ly_do"
+        for p in payloads
+    )
+    sql = f"""
+    INSERT INTO don_nghi_phep (nhanvien_id, tu_ngay, den_ngay, ly_do, trang_thai, ngay_tao)
+    SELECT v.nhanvien_id, v.tu_ngay, v.den_ngay, v.ly_do, N'Chờ duyệt', NOW()
+    FROM (
+        {values}
+    ) AS v
+    WHERE NOT EXISTS (
+        SELECT 1 FROM don_nghi_phep d
+        WHERE d.nhanvien_id = v.nhanvien_id AND d.tu_ngay = v.tu_ngay AND d.den_ngay = v.den_ngay
+          AND d.trang_thai NOT IN (N'Từ chối', 'tu_choi')
+    )
+    """
+    execute_write(sql)
+    briefing_cache.invalidate_users({int(p['nhanvien_id']) for p in payloads})
+    return [None] * len(payloads)
+
+def write_leave_approvals(payloads: List[Dict]) -> List[Dict]:
+    """Một câu UPDATE (CASE theo id) cho cả lô duyệt / từ chối."""
+    cases = " ".join(f"WHEN {int(p['request_id'])} THEN N'{LEAVE_STATUS[bool(p['approved'])]}'" for p in payloads)
+    ids = ", ".join(str(int(p['request_id'])) for p in payloads)
+    sql = f"""
+    UPDATE don_nghi_phep
+    SET trang_thai = CASE id {cases} END
+    WHERE id IN ({ids})
+    """
+    execute_write(sql)
+    dashboard_hub.publish_all()
+    return [{"trang_thai": LEAVE_STATUS[bool(p['approved'])]} for p in payloads]
+
+def write_task_assignments(payloads: List[Dict]) -> List[Dict]:
+    """Cả lô giao việc trong một batch transactional (assign_tasks_batch), gửi lại không tạo việc trùng."""
+    ids = assign_tasks_batch([TaskAssignRequest(**p) for p in payloads], dedupe_hours=WRITE_QUEUE_DEDUPE_HOURS)
+    return [{"cong_viec_id": cv_id} for cv_id in ids]
+
+# Ghi được xác nhận ngay khi đã vào log cục bộ; gửi HRM theo lô ở job nền "write-queue"
+write_queue = WriteQueue(
+    WRITE_QUEUE_LOG_PATH,
+    {
+        "leave_request": write_leave_requests,
+        "leave_approve": write_leave_approvals,
+        "assign_task": write_task_assignments,
+    },
+    batch_size=WRITE_QUEUE_BATCH_SIZE,
+    max_attempts=WRITE_QUEUE_MAX_ATTEMPTS,
+    transient=(CircuitOpen, Overloaded),
+)
+
+def track_leave_request_write(item: Dict):
+    """Đơn đã ghi xuống HRM -> giữ chỗ tới lần nạp chỉ mục sau; HRM từ chối -> bỏ giữ chỗ."""
+    if item["kind"] != "leave_request":
+        return
+    if item["status"] == DONE:
+        leave_index.mark_written(item["id"])
+    elif item["status"] == FAILED:
+        leave_index.release(item["id"])
+
+write_queue.subscribe(track_leave_request_write)
+# Khởi động lại: đơn còn trong hàng đợi giữ chỗ lại theo write id
+for _write_id, _payload in write_queue.pending_by_id("leave_request").items():
+    leave_index.hold(_write_id, _payload['nhanvien_id'], _payload['tu_ngay'], _payload['den_ngay'])
+
+def queued_response(item: Dict, message: str, **extra) -> JSONResponse:
+    """202: đã ghi nhận; trạng thái gửi HRM tra ở GET /writes/{write_id}."""
+    return JSONResponse(status_code=202, content={
+        "success": True,
+        "queued": True,
+        "write_id": item["id"],
+        "status": item["status"],
+        "message": message,
+        **extra
+    })
+
 # --- Leave Request Endpoint ---
 @app.post("/leave-request")
-async def create_leave_request(req: LeaveRequestCreate):
+def create_leave_request(req: LeaveRequestCreate):
     """
     Tạo đơn xin nghỉ phép mới.
     Chỉ dành cho Employee và Manager.
+    Trùng khoảng với đơn đã duyệt / chờ duyệt hoặc vượt số ngày phép còn lại -> 422.
     """
+    # Kiểm tra trên chỉ mục trong bộ nhớ và giữ chỗ khoảng nghỉ ngay (đơn gửi sau thấy được);
+    # khóa giữ chỗ là write id (sinh trước khi xếp hàng) để gỡ được khi lượt ghi thất bại
+    write_id = uuid.uuid4().hex
+    if ensure_leave_index():
+        reason = leave_index.reserve(write_id, req.nhanvien_id, req.tu_ngay, req.den_ngay)
+        if reason:
+            print(f"[LEAVE REQUEST] Từ chối NhanVien {req.nhanvien_id}: {reason}")
+            raise HTTPException(status_code=422, detail=reason)
+    else:
+        print("[LEAVE REQUEST] Chỉ mục nghỉ phép chưa sẵn sàng, bỏ qua kiểm tra trùng / số ngày phép")
+        leave_index.hold(write_id, req.nhanvien_id, req.tu_ngay, req.den_ngay)
+    
     try:
         print(f"\n[LEAVE REQUEST] NhanVien: {req.nhanvien_id}")
         print(f"[LEAVE REQUEST] Từ: {req.tu_ngay} -> Đến: {req.den_ngay}")
         print(f"[LEAVE REQUEST] Lý do: {req.ly_do}")
         
-        # Tạo SQL insert
-        sql = f"""
-        INSERT INTO don_nghi_phep (nhanvien_id, tu_ngay, den_ngay, ly_do, trang_thai, ngay_tao)
-        VALUES ({req.nhanvien_id}, '{req.tu_ngay}', '{req.den_ngay}', N'{req.ly_do}', N'Chờ duyệt', NOW())
-        """
-        
-        result = execute_sql_api(sql)
-        print(f"[LEAVE REQUEST] Result: {result}")
+        item = write_queue.enqueue("leave_request", {
+            "nhanvien_id": req.nhanvien_id,
+            "tu_ngay": req.tu_ngay,
+            "den_ngay": req.den_ngay,
+            "ly_do": req.ly_do,
+        }, item_id=write_id)
+        print(f"[LEAVE REQUEST] Đã xếp hàng ghi: {item['id']}")
         
-        # Demo mode fallback
-        if isinstance(result, str) and "Lỗi" in result:
-            return {
-                "success": True,
-                "message": "Đơn nghỉ phép đã được gửi thành công (Demo)",
-                "demo_mode": True
-            }
-        
-        return {
-            "success": True,
-            "message": "Đơn nghỉ phép đã được gửi thành công",
-            "demo_mode": False
-        }
+        return queued_response(item, "Đơn nghỉ phép đã được gửi thành công", demo_mode=False)
         
     except Exception as e:
         print(f"[LEAVE REQUEST ERROR]: {e}")
-        return {
-            "success": True,  # Return success for demo mode
-            "message": "Đơn nghỉ phép đã được gửi (Demo mode)",
-            "demo_mode": True
-        }
+        leave_index.release(write_id)
+        raise HTTPException(status_code=500, detail="Không gửi được đơn nghỉ phép, vui lòng thử lại sau")
 
 # ==========================================================
 # 7. ADMIN ANALYTICS DASHBOARD ENDPOINT
@@ -660,9 +998,16 @@ class AnalyticsResponse(BaseModel):
     department_stats: List[Dict[str, Any]]
     hourlyData: List[Dict[str, Any]]
     timestamp: str
+    snapshot_only: List[str] = []
+
+# Bảng xếp hạng / sức khỏe dự án... chỉ tính lúc tải dashboard, luồng SSE không cập nhật
+ADMIN_SNAPSHOT_ONLY = ["top_employees", "employee_workload", "project_health", "department_stats", "hourlyData"]
+
+def completion_rate(completed: int, total: int) -> float:
+    return round((completed / total * 100), 1) if total > 0 else 0
 
 @app.get("/admin/analytics", response_model=AnalyticsResponse)
-async def get_admin_analytics():
+def get_admin_analytics():
     """
     API lấy dữ liệu thống kê cho Admin Dashboard
     Trả về: totalEmployees, checkedInToday, totalTasks, completedTasks, overdueTasks, activeProjects
@@ -672,19 +1017,24 @@ async def get_admin_analytics():
         stats_sql = """
         SELECT
             (SELECT COUNT(*) FROM nhanvien WHERE trang_thai_lam_viec = 'Đang làm') as total_employees,
-            (SELECT COUNT(DISTINCT nhan_vien_id) FROM cham_cong WHERE DATE(ngay) = CURDATE() AND check_in IS NOT NULL) as checked_in_today,
-            (SELECT COUNT(*) FROM cong_viec) as total_tasks,
-            (SELECT COUNT(*) FROM cong_viec WHERE trang_thai = 'Đã hoàn thành') as completed_tasks,
-            (SELECT COUNT(*) FROM cong_viec WHERE trang_thai != 'Đã hoàn thành' AND han_hoan_thanh < CURDATE()) as overdue_tasks,
             (SELECT COUNT(*) FROM du_an WHERE trang_thai_duan = 'Đang thực hiện') as active_projects
         """
-        stats_result = execute_sql_api(stats_sql)
-        stats = stats_result['data'][0] if isinstance(stats_result, dict) and stats_result.get('data') else {}
+        stats = query_hrm_read(stats_sql).first() or {}
+        
+        # Check-in hôm nay và số liệu công việc: đọc từ bộ đếm trong bộ nhớ
+        if ensure_live_counters():
+            task_counts = live_counters.tasks()
+            stats.update({
+                "checked_in_today": live_counters.checked_in(),
+                "total_tasks": task_counts["total"],
+                "completed_tasks": task_counts["completed"],
+                "overdue_tasks": task_counts["overdue"]
+            })
 
         # 2. Tỉ Lệ Hoàn Thành Task (%)
         total_tasks = stats.get('total_tasks', 0)
         completed_tasks = stats.get('completed_tasks', 0)
-        task_completion_rate = round((completed_tasks / total_tasks * 100), 1) if total_tasks > 0 else 0
+        task_completion_rate = completion_rate(completed_tasks, total_tasks)
 
         # 3. Top 5 Nhân Viên Xuất Sắc (hoàn thành nhiều task nhất)
         top_employees_sql = """
@@ -701,8 +1051,7 @@ async def get_admin_analytics():
         ORDER BY completed_tasks DESC
         LIMIT 5;
         """
-        top_employees_result = execute_sql_api(top_employees_sql)
-        top_employees = top_employees_result['data'] if isinstance(top_employees_result, dict) and top_employees_result.get('data') else []
+        top_employees = query_hrm_read(top_employees_sql).dicts()
 
         # 4. Workload Per Employee (số task đang active)
         employee_workload_sql = """
@@ -717,8 +1066,7 @@ async def get_admin_analytics():
         GROUP BY nv.ho_ten, pb.ten_phong
         ORDER BY active_tasks DESC;
         """
-        employee_workload_result = execute_sql_api(employee_workload_sql)
-        employee_workload = employee_workload_result['data'] if isinstance(employee_workload_result, dict) and employee_workload_result.get('data') else []
+        employee_workload = query_hrm_read(employee_workload_sql).dicts()
 
         # 5. Projects Health Status
         project_health_sql = """
@@ -736,8 +1084,7 @@ async def get_admin_analytics():
         FROM du_an
         WHERE trang_thai_duan != 'Tạm ngưng';
         """
-        project_health_result = execute_sql_api(project_health_sql)
-        project_health = project_health_result['data'] if isinstance(project_health_result, dict) and project_health_result.get('data') else []
+        project_health = query_hrm_read(project_health_sql).dicts()
 
         # 6. Department Statistics
         department_stats_sql = """
@@ -753,8 +1100,7 @@ async def get_admin_analytics():
         GROUP BY pb.ten_phong
         ORDER BY number_of_employees DESC;
         """
-        department_stats_result = execute_sql_api(department_stats_sql)
-        department_stats = department_stats_result['data'] if isinstance(department_stats_result, dict) and department_stats_result.get('data') else []
+        department_stats = query_hrm_read(department_stats_sql).dicts()
 
         # 7. Dữ liệu chấm công theo giờ (giữ lại từ code cũ)
         hourly_sql = """
@@ -766,8 +1112,7 @@ async def get_admin_analytics():
         GROUP BY hour
         ORDER BY hour;
         """
-        hourly_result = execute_sql_api(hourly_sql)
-        hourly_data = hourly_result['data'] if isinstance(hourly_result, dict) and hourly_result.get('data') else []
+        hourly_data = query_hrm_read(hourly_sql).dicts()
 
 
         return {
@@ -778,19 +1123,25 @@ async def get_admin_analytics():
             "project_health": project_health,
             "department_stats": department_stats,
             "hourlyData": hourly_data,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now().isoformat(),
+            "snapshot_only": ADMIN_SNAPSHOT_ONLY
         }
 
+    except (Overloaded, CircuitOpen):
+        raise
     except Exception as e:
         print(f"[ADMIN ANALYTICS ERROR]: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=503, detail=str(e))
 
 
 # ==========================================================
 # 7B. MANAGER ANALYTICS DASHBOARD ENDPOINT
 # ==========================================================
+# Số nhân viên đang làm của phòng (lần tải dashboard gần nhất): mẫu số % check-in cho delta SSE
+dept_headcount: Dict[int, int] = {}
+
 @app.get("/manager/analytics")
-async def get_manager_analytics(user_id: int, dept_id: int):
+def get_manager_analytics(user_id: int, dept_id: int):
     """
     API lấy dữ liệu thống kê cho Manager Dashboard (chỉ dữ liệu phòng ban)
     Trả về: totalEmployees, checkedInToday, totalTasks, completedTasks, overdueTasks, activeProjects
@@ -798,88 +1149,25 @@ async def get_manager_analytics(user_id: int, dept_id: int):
     try:
         # 1. Tổng số nhân viên trong phòng
         total_emp_sql = f"SELECT COUNT(*) as cnt FROM nhanvien WHERE phong_ban_id = {dept_id} AND trang_thai_lam_viec = 'Đang làm'"
-        total_emp_result = execute_sql_api(total_emp_sql)
-        total_employees = 0
-        if isinstance(total_emp_result, dict) and total_emp_result.get('data'):
-            total_employees = total_emp_result['data'][0].get('cnt', 0)
-        elif isinstance(total_emp_result, list) and len(total_emp_result) > 0:
-            total_employees = total_emp_result[0].get('cnt', 0)
-        
-        # 2. Check-in hôm nay (chỉ nhân viên trong phòng)
-        checkin_sql = f"""
-        SELECT COUNT(DISTINCT c.nhan_vien_id) as cnt 
-        FROM cham_cong c
-        JOIN nhanvien nv ON c.nhan_vien_id = nv.id
-        WHERE DATE(c.ngay) = CURDATE() AND c.check_in IS NOT NULL AND nv.phong_ban_id = {dept_id}
-        """
-        checkin_result = execute_sql_api(checkin_sql)
-        checked_in_today = 0
+        total_employees = query_hrm_read(total_emp_sql).scalar('cnt', 0)
+        dept_headcount[dept_id] = total_employees
         
-        try:
-            if isinstance(checkin_result, dict) and checkin_result.get('data'):
-                data_list = checkin_result['data']
-                if isinstance(data_list, list) and len(data_list) > 0:
-                    checked_in_today = int(data_list[0].get('cnt', 0) or 0)
-            elif isinstance(checkin_result, list) and len(checkin_result) > 0:
-                checked_in_today = int(checkin_result[0].get('cnt', 0) or 0)
-        except Exception as e:
-            print(f"[MANAGER ANALYTICS ERROR] Parsing checkin: {e}")
-            checked_in_today = 0
-        
-        # 3. Công việc (chỉ nhân viên trong phòng)
-        task_sql = f"""
-        SELECT 
-            COUNT(DISTINCT CASE WHEN cv.trang_thai = 'Đã hoàn thành' THEN cv.id END) as completed,
-            COUNT(DISTINCT CASE WHEN cv.trang_thai != 'Đã hoàn thành' AND cv.han_hoan_thanh < CURDATE() THEN cv.id END) as overdue,
-            COUNT(DISTINCT cv.id) as total
-        FROM cong_viec cv
-        JOIN cong_viec_nguoi_nhan cvnn ON cv.id = cvnn.cong_viec_id
-        JOIN nhanvien nv ON cvnn.nhan_vien_id = nv.id
-        WHERE nv.phong_ban_id = {dept_id}
-        """
-        task_result = execute_sql_api(task_sql)
+        # 2 + 3. Check-in hôm nay và công việc (chỉ nhân viên trong phòng) - đọc từ bộ đếm
+        checked_in_today = 0
         total_tasks = 0
         completed_tasks = 0
         overdue_tasks = 0
-        
-        if isinstance(task_result, dict) and task_result.get('data'):
-            data = task_result['data'][0]
-            total_tasks = data.get('total', 0)
-            completed_tasks = data.get('completed', 0)
-            overdue_tasks = data.get('overdue', 0)
-        elif isinstance(task_result, list) and len(task_result) > 0:
-            data = task_result[0]
-            total_tasks = data.get('total', 0)
-            completed_tasks = data.get('completed', 0)
-            overdue_tasks = data.get('overdue', 0)
-        
-        # 4. Dự án (chỉ dự án của phòng)
-        dept_name_sql = f"SELECT ten_phong FROM phong_ban WHERE id = {dept_id}"
-        dept_name_result = execute_sql_api(dept_name_sql)
-        dept_name = ""
-        if isinstance(dept_name_result, dict) and dept_name_result.get('data'):
-            dept_name = dept_name_result['data'][0].get('ten_phong', '')
-        elif isinstance(dept_name_result, list) and len(dept_name_result) > 0:
-            dept_name = dept_name_result[0].get('ten_phong', '')
-        
-        project_sql = f"""
-        SELECT COUNT(*) as cnt 
-        FROM du_an 
-        WHERE trang_thai_duan = 'Đang thực hiện' AND phong_ban LIKE '%{dept_name}%'
-        """
-        project_result = execute_sql_api(project_sql)
+        if ensure_live_counters():
+            checked_in_today = live_counters.checked_in(dept_id)
+            task_counts = live_counters.tasks(dept_id)
+            total_tasks = task_counts["total"]
+            completed_tasks = task_counts["completed"]
+            overdue_tasks = task_counts["overdue"]
+        
+        # 4. Dự án (chỉ dự án của phòng) - tra chỉ mục, không truy vấn HRM
         active_projects = 0
-        
-        try:
-            if isinstance(project_result, dict) and project_result.get('data'):
-                data_list = project_result['data']
-                if isinstance(data_list, list) and len(data_list) > 0:
-                    active_projects = int(data_list[0].get('cnt', 0) or 0)
-            elif isinstance(project_result, list) and len(project_result) > 0:
-                active_projects = int(project_result[0].get('cnt', 0) or 0)
-        except Exception as e:
-            print(f"[MANAGER ANALYTICS ERROR] Parsing project: {e}")
-            active_projects = 0
+        if ensure_dept_project_index():
+            active_projects = dept_project_index.project_stats(dept_id)["active_projects"]
         
         # 5. Tính % Check-in và Hoàn thành
         checked_in_percent = round((checked_in_today / total_employees * 100) if total_employees > 0 else 0)
@@ -895,12 +1183,16 @@ async def get_manager_analytics(user_id: int, dept_id: int):
                 "overdueTasks": overdue_tasks,
                 "activeProjects": active_projects
             },
+            "task_completion_rate": completed_percent,
             "timestamp": datetime.now().isoformat()
         }
     
+    except (Overloaded, CircuitOpen):
+        raise
     except Exception as e:
         print(f"[MANAGER ANALYTICS ERROR]: {e}")
-        return {
+        # 503: middleware thay bằng số liệu thành công gần nhất nếu có
+        return JSONResponse(status_code=503, content={
             "error": str(e),
             "stats": {
                 "totalEmployees": 0,
@@ -911,21 +1203,115 @@ async def get_manager_analytics(user_id: int, dept_id: int):
                 "overdueTasks": 0,
                 "activeProjects": 0
             }
+        })
+
+# ==========================================================
+# 7C. LIVE DASHBOARD STREAM (SSE)
+# ==========================================================
+def dashboard_snapshot(scope: str) -> Dict:
+    """
+    Số liệu realtime cho dashboard, lấy hoàn toàn từ bộ nhớ (cùng key với endpoint analytics).
+    Trường dẫn xuất (tỉ lệ hoàn thành, % check-in) tính lại cùng lúc nên delta luôn khớp với số đếm;
+    snapshot_only: các bảng chỉ có trong lần tải dashboard, luồng này không cập nhật.
+    """
+    if scope == "company":
+        task_counts = live_counters.tasks()
+        return {
+            "checked_in_today": live_counters.checked_in(),
+            "on_leave_today": live_counters.on_leave(),
+            "total_tasks": task_counts["total"],
+            "completed_tasks": task_counts["completed"],
+            "overdue_tasks": task_counts["overdue"],
+            "task_completion_rate": completion_rate(task_counts["completed"], task_counts["total"]),
+            "snapshot_only": ADMIN_SNAPSHOT_ONLY
         }
+    
+    dept_id = int(scope[5:])
+    task_counts = live_counters.tasks(dept_id)
+    checked_in = live_counters.checked_in(dept_id)
+    total_employees = dept_headcount.get(dept_id) or live_counters.employees(dept_id)
+    return {
+        "checkedInToday": checked_in,
+        "checkedInPercent": round((checked_in / total_employees * 100) if total_employees > 0 else 0),
+        "onLeaveToday": live_counters.on_leave(dept_id),
+        "totalTasks": task_counts["total"],
+        "completedTasks": task_counts["completed"],
+        "overdueTasks": task_counts["overdue"],
+        "task_completion_rate": round((task_counts["completed"] / task_counts["total"] * 100)
+                                      if task_counts["total"] > 0 else 0),
+        "activeProjects": dept_project_index.project_stats(dept_id)["active_projects"]
+    }
+
+dashboard_hub = DashboardHub(dashboard_snapshot, heartbeat_seconds=DASHBOARD_HEARTBEAT_SECONDS)
+
+def tick_live_counters():
+    """Job nền: đọc thay đổi vào bộ đếm rồi đẩy delta cho các dashboard đang mở."""
+    live_counters.tick()
+    dashboard_hub.publish_all()
+
+@app.get("/analytics/stream")
+async def stream_analytics(role: str = "admin", dept_id: Union[int, None] = None):
+    """
+    Server-Sent Events cho dashboard: gửi snapshot ban đầu, sau đó chỉ gửi delta
+    khi số liệu thay đổi, cùng heartbeat định kỳ để giữ kết nối.
+    Admin: scope toàn công ty. Manager: scope phòng ban (dept_id).
+    """
+    if role == "manager":
+        if not dept_id:
+            raise HTTPException(status_code=400, detail="Thiếu dept_id cho manager")
+        scope = f"dept:{dept_id}"
+    else:
+        scope = "company"
+    
+    ensure_live_counters()
+    ensure_dept_project_index()
+    
+    return StreamingResponse(
+        dashboard_hub.stream(scope),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # --- Get Leave Requests Endpoint (for Admin) ---
+LEAVE_FILTERS = {"pending": "Chờ duyệt", "approved": "Đã duyệt", "rejected": "Từ chối", "all": None}
+LEAVE_PAGE_MAX = 200
+
+def encode_leave_cursor(row: Dict) -> str:
+    """Cursor keyset (ngay_tao, id) của dòng cuối trang, dạng chuỗi mờ cho client."""
+    raw = f"{row.get('ngay_tao')}|{int(row['id'])}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_leave_cursor(cursor: str) -> tuple:
+    try:
+        ngay_tao, row_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rsplit("|", 1)
+        return ngay_tao, int(row_id)
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ")
+
 @app.get("/leave-requests")
-async def get_leave_requests(status: str = "pending"):
+def get_leave_requests(status: str = "pending", phong_ban_id: Union[int, None] = None,
+                       cursor: Union[str, None] = None, limit: int = 50):
     """
-    Lấy danh sách đơn nghỉ phép.
+    Lấy danh sách đơn nghỉ phép, mới nhất trước, phân trang keyset trên (ngay_tao, id).
     Chỉ dành cho Admin.
+    - status: pending / approved / rejected / all; phong_ban_id: lọc theo phòng ban
+    - cursor: next_cursor của trang trước (không dùng OFFSET nên trang sâu vẫn nhanh)
     """
+    if status not in LEAVE_FILTERS:
+        raise HTTPException(status_code=400, detail=f"status phải là một trong {', '.join(LEAVE_FILTERS)}")
+    limit = max(1, min(limit, LEAVE_PAGE_MAX))
     try:
-        if status == "pending":
-            condition = "dnp.trang_thai = N'Chờ duyệt'"
-        else:
-            condition = "1=1"
-        
+        conditions = []
+        if LEAVE_FILTERS[status]:
+            conditions.append(f"dnp.trang_thai = N'{LEAVE_FILTERS[status]}'")
+        if phong_ban_id is not None:
+            conditions.append(f"nv.phong_ban_id = {int(phong_ban_id)}")
+        if cursor:
+            ngay_tao, last_id = decode_leave_cursor(cursor)
+            ngay_tao = sql_str(ngay_tao)
+            conditions.append(f"(dnp.ngay_tao < '{ngay_tao}' OR (dnp.ngay_tao = '{ngay_tao}' AND dnp.id < {last_id}))")
+        
+        # Lấy dư một dòng để biết còn trang sau
         sql = f"""
         SELECT 
             dnp.id,
@@ -941,247 +1327,361 @@ async def get_leave_requests(status: str = "pending"):
         FROM don_nghi_phep dnp
         JOIN nhanvien nv ON dnp.nhanvien_id = nv.id
         LEFT JOIN phong_ban pb ON nv.phong_ban_id = pb.id
-        WHERE {condition}
-        ORDER BY dnp.ngay_tao DESC
+        WHERE {" AND ".join(conditions) or "1=1"}
+        ORDER BY dnp.ngay_tao DESC, dnp.id DESC
+        LIMIT {limit + 1}
         """
         
-        result = execute_sql_api(sql)
+        result = query_hrm(sql)
+        if not result.ok:
+            raise RuntimeError(result.error)
+        rows = result.dicts()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
         
-        requests = []
-        if isinstance(result, dict) and result.get('data'):
-            requests = result['data']
-        elif isinstance(result, list):
-            requests = result
+        # Quyết định duyệt còn trong hàng đợi ghi: hiện trạng thái mới, đánh dấu chưa ghi xong
+        queued = {int(p['request_id']): LEAVE_STATUS[bool(p['approved'])] for p in write_queue.pending("leave_approve")}
+        for row in rows:
+            if row.get('id') in queued:
+                row['trang_thai'] = queued[row['id']]
+                row['pending_write'] = True
         
         return {
             "success": True,
-            "requests": requests
+            "requests": rows,
+            "has_more": has_more,
+            "next_cursor": encode_leave_cursor(rows[-1]) if has_more else None
         }
         
+    except (Overloaded, CircuitOpen, HTTPException):
+        raise
     except Exception as e:
         print(f"[GET LEAVE REQUESTS ERROR]: {e}")
-        # Demo data
-        return {
-            "success": True,
-            "requests": [
-                {
-                    "id": 1,
-                    "nhan_vien_id": 3,
-                    "ho_ten": "Lê Văn Cường",
-                    "phong_ban": "Phòng Kỹ thuật",
-                    "tu_ngay": "2026-02-05",
-                    "den_ngay": "2026-02-07",
-                    "so_ngay": 3,
-                    "ly_do": "Về quê có việc gia đình",
-                    "trang_thai": "Chờ duyệt",
-                    "ngay_tao": "2026-02-01"
-                },
-                {
-                    "id": 2,
-                    "nhan_vien_id": 4,
-                    "ho_ten": "Phạm Thị Dung",
-                    "phong_ban": "Phòng Kinh doanh",
-                    "tu_ngay": "2026-02-10",
-                    "den_ngay": "2026-02-12",
-                    "so_ngay": 3,
-                    "ly_do": "Khám sức khỏe định kỳ",
-                    "trang_thai": "Chờ duyệt",
-                    "ngay_tao": "2026-02-01"
-                }
-            ]
-        }
+        # 503: middleware thay bằng danh sách thành công gần nhất nếu có
+        return JSONResponse(status_code=503, content={"success": False, "requests": [], "message": str(e)})
 
 # --- Leave Approval Endpoint ---
 @app.post("/leave-approve")
-async def approve_leave_request(req: LeaveApproveRequest):
+def approve_leave_request(req: LeaveApproveRequest):
     """
     Duyệt hoặc từ chối đơn nghỉ phép.
     Chỉ dành cho Admin.
     """
     try:
-        new_status = "Đã duyệt" if req.approved else "Từ chối"
+        new_status = LEAVE_STATUS[req.approved]
         
         print(f"\n[LEAVE APPROVE] Request: {req.request_id}")
         print(f"[LEAVE APPROVE] Admin: {req.admin_id}")
         print(f"[LEAVE APPROVE] Status: {new_status}")
         
-        sql = f"""
-        UPDATE don_nghi_phep 
-        SET trang_thai = N'{new_status}'
-        WHERE id = {req.request_id}
-        """
+        # Duyệt lại cùng một đơn trước khi gửi -> chỉ quyết định cuối được ghi
+        item = write_queue.enqueue("leave_approve", {
+            "request_id": req.request_id,
+            "admin_id": req.admin_id,
+            "approved": req.approved,
+        }, coalesce_key=f"leave_approve:{req.request_id}")
         
-        result = execute_sql_api(sql)
+        leave_index.set_status(req.request_id, req.approved)
         
-        return {
-            "success": True,
-            "message": f"Đơn đã được {new_status.lower()}"
-        }
+        return queued_response(item, f"Đơn đã được {new_status.lower()}")
         
     except Exception as e:
         print(f"[LEAVE APPROVE ERROR]: {e}")
-        return {
-            "success": True,
-            "message": f"Đơn đã được xử lý (Demo mode)"
-        }
+        raise HTTPException(status_code=500, detail="Không xử lý được đơn nghỉ phép, vui lòng thử lại sau")
+
+@app.post("/leave-approve/bulk")
+def approve_leave_requests_bulk(req: LeaveBulkApproveRequest):
+    """
+    Duyệt hoặc từ chối nhiều đơn nghỉ phép một lần.
+    Chỉ dành cho Admin. Cả danh sách vào hàng đợi ghi với một lần ghi log,
+    rồi được gửi HRM bằng một câu UPDATE theo lô.
+    """
+    request_ids = list(dict.fromkeys(req.request_ids))
+    if not request_ids:
+        raise HTTPException(status_code=400, detail="Danh sách đơn trống")
+    new_status = LEAVE_STATUS[req.approved]
+    print(f"\n[LEAVE APPROVE BULK] Admin: {req.admin_id}, {len(request_ids)} đơn -> {new_status}")
+    
+    try:
+        items = write_queue.enqueue_many(
+            "leave_approve",
+            [{"request_id": rid, "admin_id": req.admin_id, "approved": req.approved} for rid in request_ids],
+            [f"leave_approve:{rid}" for rid in request_ids]
+        )
+        for rid in request_ids:
+            leave_index.set_status(rid, req.approved)
+    except Exception as e:
+        print(f"[LEAVE APPROVE BULK ERROR]: {e}")
+        raise HTTPException(status_code=500, detail="Không xử lý được danh sách đơn, vui lòng thử lại sau")
+    
+    return JSONResponse(status_code=202, content={
+        "success": True,
+        "queued": True,
+        "message": f"{len(items)} đơn đã được {new_status.lower()}",
+        "write_ids": {rid: item["id"] for rid, item in zip(request_ids, items)}
+    })
+
+# --- Reference data (nhân viên / dự án) ---
+def load_employees(scope: str) -> list:
+    """Nạp danh sách nhân viên đang làm việc cho scope 'company' hoặc 'dept:<id>'."""
+    if scope.startswith("dept:"):
+        condition = f"nv.phong_ban_id = {int(scope[5:])}"
+    else:
+        condition = "1=1"
+    
+    sql = f"""
+    SELECT 
+        nv.id,
+        nv.ho_ten,
+        pb.ten_phong as phong_ban,
+        nv.chuc_vu
+    FROM nhanvien nv
+    LEFT JOIN phong_ban pb ON nv.phong_ban_id = pb.id
+    WHERE {condition}
+    AND nv.trang_thai_lam_viec = N'Đang làm việc'
+    ORDER BY nv.ho_ten
+    """
+    result = query_hrm(sql)
+    if not result.ok:
+        raise RuntimeError(result.error)
+    return result.dicts()
+
+def load_projects(scope: str) -> list:
+    """Nạp danh sách dự án chưa hoàn thành (hiện chỉ có scope 'company')."""
+    sql = """
+    SELECT id, ten_du_an, trang_thai_duan as trang_thai
+    FROM du_an
+    WHERE trang_thai_duan NOT LIKE N'%Hoàn thành%'
+    ORDER BY ten_du_an
+    """
+    result = query_hrm(sql)
+    if not result.ok:
+        raise RuntimeError(result.error)
+    return result.dicts()
+
+reference_cache = ReferenceCache(
+    {"employees": load_employees, "projects": load_projects},
+    max_age=REFERENCE_CACHE_MAX_AGE_SECONDS
+)
+
+def reference_response(request: Request, entry: Dict, key: str, stale: bool = False) -> Response:
+    """Trả 304 nếu client đã có đúng version (If-None-Match), ngược lại trả JSON kèm ETag."""
+    headers = {"ETag": entry["etag"], "Cache-Control": "private, no-cache"}
+    if stale:
+        headers["X-Served-Stale"] = "1"
+        headers["Age"] = str(int(time.time() - entry["loaded_at"]))
+    if request.headers.get("if-none-match") == entry["etag"]:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse({"success": True, key: entry["data"]}, headers=headers)
 
 # --- Get Employees for Task Assignment ---
 @app.get("/employees")
-async def get_employees(role: str = "admin", phong_ban_id: str = ""):
+def get_employees(request: Request, role: str = "admin", phong_ban_id: str = ""):
     """
     Lấy danh sách nhân viên để giao việc.
     Manager: chỉ lấy nhân viên trong phòng
     Admin: lấy tất cả
+    Hỗ trợ ETag / If-None-Match (304 khi danh sách không đổi).
     """
     try:
         if role == "manager" and phong_ban_id:
-            condition = f"nv.phong_ban_id = {phong_ban_id}"
+            scope = f"dept:{int(phong_ban_id)}"
         else:
-            condition = "1=1"
-        
-        sql = f"""
-        SELECT 
-            nv.id,
-            nv.ho_ten,
-            pb.ten_phong as phong_ban,
-            nv.chuc_vu
-        FROM nhanvien nv
-        LEFT JOIN phong_ban pb ON nv.phong_ban_id = pb.id
-        WHERE {condition}
-        AND nv.trang_thai_lam_viec = N'Đang làm việc'
-        ORDER BY nv.ho_ten
-        """
+            scope = "company"
         
-        result = execute_sql_api(sql)
-        
-        employees = []
-        if isinstance(result, dict) and result.get('data'):
-            employees = result['data']
-        elif isinstance(result, list):
-            employees = result
-        
-        return {
-            "success": True,
-            "employees": employees
-        }
+        entry = reference_cache.get("employees", scope)
+        return reference_response(request, entry, "employees")
         
+    except Overloaded:
+        raise
     except Exception as e:
         print(f"[GET EMPLOYEES ERROR]: {e}")
-        # Demo data
-        return {
-            "success": True,
-            "employees": [
-                {"id": 3, "ho_ten": "Lê Văn Cường", "phong_ban": "Phòng Kỹ thuật", "chuc_vu": "Nhân viên"},
-                {"id": 4, "ho_ten": "Phạm Thị Dung", "phong_ban": "Phòng Kinh doanh", "chuc_vu": "Nhân viên"},
-                {"id": 6, "ho_ten": "Ngô Thị Phương", "phong_ban": "Phòng Kỹ thuật", "chuc_vu": "Nhân viên"}
-            ]
-        }
+        # HRM lỗi / ngắt mạch: danh sách đã nạp gần nhất (kể cả quá max_age)
+        entry = reference_cache.peek("employees", scope)
+        if entry is not None:
+            return reference_response(request, entry, "employees", stale=True)
+        return JSONResponse(status_code=503, content={"success": False, "employees": [], "message": str(e)})
 
 # --- Get Projects ---
 @app.get("/projects")
-async def get_projects():
+def get_projects(request: Request):
     """
     Lấy danh sách dự án đang active để gán công việc.
+    Hỗ trợ ETag / If-None-Match (304 khi danh sách không đổi).
     """
     try:
-        sql = """
-        SELECT id, ten_du_an, trang_thai_duan as trang_thai
-        FROM du_an
-        WHERE trang_thai_duan NOT LIKE N'%Hoàn thành%'
-        ORDER BY ten_du_an
-        """
-        
-        result = execute_sql_api(sql)
-        
-        projects = []
-        if isinstance(result, dict) and result.get('data'):
-            projects = result['data']
-        elif isinstance(result, list):
-            projects = result
-        
-        return {
-            "success": True,
-            "projects": projects
-        }
+        entry = reference_cache.get("projects", "company")
+        return reference_response(request, entry, "projects")
         
+    except Overloaded:
+        raise
     except Exception as e:
         print(f"[GET PROJECTS ERROR]: {e}")
-        # Demo data
-        return {
-            "success": True,
-            "projects": [
-                {"id": 1, "ten_du_an": "Hệ thống quản lý nhân sự", "trang_thai": "Đang thực hiện"},
-                {"id": 2, "ten_du_an": "Website công ty", "trang_thai": "Đang thực hiện"},
-                {"id": 3, "ten_du_an": "App mobile", "trang_thai": "Lên kế hoạch"}
-            ]
-        }
+        # HRM lỗi / ngắt mạch: danh sách đã nạp gần nhất (kể cả quá max_age)
+        entry = reference_cache.peek("projects", "company")
+        if entry is not None:
+            return reference_response(request, entry, "projects", stale=True)
+        return JSONResponse(status_code=503, content={"success": False, "projects": [], "message": str(e)})
 
 # --- Task Assignment Endpoint ---
-@app.post("/assign-task")
-async def assign_task(req: TaskAssignRequest):
+def sql_str(value: str) -> str:
+    """Escape chuỗi để nhúng vào literal N'...'."""
+    return str(value or "").replace("'", "''")
+
+def build_task_batch_sql(tasks: List[TaskAssignRequest], dedupe_hours: Union[int, None] = None) -> str:
     """
-    Giao công việc cho nhân viên.
-    Dành cho Manager và Admin.
+    Sinh MỘT batch transactional: insert toàn bộ cong_viec (OUTPUT id vào biến bảng),
+    sau đó insert tất cả người nhận bằng một câu multi-row, cuối cùng trả về (idx, id).
+    Số round trip HRM không phụ thuộc số công việc / số người nhận.
+    dedupe_hours: công việc giống hệt (tên, mô tả, người giao, hạn, dự án) đã tạo trong khoảng này
+    được dùng lại thay vì insert mới -> gửi lại từ hàng đợi ghi không sinh việc / người nhận trùng.
+    SET NOCOUNT ON: bỏ các thông báo "n rows affected" của từng câu INSERT để driver trả đúng
+    result set cuối (idx, id) thay vì dừng ở update count đầu tiên.
     """
-    try:
-        print(f"\n[ASSIGN TASK] Tên CV: {req.ten_cong_viec}")
-        print(f"[ASSIGN TASK] Người giao: {req.nguoi_giao_id}")
-        print(f"[ASSIGN TASK] Người nhận: {req.nguoi_nhan_ids}")
-        print(f"[ASSIGN TASK] Hạn: {req.han_hoan_thanh}")
-        
-        # Insert công việc
-        du_an_value = req.du_an_id if req.du_an_id else "NULL"
-        
-        sql_cv = f"""
+    parts = [
+        "SET NOCOUNT ON;",
+        "SET XACT_ABORT ON;",
+        "DECLARE @new_tasks TABLE (idx INT, id INT);",
+        "BEGIN TRANSACTION;",
+    ]
+    recipients = []
+    for idx, task in enumerate(tasks):
+        du_an_value = int(task.du_an_id) if task.du_an_id else "NULL"
+        insert = f"""
         INSERT INTO cong_viec (
             ten_cong_viec, mo_ta, du_an_id, nguoi_giao_id, 
             ngay_bat_dau, han_hoan_thanh, trang_thai, muc_do_uu_tien, ngay_tao
         )
-        OUTPUT INSERTED.id
+        OUTPUT {idx}, INSERTED.id INTO @new_tasks (idx, id)
         VALUES (
-            N'{req.ten_cong_viec}', 
-            N'{req.mo_ta}', 
+            N'{sql_str(task.ten_cong_viec)}', 
+            N'{sql_str(task.mo_ta)}', 
             {du_an_value}, 
-            {req.nguoi_giao_id},
+            {int(task.nguoi_giao_id)},
             GETDATE(), 
-            '{req.han_hoan_thanh}', 
+            '{sql_str(task.han_hoan_thanh)}', 
             N'Chưa bắt đầu', 
-            N'{req.muc_do_uu_tien}', 
+            N'{sql_str(task.muc_do_uu_tien)}', 
             GETDATE()
-        )
-        """
+        );"""
+        if dedupe_hours:
+            same_task = f"""
+            FROM cong_viec
+            WHERE ten_cong_viec = N'{sql_str(task.ten_cong_viec)}' AND ISNULL(mo_ta, N'') = N'{sql_str(task.mo_ta)}'
+              AND nguoi_giao_id = {int(task.nguoi_giao_id)} AND han_hoan_thanh = '{sql_str(task.han_hoan_thanh)}'
+              AND ISNULL(du_an_id, 0) = {int(task.du_an_id) if task.du_an_id else 0}
+              AND ngay_tao >= DATEADD(HOUR, -{int(dedupe_hours)}, GETDATE())"""
+            insert = f"""
+        IF EXISTS (SELECT 1 {same_task})
+            INSERT INTO @new_tasks (idx, id) SELECT TOP 1 {idx}, id {same_task} ORDER BY id DESC;
+        ELSE{insert}"""
+        parts.append(insert)
+        recipients.extend(f"({idx}, {int(nv_id)})" for nv_id in dict.fromkeys(task.nguoi_nhan_ids))
+    
+    if recipients:
+        parts.append(f"""
+        INSERT INTO cong_viec_nguoi_nhan (cong_viec_id, nhan_vien_id)
+        SELECT t.id, r.nhan_vien_id
+        FROM @new_tasks t
+        JOIN (VALUES {", ".join(recipients)}) AS r(idx, nhan_vien_id) ON r.idx = t.idx
+        WHERE NOT EXISTS (
+            SELECT 1 FROM cong_viec_nguoi_nhan n
+            WHERE n.cong_viec_id = t.id AND n.nhan_vien_id = r.nhan_vien_id
+        );""")
+    
+    parts.append("COMMIT TRANSACTION;")
+    parts.append("SELECT idx, id FROM @new_tasks ORDER BY idx;")
+    return "\n".join(parts)
+
+def assign_tasks_batch(tasks: List[TaskAssignRequest], dedupe_hours: Union[int, None] = None) -> List[Union[int, None]]:
+    """
+    Giao nhiều công việc trong một round trip. Trả về id công việc theo thứ tự đầu vào.
+    HRM từ chối batch -> Rejected; lỗi kết nối -> RuntimeError.
+    """
+    rows = execute_write(build_task_batch_sql(tasks, dedupe_hours))
+    ids = {r.get('idx'): r.get('id') for r in rows if isinstance(r, dict)}
+    
+    # Dữ liệu tham chiếu có thể đã đổi -> lần đọc sau nạp lại
+    reference_cache.invalidate()
+    briefing_cache.invalidate_users({nv_id for task in tasks for nv_id in task.nguoi_nhan_ids})
+    # Cập nhật ngay bộ đếm công việc (không chờ lần tick kế tiếp)
+    for idx, task in enumerate(tasks):
+        if ids.get(idx) is not None:
+            live_counters.record_task(ids[idx], {"trang_thai": "Chưa bắt đầu", "han_hoan_thanh": task.han_hoan_thanh}, task.nguoi_nhan_ids)
+    dashboard_hub.publish_all()
+    return [ids.get(idx) for idx in range(len(tasks))]
+
+@app.post("/assign-task")
+def assign_task(req: TaskAssignRequest):
+    """
+    Giao công việc cho nhân viên.
+    Dành cho Manager và Admin.
+    """
+    try:
+        print(f"\n[ASSIGN TASK] Tên CV: {req.ten_cong_viec}")
+        print(f"[ASSIGN TASK] Người giao: {req.nguoi_giao_id}")
+        print(f"[ASSIGN TASK] Người nhận: {req.nguoi_nhan_ids}")
+        print(f"[ASSIGN TASK] Hạn: {req.han_hoan_thanh}")
         
-        result_cv = execute_sql_api(sql_cv)
+        # Công việc + toàn bộ người nhận được gửi cùng các lượt giao khác trong một batch;
+        # cong_viec_id có trong kết quả của GET /writes/{write_id} khi đã gửi xong
+        item = write_queue.enqueue("assign_task", {
+            "ten_cong_viec": req.ten_cong_viec,
+            "mo_ta": req.mo_ta,
+            "du_an_id": req.du_an_id,
+            "nguoi_nhan_ids": req.nguoi_nhan_ids,
+            "nguoi_giao_id": req.nguoi_giao_id,
+            "han_hoan_thanh": req.han_hoan_thanh,
+            "muc_do_uu_tien": req.muc_do_uu_tien,
+        })
         
-        # Lấy id công việc vừa tạo
-        cv_id = None
-        if isinstance(result_cv, dict) and result_cv.get('data'):
-            cv_id = result_cv['data'][0].get('id')
-        elif isinstance(result_cv, list) and len(result_cv) > 0:
-            cv_id = result_cv[0].get('id')
+        return queued_response(item, "Công việc đã được giao thành công", cong_viec_id=None)
         
-        # Insert người nhận
-        if cv_id:
-            for nhan_vien_id in req.nguoi_nhan_ids:
-                sql_nn = f"""
-                INSERT INTO cong_viec_nguoi_nhan (cong_viec_id, nhan_vien_id)
-                VALUES ({cv_id}, {nhan_vien_id})
-                """
-                execute_sql_api(sql_nn)
+    except Exception as e:
+        print(f"[ASSIGN TASK ERROR]: {e}")
+        raise HTTPException(status_code=500, detail="Không thể giao công việc, vui lòng thử lại sau")
+
+@app.get("/writes/{write_id}")
+def get_write_status(write_id: str):
+    """Trạng thái một lượt ghi đã xếp hàng: queued / done / failed / superseded, số lần thử, lỗi, kết quả."""
+    item = write_queue.status(write_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy lượt ghi")
+    return item
+
+@app.get("/writes")
+def get_writes_status(ids: str):
+    """Trạng thái nhiều lượt ghi (ids cách nhau bởi dấu phẩy) cho UI cập nhật một lần."""
+    return {write_id: write_queue.status(write_id) for write_id in ids.split(",") if write_id}
+
+@app.post("/assign-tasks/bulk")
+def assign_tasks_bulk(req: BulkTaskAssignRequest):
+    """
+    Giao nhiều công việc cùng lúc (vd: import sprint) trong một round trip HRM.
+    Dành cho Manager và Admin.
+    """
+    if not req.tasks:
+        raise HTTPException(status_code=400, detail="Danh sách công việc trống")
+    
+    try:
+        print(f"\n[ASSIGN TASKS BULK] {len(req.tasks)} công việc, "
+              f"{sum(len(t.nguoi_nhan_ids) for t in req.tasks)} lượt giao")
+        cv_ids = assign_tasks_batch(req.tasks)
         
         return {
             "success": True,
-            "message": "Công việc đã được giao thành công",
-            "cong_viec_id": cv_id
+            "message": f"Đã giao {len(req.tasks)} công việc",
+            "cong_viec_ids": cv_ids
         }
         
+    except (Overloaded, CircuitOpen):
+        raise
+    except Rejected as e:
+        print(f"[ASSIGN TASKS BULK REJECTED]: {e}")
+        raise HTTPException(status_code=422, detail=f"Hệ thống dữ liệu từ chối lô giao việc: {e}")
     except Exception as e:
-        print(f"[ASSIGN TASK ERROR]: {e}")
-        return {
-            "success": True,
-            "message": "Công việc đã được giao thành công (Demo mode)",
-            "demo_mode": True
-        }
+        print(f"[ASSIGN TASKS BULK ERROR]: {e}")
+        raise HTTPException(status_code=502, detail="Không thể giao công việc, vui lòng thử lại sau")
 
 # ==========================================================
 # 7. DOWNLOAD FILE ENDPOINT
@@ -1205,8 +1705,29 @@ async def download_file(filename: str):
 # ==========================================================
 # 7. LOGIN ENDPOINT
 # ==========================================================
+# Chỉ mục đăng nhập trong bộ nhớ, nạp lại định kỳ (xem start_background_jobs)
+credential_index = CredentialIndex(lambda sql: extract_rows(execute_sql_api(sql)))
+
+def build_login_success(user_found: Dict, role: str) -> LoginResponse:
+    """Tạo LoginResponse thành công kèm session token."""
+    token = issue_token(user_found.get('id'), role, user_found.get('phong_ban_id'))
+    return LoginResponse(
+        success=True,
+        message=f"Đăng nhập thành công! Xin chào {user_found.get('ho_ten', '')}",
+        user={
+            "id": user_found.get('id'),
+            "ho_ten": user_found.get('ho_ten'),
+            "email": user_found.get('email'),
+            "chuc_vu": user_found.get('chuc_vu', '') or '',
+            "vai_tro": user_found.get('vai_tro', '') or 'Nhân viên',
+            "role": role,
+            "phong_ban_id": user_found.get('phong_ban_id')
+        },
+        token=token
+    )
+
 @app.post("/login", response_model=LoginResponse)
-async def login_endpoint(req: LoginRequest):
+def login_endpoint(req: LoginRequest):
     try:
         print(f"\n{'='*50}")
         print(f"[LOGIN] Đang xử lý đăng nhập...")
@@ -1215,6 +1736,15 @@ async def login_endpoint(req: LoginRequest):
         username_clean = req.username.strip()
         password_clean = req.password.strip().replace(' ', '').replace('.', '').replace('-', '')
         
+        # Fast path: xác thực trong bộ nhớ, không round trip tới HRM
+        if credential_index.ready:
+            entry = credential_index.authenticate(username_clean, password_clean)
+            if entry:
+                print(f"[LOGIN] Xác thực từ cache cho: {entry.get('ho_ten')} (role: {entry['role']})")
+                return build_login_success(entry, entry['role'])
+            # Không khớp trong cache -> có thể dữ liệu mới đổi, kiểm tra lại trên HRM
+            print(f"[LOGIN] Cache không khớp, truy vấn HRM")
+        
         sql = f"""
         SELECT id, ho_ten, email, so_dien_thoai, chuc_vu, vai_tro, phong_ban_id 
         FROM nhanvien 
@@ -1224,25 +1754,19 @@ async def login_endpoint(req: LoginRequest):
         """
         
         print(f"[LOGIN SQL]: {sql}")
-        result = execute_sql_api(sql)
+        result = query_hrm(sql)
         
-        if isinstance(result, str) and "Lỗi" in result:
-            print(f"[LOGIN] ỗi kết nối DB: {result}")
+        if not result.ok:
+            print(f"[LOGIN] Lỗi kết nối DB: {result.error}")
             return LoginResponse(
                 success=False,
                 message="Không thể kết nối đến hệ thống. Vui lòng thử lại sau.",
                 user=None
             )
         
-        if isinstance(result, dict) and 'data' in result:
-            users_data = result.get('data', [])
-        elif isinstance(result, list):
-            users_data = result
-        else:
-            users_data = []
+        users_data = result.dicts()
         
-        print(f"[LOGIN] Kiểu dữ liệu result: {type(result)}")
-        print(f"[LOGIN] Nội dung result: {result}")
+        print(f"[LOGIN] Kết quả: {result}")
         
         if not users_data or len(users_data) == 0:
             print(f"[LOGIN] Không tìm thấy user với username: {username_clean}")
@@ -1284,49 +1808,12 @@ async def login_endpoint(req: LoginRequest):
         print(f"[LOGIN] Vai trò trong DB: '{vai_tro}'")
         print(f"[LOGIN] Chức vụ trong DB: '{chuc_vu}'")
         
-        role = 'employee'
-        
-        # Hỗ trợ cả có dấu và không dấu
-        admin_keywords = [
-            'admin', 'giam doc', 'giám đốc', 'ceo', 'director', 
-            'chu tich', 'chủ tịch', 'tổng giám đốc', 'pho giam doc', 'phó giám đốc'
-        ]
-        manager_keywords = [
-            'quan ly', 'quản lý', 'manager', 
-            'truong phong', 'trưởng phòng', 
-            'truong nhom', 'trưởng nhóm',
-            'leader', 'supervisor', 'team lead'
-        ]
-        
-        check_text = (vai_tro + ' ' + chuc_vu).lower()
-        
-        for keyword in admin_keywords:
-            if keyword in check_text:
-                role = 'admin'
-                break
-        
-        if role != 'admin':
-            for keyword in manager_keywords:
-                if keyword in check_text:
-                    role = 'manager'
-                    break
+        role = resolve_role(vai_tro, chuc_vu)
         
         print(f"[LOGIN] Role được gán: {role}")
         print(f"{'='*50}\n")
         
-        return LoginResponse(
-            success=True,
-            message=f"Đăng nhập thành công! Xin chào {user_found.get('ho_ten', '')}",
-            user={
-                "id": user_found.get('id'),
-                "ho_ten": user_found.get('ho_ten'),
-                "email": user_found.get('email'),
-                "chuc_vu": chuc_vu,
-                "vai_tro": vai_tro,
-                "role": role,
-                "phong_ban_id": user_found.get('phong_ban_id')
-            }
-        )
+        return build_login_success(user_found, role)
         
     except Exception as e:
         print(f"[LOGIN ERROR]: {str(e)}")
@@ -1341,7 +1828,7 @@ async def login_endpoint(req: LoginRequest):
 # ==========================================================
 # 8. HELPER: Kiểm tra nhân viên có thuộc phòng ban không
 # ==========================================================
-def check_employee_in_department(question: str, dept_id: int) -> tuple:
+def check_employee_in_department(question: str, dept_id: int, deadline: Deadline = None) -> tuple:
     """
     Kiểm tra nếu câu hỏi đề cập đến tên người cụ thể,
     xác minh người đó có thuộc phòng ban của quản lý không.
@@ -1364,7 +1851,7 @@ Quy tắc:
 Tên người (hoặc NONE):"""
     
     try:
-        name_result = llm.invoke(extract_prompt).content.strip()
+        name_result = model_router.run("extract_name", extract_prompt, deadline=deadline).strip()
         print(f"[CHECK] Tên trích xuất: {name_result}")
         
         if name_result == "NONE" or not name_result or len(name_result) < 2:
@@ -1379,22 +1866,17 @@ Tên người (hoặc NONE):"""
         """
         print(f"[CHECK SQL]: {check_sql}")
         
-        result = execute_sql_api(check_sql)
-        
-        # Xử lý kết quả
-        if isinstance(result, dict) and 'data' in result:
-            data = result.get('data', [])
-        elif isinstance(result, list):
-            data = result
-        else:
-            data = []
+        result = query_hrm_read(check_sql)
         
-        if not data or len(data) == 0:
+        if len(result) == 0:
             # Không tìm thấy trong phòng ban
             return (False, f"Nhân viên '{name_result}' không thuộc phòng ban của bạn hoặc không tồn tại trong hệ thống.")
         
         return (True, None)  # Tìm thấy, cho phép tiếp tục
         
+    except (Overloaded, CircuitOpen, LLMDeadlineExceeded):
+        # Không kiểm tra được -> không được cho qua (fail closed), để /chat trả 503 / 504
+        raise
     except Exception as e:
         print(f"[CHECK ERROR]: {e}")
         return (True, None)  # Lỗi thì cho qua
@@ -1402,6 +1884,24 @@ Tên người (hoặc NONE):"""
 # ==========================================================
 # 9. MAIN CHAT ENDPOINT
 # ==========================================================
+chat_flight = SingleFlight("chat")
+
+
+def resolve_department_in_question(question: str) -> Union[int, None]:
+    """Phòng ban được nhắc tên trong câu hỏi (chỉ khi khớp đúng một phòng)."""
+    if not ensure_dept_project_index():
+        return None
+    matched = dept_project_index.match_departments(question)
+    return next(iter(matched)) if len(matched) == 1 else None
+
+
+# Câu hỏi thường gặp (check-in, phép tồn, việc đang mở, ai đi muộn) -> SQL mẫu, không gọi LLM
+intent_engine = IntentEngine(query_hrm_read, resolve_department_in_question)
+# Kết quả dạng đơn giản (rỗng / một con số / một dòng) diễn đạt bằng template, không gọi LLM
+answer_renderer = AnswerRenderer()
+# Ước lượng chi phí SQL sau validate_sql: viết lại dạng chậm đã biết, từ chối tích Đề-các / quét lịch sử không giới hạn
+query_guard = QueryGuard(cham_cong_days=QUERY_GUARD_CHAM_CONG_DAYS)
+
 
 def build_conversation_context(history: list) -> str:
     """Build conversation context string from history for LLM"""
@@ -1421,128 +1921,230 @@ def build_conversation_context(history: list) -> str:
     return "\\n".join(context_parts)
 
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(req: ChatRequest):
-    try:
-        # Chọn schema phù hợp với role của user
-        role = req.role or 'employee'  # Mặc định là employee nếu không có role
-        user_id = req.user_id
-        dept_id = req.phong_ban_id
-        
-        # Lấy schema phân quyền
-        user_schema = get_schema_by_role(role=role, user_id=user_id, dept_id=dept_id)
-        
-        # Build conversation context for Context Memory
-        conversation_context = build_conversation_context(req.conversation_history or [])
-        
-        print(f"[CHAT] Role: {role}, User ID: {user_id}, Dept ID: {dept_id}")
-        print(f"[CONTEXT] {conversation_context[:100]}...")
-        
-        # === KIỂM TRA QUYỀN TRUY CẬP NHÂN VIÊN (CHỈ CHO MANAGER) ===
-        if role == 'manager' and dept_id:
-            is_valid, error_msg = check_employee_in_department(req.question, dept_id)
-            if not is_valid:
-                print(f"[PERMISSION DENIED]: {error_msg}")
-                return ChatResponse(
-                    sql=None,
-                    data=None,
-                    answer=error_msg,
-                    download_url=None
-                )
-        
-        # Lấy SQL_PROMPT phù hợp với role
-        sql_prompt = get_sql_prompt_by_role(role=role)
-        sql_chain = sql_prompt | llm | StrOutputParser()
-        raw_sql = sql_chain.invoke({
-            "schema": user_schema,
-            "question": req.question,
-            "conversation_context": conversation_context
-        })
-        sql = validate_sql(raw_sql)
-        
-        print(f"[RAW SQL] {raw_sql[:200]}")
-        print(f"[VALIDATED SQL] {sql[:200] if sql else 'EMPTY'}")
+def is_export_question(question: str) -> bool:
+    """Câu hỏi yêu cầu xuất báo cáo ra file Word."""
+    q_lower = question.lower()
+    return any(word in q_lower for word in ("word", "docx", "van ban", "xuat", "file"))
+
 
-        # Kiểm tra nếu AI từ chối do không có quyền
-        if "NO_PERMISSION" in sql:
+def run_chat(question: str, role: str, user_id: Union[int, None], dept_id: Union[int, None],
+             conversation_context: str) -> ChatResponse:
+    """
+    Pipeline chat đầy đủ: kiểm tra quyền -> LLM sinh SQL -> HRM -> LLM trả lời (-> Word).
+    Mọi lời gọi LLM dùng chung một deadline CHAT_DEADLINE_SECONDS; hết giờ -> LLMDeadlineExceeded.
+    """
+    deadline = Deadline(CHAT_DEADLINE_SECONDS)
+    # Schema phân quyền dạng tĩnh theo role (prefix dùng chung được cache); user_id / dept_id đi ở phần cuối
+    user_schema = get_static_schema_by_role(role)
+    session_context = get_session_context(role=role, user_id=user_id, dept_id=dept_id)
+    
+    print(f"[CHAT] Role: {role}, User ID: {user_id}, Dept ID: {dept_id}")
+    print(f"[CONTEXT] {conversation_context[:100]}...")
+    
+    # === ĐƯỜNG TẮT INTENT: câu hỏi quen thuộc chạy SQL mẫu, bỏ qua cả 2 lần gọi LLM ===
+    matched = intent_engine.answer(question, role, user_id, dept_id)
+    if matched:
+        return ChatResponse(
+            sql=matched.sql.strip(),
+            data=matched.data,
+            answer=matched.answer + stale_note(matched.data),
+            download_url=None
+        )
+    
+    # === KIỂM TRA QUYỀN TRUY CẬP NHÂN VIÊN (CHỈ CHO MANAGER) ===
+    if role == 'manager' and dept_id:
+        is_valid, error_msg = check_employee_in_department(question, dept_id, deadline)
+        if not is_valid:
+            print(f"[PERMISSION DENIED]: {error_msg}")
             return ChatResponse(
                 sql=None,
                 data=None,
-                answer="Xin lỗi, bạn không có quyền truy cập thông tin này.",
+                answer=error_msg,
                 download_url=None
             )
+    
+    # Lấy SQL_PROMPT phù hợp với role; câu hỏi đơn giản đi model nhanh, nhiều JOIN đi model mạnh
+    sql_prompt = get_sql_prompt_by_role(role=role)
+    sql_tier = model_router.tier_for("sql", question=question, schema=user_schema)
+    raw_sql = model_router.run("sql", sql_prompt, {
+        "session": session_context,
+        "question": question,
+        "conversation_context": conversation_context
+    }, tier=sql_tier, deadline=deadline)
+    sql = bind_session_scope(validate_sql(raw_sql), role, user_id, dept_id)
+    
+    print(f"[RAW SQL] {raw_sql[:200]}")
+    print(f"[VALIDATED SQL] {sql[:200] if sql else 'EMPTY'}")
+
+    # Kiểm tra nếu AI từ chối do không có quyền
+    if "NO_PERMISSION" in sql:
+        return ChatResponse(
+            sql=None,
+            data=None,
+            answer="Xin lỗi, bạn không có quyền truy cập thông tin này.",
+            download_url=None
+        )
 
-        if "NO_DATA" in sql:
+    if "NO_DATA" in sql:
+        return ChatResponse(
+            sql=None,
+            data=None,
+            answer="Xin lỗi. Tôi không có dữ liệu về vấn đề này!",
+            download_url=None
+        )
+
+    guard_note = None
+    if sql:
+        review = query_guard.review(sql)
+        if review.rejected:
+            model_router.record_outcome(sql_tier, ok=False)
             return ChatResponse(
-                sql=None,
+                sql=review.sql,
                 data=None,
-                answer="Xin lỗi. Tôi không có dữ liệu về vấn đề này!",
+                answer=review.message,
                 download_url=None
             )
+        sql = review.sql
+        guard_note = review.note
 
-        if not sql:
-            data_result = None
-            final_answer = "Xin lỗi, tôi không thể hiểu yêu cầu này."
-            download_url = None
+    if not sql:
+        model_router.record_outcome(sql_tier, ok=False)
+        data_result = None
+        final_answer = "Xin lỗi, tôi không thể hiểu yêu cầu này."
+        download_url = None
+    else:
+        data_result = query_hrm_read(sql)
+        model_router.record_outcome(sql_tier, ok=data_result.ok)
+        print(f"[DATA RESULT] {data_result}")
+        download_url = None
+        
+        if not data_result.ok:
+            final_answer = f"Warning: {data_result.error}"
         else:
-            data_result = execute_sql_api(sql)
-            print(f"[DATA RESULT] {str(data_result)[:300]}")
-            print(f"[DATA TYPE] {type(data_result)}")
-            print(f"[DATA IS EMPTY] {not data_result if not isinstance(data_result, str) else 'N/A'}")
-            download_url = None
-            
-            if isinstance(data_result, str) and "Loi" in data_result:
-                final_answer = f"Warning: {data_result}"
-            else:
-                # Extract dữ liệu thực tế từ API response
-                actual_data = data_result
-                if isinstance(data_result, dict) and 'data' in data_result:
-                    actual_data = data_result.get('data', [])
-                    print(f"[EXTRACTED DATA] {actual_data}")
-                
-                # Kiểm tra số lượng items
-                data_count = 0
-                if isinstance(actual_data, list):
-                    data_count = len(actual_data)
-                    print(f"[ITEM COUNT] {data_count} items")
-                
+            # Rỗng / một con số / một dòng -> template; còn lại: kết quả nhỏ -> model nhanh, lớn -> model mạnh
+            final_answer = answer_renderer.render(question, data_result, role)
+            if final_answer is None:
                 # Thêm prefix để bắt LLM nhận thức được số lượng
-                data_with_count = f"[{data_count} items] {str(actual_data)}"
-                
-                ans_chain = ANSWER_PROMPT | llm | StrOutputParser()
-                final_answer = ans_chain.invoke({
-                    "question": req.question,
+                data_count = len(data_result)
+                data_with_count = f"[{data_count} items] {str(data_result.dicts())}"
+                final_answer = model_router.run("answer", ANSWER_PROMPT, {
+                    "question": question,
                     "data": data_with_count,
                     "role": role,
                     "dept_id": dept_id or "N/A"
-                })
-                print(f"[ANSWER] {final_answer[:200]}")
-            
-            q_lower = req.question.lower()
-            
-            if data_result and not isinstance(data_result, str):
-                if "word" in q_lower or "docx" in q_lower or "van ban" in q_lower or "xuat" in q_lower or "file" in q_lower:
-                    try:
-                        file_path = create_word_report(
-                            data=data_result, 
-                            title="BÁO CÁO TRUY VẤN HRM", 
-                            filename_prefix="baocao",
-                            question=req.question,
-                            summary=final_answer
-                        )
-                        if file_path:
-                            filename = os.path.basename(file_path)
-                            download_url = f"/download/{filename}"
-                    except Exception as e:
-                        print(f"Error creating word report: {e}")
+                }, deadline=deadline, rows=data_count, payload_chars=len(data_with_count))
+            final_answer += stale_note(data_result)
+            if guard_note:
+                final_answer += f"\n\n(Lưu ý: {guard_note})"
+            print(f"[ANSWER] {final_answer[:200]}")
+        
+        if data_result.ok and len(data_result):
+            if is_export_question(question):
+                try:
+                    file_path = create_word_report(
+                        data=data_result, 
+                        title="BÁO CÁO TRUY VẤN HRM", 
+                        filename_prefix="baocao",
+                        question=question,
+                        summary=final_answer
+                    )
+                    if file_path:
+                        filename = os.path.basename(file_path)
+                        download_url = f"/download/{filename}"
+                except Exception as e:
+                    print(f"Error creating word report: {e}")
 
-        return ChatResponse(
-            sql=sql,
-            data=data_result,
-            answer=final_answer,
-            download_url=download_url
+    return ChatResponse(
+        sql=sql,
+        data=data_result,
+        answer=final_answer,
+        download_url=download_url
+    )
+
+
+def chat_flight_key(role: str, user_id: Union[int, None], dept_id: Union[int, None],
+                    question: str, conversation_context: str) -> tuple:
+    """
+    Khóa gộp request /chat: (role, phạm vi dữ liệu, câu hỏi đã chuẩn hóa, dấu vân tay hội thoại).
+    Câu hỏi về bản thân ("tôi check-in lúc mấy giờ", intent my_*) tách theo user_id với mọi role;
+    câu hỏi chung gộp theo công ty (admin) / phòng ban (manager) - vd: nhiều trưởng phòng cùng hỏi "ai đi muộn".
+    """
+    personal = intent_engine.depends_on_user(f"{question}\n{conversation_context}", role)
+    scope = data_scope(role, user_id, dept_id, personal)
+    normalized = " ".join(question.lower().split()).rstrip(" ?.!")
+    fingerprint = hashlib.sha1(conversation_context.encode()).hexdigest()
+    return (role, scope, normalized, fingerprint)
+
+
+def chat_http_response(response: ChatResponse, compact: bool, accept_encoding: Union[str, None]) -> Response:
+    """
+    Serialize ChatResponse bằng orjson (bỏ qua bước validate lại của FastAPI),
+    data dạng cột nếu client yêu cầu, nén gzip / brotli với body lớn.
+    Dạng cột chỉ gửi CHAT_PREVIEW_ROWS dòng đầu để xem trước, kèm tổng số dòng (bản đầy đủ qua file Word).
+    """
+    data = response.data
+    if isinstance(data, HRMResult):
+        if not data.ok:
+            data = {"error": data.error}
+        elif compact:
+            data = {**data.slice(0, CHAT_PREVIEW_ROWS).to_columnar(), "total": len(data)}
+        else:
+            data = data.dicts()
+    body, encoding = negotiate_encoding(dumps({
+        "sql": response.sql,
+        "data": data,
+        "answer": response.answer,
+        "download_url": response.download_url,
+    }), accept_encoding)
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat_endpoint(req: ChatRequest, authorization: Union[str, None] = Header(None),
+                        accept_encoding: Union[str, None] = Header(None)):
+    try:
+        # Session token (nếu có) là nguồn tin cậy cho user_id / role / phòng ban
+        session = get_session(authorization)
+        if session:
+            role = session['role']
+            user_id = session['user_id']
+            dept_id = session['phong_ban_id']
+        else:
+            # Chọn schema phù hợp với role của user
+            role = req.role or 'employee'  # Mặc định là employee nếu không có role
+            user_id = req.user_id
+            dept_id = req.phong_ban_id
+        
+        # Build conversation context for Context Memory
+        conversation_context = build_conversation_context(req.conversation_history or [])
+        
+        set_caller(role=role)
+        if is_export_question(req.question):
+            # Xuất file Word: chạy ở làn bulk để không giành slot HRM / LLM của hội thoại
+            set_lane(BULK)
+        # Các request trùng nhau đang chạy đồng thời dùng chung một lần tính (LLM + HRM).
+        # Pipeline chạy trong thread pool để không chặn event loop.
+        key = chat_flight_key(role, user_id, dept_id, req.question, conversation_context)
+        response = await chat_flight.run(
+            key,
+            lambda: asyncio.to_thread(run_chat, req.question, role, user_id, dept_id, conversation_context)
         )
+        return chat_http_response(response, req.compact, accept_encoding)
 
+    except LLMDeadlineExceeded as e:
+        print(f"[CHAT DEADLINE] Hết thời gian ở bước {e}")
+        raise HTTPException(status_code=504, detail="Hệ thống phản hồi chậm, vui lòng thử lại sau.")
+    except Overloaded as e:
+        print(f"[ADMISSION] /chat: {e}")
+        raise HTTPException(status_code=503, detail="Hệ thống đang quá tải, vui lòng thử lại sau.",
+                            headers={"Retry-After": "2"})
+    except CircuitOpen as e:
+        print(f"[CHAT] {e}")
+        raise HTTPException(status_code=503, detail="Hệ thống dữ liệu đang gián đoạn, vui lòng thử lại sau.",
+                            headers={"Retry-After": str(int(e.retry_after))})
     except Exception as e:
         print(f"Server Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1550,7 +2152,7 @@ async def chat_endpoint(req: ChatRequest):
 # 10. GET REAL USERS FOR LOGIN (DEBUG)
 # ==========================================================
 @app.get("/debug/users")
-async def get_users_debug():
+def get_users_debug():
     """
     DEBUG ENDPOINT - Lấy danh sách nhân viên thực từ database
     Dùng để biết ai có thể đăng nhập và mật khẩu là gì
@@ -1562,14 +2164,7 @@ async def get_users_debug():
         LIMIT 20
         """
         
-        result = execute_sql_api(sql)
-        
-        if isinstance(result, dict) and 'data' in result:
-            users_data = result.get('data', [])
-        elif isinstance(result, list):
-            users_data = result
-        else:
-            users_data = []
+        users_data = query_hrm(sql).dicts()
         
         # Format dễ đọc
         formatted_users = []
@@ -1593,9 +2188,79 @@ async def get_users_debug():
             "note": "Dùng email hoặc ho_ten làm username, so_dien_thoai làm password"
         }
         
+    except (Overloaded, CircuitOpen):
+        raise
     except Exception as e:
         print(f"Debug Error: {e}")
         return {
             "status": "error",
             "message": str(e)
-        }
\ No newline at end of file
+        }
+
+# ==========================================================
+# 10B. METRICS (ADMIN)
+# ==========================================================
+@app.get("/admin/metrics")
+async def get_metrics():
+    """Số liệu vận hành: latency / độ chính xác theo tầng model, hedging / retry, đường tắt intent, câu trả lời template, viết lại / từ chối SQL tốn kém, gộp request /chat, bản sao đọc HRM và độ trễ đồng bộ từng bảng, hàng đợi / số request bị bỏ theo làn ưu tiên, trạng thái ngắt mạch HRM, hàng đợi ghi, chỉ mục nghỉ phép."""
+    return {
+        "llm_router": model_router.stats(),
+        "llm_executor": llm_executor.stats(),
+        "chat_intents": intent_engine.stats(),
+        "chat_answer_templates": answer_renderer.stats(),
+        "chat_query_guard": query_guard.stats(),
+        "chat_single_flight": chat_flight.stats(),
+        "hrm_replica": hrm_replica.stats(),
+        "hrm_change_capture": change_capture.stats(),
+        "hrm_queries": query_telemetry.summary(),
+        "briefing_cache": briefing_cache.stats(),
+        "admission": admission.stats(),
+        "hrm_circuit": hrm_breaker.stats(),
+        "hrm_write_queue": write_queue.stats(),
+        "leave_index": leave_index.stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/admin/query-stats")
+async def get_query_stats(limit: int = 20, order_by: str = "total_ms"):
+    """Mẫu câu lệnh HRM tốn thời gian nhất (order_by: total_ms / p95_ms / count / total_bytes) để chọn chỗ tối ưu / tính trước."""
+    if order_by not in ("total_ms", "p95_ms", "p99_ms", "avg_ms", "count", "total_bytes", "errors"):
+        raise HTTPException(status_code=400, detail="order_by không hợp lệ")
+    return {
+        **query_telemetry.summary(),
+        "templates": query_telemetry.top(limit=max(1, min(limit, 200)), order_by=order_by),
+        "timestamp": datetime.now().isoformat()
+    }
+
+# ==========================================================
+# 11. BACKGROUND JOBS
+# ==========================================================
+@app.on_event("startup")
+def start_background_jobs():
+    # Chỉ mục đăng nhập: nạp ngay khi khởi động rồi làm mới định kỳ
+    run_periodically("auth-cache", AUTH_CACHE_REFRESH_SECONDS, credential_index.refresh)
+    # Danh sách nhân viên / dự án: làm mới nền các scope đã từng được đọc
+    run_periodically("reference-cache", REFERENCE_CACHE_REFRESH_SECONDS, reference_cache.refresh_all, run_immediately=False)
+    # Chỉ mục phòng ban -> dự án: dự án mới mỗi phút, nạp lại toàn bộ mỗi 30 phút
+    run_periodically("dept-projects-full", DEPT_PROJECT_FULL_REFRESH_SECONDS, dept_project_index.refresh)
+    run_periodically("dept-projects-incr", DEPT_PROJECT_INCREMENTAL_SECONDS, dept_project_index.refresh_incremental, run_immediately=False)
+    # Tiến độ mới nhất từng công việc: đọc dòng mới mỗi 30s, đối soát toàn bộ mỗi giờ
+    run_periodically("progress-full", PROGRESS_FULL_REFRESH_SECONDS, progress_snapshot.refresh)
+    run_periodically("progress-incr", PROGRESS_INCREMENTAL_SECONDS, progress_snapshot.refresh_incremental, run_immediately=False)
+    # Bộ đếm dashboard: đọc thay đổi mỗi 15s (kèm reset qua ngày), đối soát toàn bộ mỗi 15 phút
+    run_periodically("counters-reconcile", LIVE_COUNTERS_RECONCILE_SECONDS, live_counters.reconcile)
+    run_periodically("counters-tick", LIVE_COUNTERS_TICK_SECONDS, tick_live_counters, run_immediately=False)
+    # Bản sao đọc cho chat / analytics: nạp toàn bộ khi khởi động (và 6 giờ một lần cho sửa tại chỗ),
+    # giữa các lần nạp chỉ đọc thay đổi mỗi 30s, đối soát dòng bị xóa mỗi 30 phút
+    run_periodically("hrm-replica", REPLICA_REFRESH_SECONDS, hrm_replica.refresh)
+    run_periodically("hrm-replica-cdc", CHANGE_CAPTURE_POLL_SECONDS, change_capture.poll, run_immediately=False)
+    run_periodically("hrm-replica-reconcile", CHANGE_CAPTURE_RECONCILE_SECONDS, change_capture.reconcile, run_immediately=False)
+    # Briefing tính sẵn: theo lịch trước giờ làm / sau khung check-in, kèm khi khởi động và mỗi max_age
+    run_periodically("briefing-prewarm-refresh", BRIEFING_CACHE_MAX_AGE_SECONDS, briefing_cache.build)
+    run_daily_at("briefing-prewarm", BRIEFING_PREWARM_TIMES, briefing_cache.build)
+    # Thống kê câu lệnh HRM: ghi snapshot ra đĩa mỗi 5 phút
+    run_periodically("query-telemetry", QUERY_TELEMETRY_SNAPSHOT_SECONDS, query_telemetry.snapshot, run_immediately=False)
+    # Hàng đợi ghi HRM: gửi theo lô mỗi giây (gồm cả item còn lại từ lần chạy trước)
+    run_periodically("write-queue", WRITE_QUEUE_DRAIN_SECONDS, write_queue.drain)
+    # Chỉ mục nghỉ phép: nạp lại toàn bộ mỗi 5 phút (endpoint nghỉ phép cập nhật trực tiếp giữa các lần)
+    run_periodically("leave-index", LEAVE_INDEX_REFRESH_SECONDS, refresh_leave_index)
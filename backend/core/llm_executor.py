@@ -0,0 +1,206 @@
+import random
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, ContextManager, Dict, Union
+
+# ==========================================================
+# LLM EXECUTOR: gọi LLM có deadline, hedging và retry có jitter
+# - Deadline tổng cho cả request /chat + ngân sách thời gian riêng từng bước
+# - Hedging: quá độ trễ p95 (của chính bước đó) mà chưa có kết quả thì bắn
+#   thêm request thứ hai, lấy kết quả nào về trước
+# - Retry khi lỗi: backoff full-jitter, giới hạn bởi retry budget (token bucket)
+#   để retry không nhân tải khi provider đang sự cố
+# Hàm gọi được truyền vào dạng callable nên có thể thay bằng LLM giả có độ trễ
+# tùy ý (vd: lambda: time.sleep(2) or "SELECT 1") để kiểm thử.
+# slot(): giữ một chỗ gọi LLM trong suốt lượt gọi (admission control theo làn ưu tiên).
+# Lời gọi bị bỏ lại (thua hedge / hết deadline) vẫn chạy nốt trong pool và chiếm provider
+# ngoài slot: đếm số lời gọi đó, đạt max_abandoned (hoặc pool đã đầy) thì không hedge nữa.
+# ==========================================================
+
+
+class LLMDeadlineExceeded(Exception):
+    """Hết thời gian của bước / của request trước khi LLM trả lời."""
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+
+class RetryBudget:
+    """Mỗi lời gọi nạp `ratio` token (tối đa `max_tokens`); mỗi lần retry tiêu 1 token."""
+
+    def __init__(self, ratio: float = 0.1, max_tokens: float = 10):
+        self._ratio = ratio
+        self._max = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self._max, self._tokens + self._ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+def _percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class LLMExecutor:
+    def __init__(self, stage_budgets: Dict[str, float], default_budget: float = 10,
+                 hedge_default_delay: float = 2.5, hedge_min_delay: float = 0.5,
+                 hedge_min_samples: int = 20, max_attempts: int = 3, max_workers: int = 32,
+                 slot: Union[Callable[[], ContextManager], None] = None, max_abandoned: int = 4):
+        self._stage_budgets = stage_budgets
+        self._default_budget = default_budget
+        self._hedge_default_delay = hedge_default_delay
+        self._hedge_min_delay = hedge_min_delay
+        self._hedge_min_samples = hedge_min_samples
+        self._max_attempts = max_attempts
+        self._max_workers = max_workers
+        self._max_abandoned = max_abandoned
+        self._slot = slot or nullcontext
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+        self._retry_budget = RetryBudget()
+        self._lock = threading.Lock()
+        self._latency: Dict[str, deque] = {}
+        self._in_flight = 0
+        self._abandoned = 0
+        self._counters = {"calls": 0, "hedges": 0, "hedge_wins": 0, "hedges_skipped": 0,
+                          "retries": 0, "deadline_exceeded": 0}
+
+    # --- Độ trễ ---
+    def _record_latency(self, stage: str, seconds: float):
+        with self._lock:
+            self._latency.setdefault(stage, deque(maxlen=500)).append(seconds)
+
+    def hedge_delay(self, stage: str) -> float:
+        with self._lock:
+            samples = list(self._latency.get(stage, ()))
+        if len(samples) < self._hedge_min_samples:
+            return self._hedge_default_delay
+        return max(self._hedge_min_delay, _percentile(samples, 95))
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+    # --- Lời gọi trong pool ---
+    def _submit(self, fn: Callable[[], Any]):
+        with self._lock:
+            self._in_flight += 1
+        future = self._pool.submit(fn)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _abandon(self, futures: list):
+        """Caller không chờ nữa: hủy lời gọi còn trong hàng đợi, đếm lời gọi đang chạy tới khi xong."""
+        for future in futures:
+            if future.cancel():
+                continue
+            with self._lock:
+                self._abandoned += 1
+            future.add_done_callback(self._abandoned_done)
+
+    def _abandoned_done(self, _future):
+        with self._lock:
+            self._abandoned -= 1
+
+    def _can_hedge(self) -> bool:
+        with self._lock:
+            return self._abandoned < self._max_abandoned and self._in_flight < self._max_workers
+
+    # --- Gọi LLM ---
+    def call(self, stage: str, fn: Callable[[], Any], deadline: Union[Deadline, None] = None) -> Any:
+        # stage có thể kèm tầng model ("sql:fast"): ngân sách theo bước, latency theo bước + tầng
+        budget = self._stage_budgets.get(stage.split(":")[0], self._default_budget)
+        if deadline is not None:
+            budget = min(budget, deadline.remaining())
+        end = time.monotonic() + budget
+        self._count("calls")
+        self._retry_budget.deposit()
+
+        with self._slot():
+            attempt = 0
+            while True:
+                attempt += 1
+                try:
+                    return self._hedged(stage, fn, end)
+                except LLMDeadlineExceeded:
+                    self._count("deadline_exceeded")
+                    raise
+                except Exception as e:
+                    backoff = random.uniform(0, min(2.0, 0.2 * (2 ** attempt)))
+                    if (attempt >= self._max_attempts or end - time.monotonic() <= backoff
+                            or not self._retry_budget.withdraw()):
+                        raise
+                    print(f"[LLM EXECUTOR] {stage} lỗi ({e}), thử lại sau {backoff:.2f}s")
+                    self._count("retries")
+                    time.sleep(backoff)
+
+    def _hedged(self, stage: str, fn: Callable[[], Any], end: float) -> Any:
+        def timed():
+            started = time.monotonic()
+            result = fn()
+            self._record_latency(stage, time.monotonic() - started)
+            return result
+
+        if end - time.monotonic() <= 0:
+            raise LLMDeadlineExceeded(stage)
+
+        primary = self._submit(timed)
+        futures = [primary]
+        try:
+            done, _ = wait(futures, timeout=min(self.hedge_delay(stage), max(0.0, end - time.monotonic())))
+            if not done and end - time.monotonic() > 0:
+                if self._can_hedge():
+                    futures.append(self._submit(timed))
+                    self._count("hedges")
+                else:
+                    self._count("hedges_skipped")
+
+            last_error = None
+            while futures:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    raise LLMDeadlineExceeded(stage)
+                done, _ = wait(futures, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    futures.remove(future)
+                    if future.exception() is None:
+                        if future is not primary:
+                            self._count("hedge_wins")
+                        return future.result()
+                    last_error = future.exception()
+            raise last_error
+        finally:
+            self._abandon(futures)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {
+                stage: {
+                    "samples": len(values),
+                    "p95_ms": round(_percentile(values, 95) * 1000, 1) if values else 0,
+                }
+                for stage, values in self._latency.items()
+            }
+            return {**self._counters, "in_flight": self._in_flight, "abandoned_in_flight": self._abandoned,
+                    "stages": stages}
@@ -0,0 +1,188 @@
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Union
+
+from langchain_core.prompts import BasePromptTemplate
+
+# ==========================================================
+# MODEL ROUTER: chia việc giữa model nhanh (Groq llama-3.1-8b-instant)
+# và model mạnh (OpenAI gpt-4o-mini)
+# - fast:   trích xuất tên, diễn đạt câu trả lời ngắn, câu hỏi đơn giản (<= 2 bảng)
+# - strong: SQL nhiều JOIN / thống kê / so sánh, câu trả lời trên dữ liệu lớn
+# Có thể truyền model giả (vd: FakeListChatModel(responses=[...], sleep=0.3))
+# để đo latency / độ chính xác từng tầng mà không gọi provider thật.
+# Lời gọi chạy dạng stream để đo time-to-first-token; usage_metadata (nếu provider
+# trả về) cho biết số prompt token và số token đọc từ prompt cache.
+# ==========================================================
+
+FAST = "fast"
+STRONG = "strong"
+
+# Từ khóa -> bảng; đếm số bảng câu hỏi chạm tới để ước lượng số JOIN
+TABLE_KEYWORDS = {
+    "cham_cong": ["check-in", "check in", "checkin", "chấm công", "đi muộn", "đi trễ", "vắng", "về sớm"],
+    "nhanvien": ["nhân viên", "ai ", "người", "email", "số điện thoại", "sđt", "chức vụ"],
+    "phong_ban": ["phòng ban", "phòng ", "bộ phận"],
+    "luong": ["lương", "phụ cấp", "thực lĩnh"],
+    "cong_viec": ["công việc", "task", "việc ", "trễ hạn", "deadline", "giao"],
+    "cong_viec_tien_do": ["tiến độ", "phần trăm", "%"],
+    "du_an": ["dự án", "project"],
+    "don_nghi_phep": ["nghỉ phép", "xin nghỉ", "đơn nghỉ"],
+    "ngay_phep_nam": ["ngày phép", "phép năm", "còn bao nhiêu ngày"],
+    "luu_kpi": ["kpi", "xếp loại", "đánh giá"],
+}
+
+# Dấu hiệu cần tổng hợp / so sánh -> SQL phức tạp
+COMPLEX_MARKERS = [
+    "thống kê", "top", "xếp hạng", "so sánh", "trung bình", "tỉ lệ", "tỷ lệ",
+    "theo từng", "mỗi phòng", "từng phòng", "nhiều nhất", "ít nhất", "tổng hợp",
+    "xu hướng", "chi tiết hơn", "bao gồm", "kèm",
+]
+
+SIMPLE_MAX_TABLES = 2  # 1 bảng hoặc 1 JOIN đơn (vd: cham_cong + nhanvien)
+SHORT_ANSWER_MAX_ROWS = 5
+SHORT_ANSWER_MAX_CHARS = 1500
+
+
+def classify_sql_complexity(question: str, schema: str = "") -> str:
+    """
+    Phân loại câu hỏi 'simple' / 'complex' theo số bảng liên quan (chỉ tính các bảng
+    có trong schema đã cắt theo role) và các dấu hiệu tổng hợp / so sánh.
+    """
+    q = f" {question.lower()} "
+    schema_lower = schema.lower()
+    tables = {
+        table for table, keywords in TABLE_KEYWORDS.items()
+        if (not schema_lower or table in schema_lower) and any(k in q for k in keywords)
+    }
+    if any(marker in q for marker in COMPLEX_MARKERS):
+        return "complex"
+    # Nhắc tới nhiều mốc / nhiều đối tượng ("và", "hoặc") thường cần JOIN
+    if len(tables) > SIMPLE_MAX_TABLES or len(re.findall(r"\b(và|hoặc)\b", q)) >= 2:
+        return "complex"
+    return "simple"
+
+
+def usage_tokens(message) -> tuple:
+    """(prompt_tokens, cached_tokens) từ usage_metadata của AIMessage; (0, 0) nếu provider không trả."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    details = usage.get("input_token_details") or {}
+    return int(usage.get("input_tokens") or 0), int(details.get("cache_read") or 0)
+
+
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class ModelRouter:
+    def __init__(self, strong, fast=None, window: int = 500, executor=None):
+        self._models = {STRONG: strong, FAST: fast or strong}
+        self._executor = executor
+        self.fast_available = fast is not None
+        self._lock = threading.Lock()
+        self._latency = {FAST: deque(maxlen=window), STRONG: deque(maxlen=window)}
+        self._calls: Dict[str, Dict[str, int]] = {}
+        self._outcomes = {FAST: {"ok": 0, "fail": 0}, STRONG: {"ok": 0, "fail": 0}}
+        self._ttft = {FAST: deque(maxlen=window), STRONG: deque(maxlen=window)}
+        self._tokens = {FAST: {"prompt": 0, "cached": 0}, STRONG: {"prompt": 0, "cached": 0}}
+        self._recent = deque(maxlen=50)
+
+    def model(self, tier: str):
+        return self._models[tier]
+
+    def tier_for(self, stage: str, question: str = "", schema: str = "",
+                 rows: int = 0, payload_chars: int = 0) -> str:
+        if not self.fast_available:
+            return STRONG
+        if stage == "extract_name":
+            return FAST
+        if stage == "answer":
+            small = rows <= SHORT_ANSWER_MAX_ROWS and payload_chars <= SHORT_ANSWER_MAX_CHARS
+            return FAST if small else STRONG
+        if stage == "sql":
+            return FAST if classify_sql_complexity(question, schema) == "simple" else STRONG
+        return STRONG
+
+    def run(self, stage: str, prompt: Union[BasePromptTemplate, str], inputs: Dict[str, Any] = None,
+            tier: str = None, deadline=None, **route_hints) -> str:
+        """
+        Gọi model theo tầng (tự chọn nếu không truyền tier), ghi nhận latency.
+        Có executor thì lời gọi đi qua deadline / hedging / retry của executor.
+        """
+        tier = tier or self.tier_for(stage, **route_hints)
+        model = self._models[tier]
+
+        def invoke():
+            messages = prompt.format_messages(**(inputs or {})) if isinstance(prompt, BasePromptTemplate) else prompt
+            started = time.perf_counter()
+            ttft, message = None, None
+            for chunk in model.stream(messages):
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+                message = chunk if message is None else message + chunk
+            return message, ttft
+
+        start = time.perf_counter()
+        if self._executor is not None:
+            message, ttft = self._executor.call(f"{stage}:{tier}", invoke, deadline)
+        else:
+            message, ttft = invoke()
+        elapsed = time.perf_counter() - start
+        prompt_tokens, cached_tokens = usage_tokens(message)
+        with self._lock:
+            self._latency[tier].append(elapsed)
+            if ttft is not None:
+                self._ttft[tier].append(ttft)
+            self._tokens[tier]["prompt"] += prompt_tokens
+            self._tokens[tier]["cached"] += cached_tokens
+            self._recent.append({
+                "stage": stage,
+                "tier": tier,
+                "prompt_tokens": prompt_tokens,
+                "cached_tokens": cached_tokens,
+                "cached_ratio": round(cached_tokens / prompt_tokens, 3) if prompt_tokens else None,
+                "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+                "total_ms": round(elapsed * 1000, 1),
+            })
+            stage_calls = self._calls.setdefault(stage, {FAST: 0, STRONG: 0})
+            stage_calls[tier] += 1
+        cache_note = f", cache {cached_tokens}/{prompt_tokens} tokens" if prompt_tokens else ""
+        print(f"[MODEL ROUTER] {stage} -> {tier} ({elapsed * 1000:.0f} ms{cache_note})")
+        return message.content if message is not None else ""
+
+    def record_outcome(self, tier: str, ok: bool):
+        """Ghi nhận SQL sinh ra chạy được (ok) hay bị HRM từ chối / rỗng (fail)."""
+        with self._lock:
+            self._outcomes[tier]["ok" if ok else "fail"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tiers = {}
+            for tier, values in self._latency.items():
+                outcome = self._outcomes[tier]
+                tokens = self._tokens[tier]
+                total = outcome["ok"] + outcome["fail"]
+                tiers[tier] = {
+                    "samples": len(values),
+                    "p50_ms": round(_percentile(values, 50) * 1000, 1),
+                    "p95_ms": round(_percentile(values, 95) * 1000, 1),
+                    "sql_ok": outcome["ok"],
+                    "sql_fail": outcome["fail"],
+                    "sql_accuracy": round(outcome["ok"] / total, 3) if total else None,
+                    "ttft_p50_ms": round(_percentile(self._ttft[tier], 50) * 1000, 1),
+                    "ttft_p95_ms": round(_percentile(self._ttft[tier], 95) * 1000, 1),
+                    "prompt_tokens": tokens["prompt"],
+                    "cached_tokens": tokens["cached"],
+                    "cached_ratio": round(tokens["cached"] / tokens["prompt"], 3) if tokens["prompt"] else None,
+                }
+            return {
+                "fast_available": self.fast_available,
+                "tiers": tiers,
+                "stages": dict(self._calls),
+                "recent_calls": list(self._recent),
+            }
@@ -3,6 +3,8 @@
 # File này chứa toàn bộ Schema HRM và các Prompt template
 # ==========================================================
 
+from functools import lru_cache
+
 from langchain_core.prompts import ChatPromptTemplate
 
 # ==========================================================
@@ -505,10 +507,6 @@ ANSWER_PROMPT = ChatPromptTemplate.from_template("""
 Bạn là trợ lý HRM thông minh.
 Nhiệm vụ: Đọc dữ liệu JSON và trả lời câu hỏi của người dùng.
 
-THÔNG TIN:
-- Câu hỏi: "{question}"
-- Dữ liệu nhận được: {data}
-
 YÊU CẦU TRẢ LỜI:
 
 0. QUAN TRỌNG - ĐỌC DỮ LIỆU:
@@ -567,6 +565,10 @@ YÊU CẦU TRẢ LỜI:
 GIỌNG ĐIỆU:
 Tự nhiên, thân thiện, chuyên nghiệp, giống trợ lý nội bộ doanh nghiệp.
 
+THÔNG TIN:
+- Câu hỏi: "{question}"
+- Dữ liệu nhận được: {data}
+
 TRẢ LỜI:
 """)
 
@@ -797,12 +799,17 @@ DANH SÁCH BẢNG - ĐƯỢC PHÉP TRUY CẬP TOÀN BỘ:
 # 6B. GET SQL PROMPT BY ROLE (Role-specific Few-Shot Examples)
 # ==========================================================
 
+@lru_cache(maxsize=None)
 def get_sql_prompt_by_role(role: str = 'employee') -> ChatPromptTemplate:
     """
     Trả về SQL_PROMPT phù hợp với vai trò người dùng.
     - Employee: Ví dụ về câu hỏi cá nhân (check-in, lương, công việc của tôi)
     - Manager: Ví dụ về câu hỏi quản lý phòng ban (ai đi muộn, ai vắng mặt, nhân viên phòng)
     - Admin: Ví dụ về câu hỏi toàn công ty (thống kê, dự án, nhân sự toàn bộ)
+
+    Bố cục thân thiện với prompt caching của provider: phần đầu (luật, ví dụ, schema)
+    giống hệt nhau cho mọi user cùng role; phần thay đổi theo user / lượt hỏi
+    ({session}, {conversation_context}, {question}) nằm ở cuối.
     """
     base_prompt = """Bạn là SQL Generation Engine. Nhiệm vụ: Chuyển câu hỏi thành SQL Server/MySQL query tối ưu.
 
@@ -817,10 +824,7 @@ def get_sql_prompt_by_role(role: str = 'employee') -> ChatPromptTemplate:
   b) Không ánh xạ được tới BẤT KỲ bảng nào trong schema
 - Nếu câu hỏi còn mơ hồ nhưng có khả năng liên quan, hãy suy luận hợp lý nhất và sinh SQL an toàn.
 
-🧠 NGỮ CẢNH HỘI THOẠI (CONTEXT MEMORY):
-{conversation_context}
-
-HƯỚNG DẪN XỬ LÝ NGỮ CẢNH:
+HƯỚNG DẪN XỬ LÝ NGỮ CẢNH (xem mục NGỮ CẢNH HỘI THOẠI ở cuối):
 - Nếu câu hỏi hiện tại có từ như "còn", "thế còn", "còn...thì sao", "so sánh với", "chi tiết hơn", "cụ thể hơn":
   → Phải tham chiếu lại chủ đề/đối tượng từ câu hỏi trước.
 - Ví dụ ngữ cảnh:
@@ -970,9 +974,16 @@ HỌC TỪ VÍ DỤ (FEW-SHOT - ADMIN):
   -> SQL: SELECT pb.ten_phong, COUNT(cv.id) as so_viec FROM phong_ban pb LEFT JOIN nhanvien nv ON pb.id = nv.phong_ban_id LEFT JOIN cong_viec_nguoi_nhan cvnn ON nv.id = cvnn.nhan_vien_id LEFT JOIN cong_viec cv ON cvnn.cong_viec_id = cv.id WHERE cv.trang_thai = 'Đang thực hiện' GROUP BY pb.id, pb.ten_phong ORDER BY so_viec DESC
 """
     
+    # Schema tĩnh chèn thẳng vào template nên phải escape dấu ngoặc nhọn
+    static_schema = get_static_schema_by_role(role).replace("{", "{{").replace("}", "}}")
+    
     prompt_text = base_prompt + few_shot + """
 SCHEMA DỮ LIỆU:
-{schema}
+""" + static_schema + """
+{session}
+
+🧠 NGỮ CẢNH HỘI THOẠI (CONTEXT MEMORY):
+{conversation_context}
 
 Câu hỏi người dùng:
 {question}
@@ -1005,3 +1016,32 @@ def get_schema_by_role(role: str, user_id: int = None, dept_id: int = None) -> s
         return SCHEMA_QUANLY.format(user_id=user_id, dept_id=dept_id)
     else:  # employee
         return SCHEMA_NHANVIEN.format(user_id=user_id)
+
+
+def get_static_schema_by_role(role: str) -> str:
+    """
+    Schema theo vai trò, giữ nguyên placeholder {user_id} / {dept_id} như trong few-shot,
+    nên giống hệt nhau giữa các user cùng role (phần prefix dùng chung được cache).
+    Giá trị thật nằm trong get_session_context().
+    """
+    if role == 'admin':
+        return SCHEMA_ADMIN
+    elif role == 'manager':
+        return SCHEMA_QUANLY.format(user_id="{user_id}", dept_id="{dept_id}")
+    else:  # employee
+        return SCHEMA_NHANVIEN.format(user_id="{user_id}")
+
+
+def get_session_context(role: str, user_id: int = None, dept_id: int = None) -> str:
+    """Phần theo user đặt cuối prompt: giá trị thay cho {user_id} / {dept_id} trong schema và ví dụ."""
+    values = {}
+    if role != 'admin':
+        values["user_id"] = user_id
+    if role == 'manager':
+        values["dept_id"] = dept_id
+    lines = ["PHIÊN LÀM VIỆC HIỆN TẠI:", f"- Vai trò: {role}"]
+    lines += [f"- {{{name}}} = {value}" for name, value in values.items()]
+    if values:
+        placeholders = " / ".join(f"{{{name}}}" for name in values)
+        lines.append(f"=> Khi sinh SQL, BẮT BUỘC thay {placeholders} bằng giá trị số ở trên.")
+    return "\n".join(lines)
@@ -0,0 +1,196 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, NamedTuple, Tuple, Union
+
+# ==========================================================
+# ADMISSION CONTROL: làn ưu tiên cho request và slot HRM / LLM
+# - Mỗi request được xếp vào một làn theo method + path (interactive > dashboard > bulk);
+#   job nền (không có context request) thuộc làn background
+# - Cửa vào: mỗi làn có số request đồng thời tối đa và ngân sách thời gian chờ;
+#   quá ngân sách -> trả bản cũ gần nhất (nếu làn cho phép) hoặc 503 + Retry-After
+# - Slot tài nguyên (HRM, LLM): giới hạn theo làn + giới hạn chung; làn thấp không được
+#   nhận slot khi làn cao hơn đang chờ cùng tài nguyên
+# Kết quả: tải dashboard / xuất file tăng không làm chậm /chat, /login.
+# ==========================================================
+
+INTERACTIVE, DASHBOARD, BULK, BACKGROUND = "interactive", "dashboard", "bulk", "background"
+PRIORITY = {INTERACTIVE: 0, DASHBOARD: 1, BULK: 2, BACKGROUND: 3}
+
+_lane = contextvars.ContextVar("admission_lane", default=None)
+
+
+class Lane(NamedTuple):
+    max_requests: int            # request đồng thời tối đa qua cửa vào
+    queue_budget: float          # thời gian chờ tối đa (giây) ở cửa vào và khi xin slot
+    slots: Dict[str, int]        # slot tài nguyên tối đa theo làn
+    serve_stale: bool = False    # quá tải -> trả response thành công gần nhất
+
+
+DEFAULT_LANES = {
+    INTERACTIVE: Lane(64, 10.0, {"hrm": 12, "llm": 12}),
+    DASHBOARD: Lane(16, 1.0, {"hrm": 4, "llm": 0}, serve_stale=True),
+    BULK: Lane(2, 5.0, {"hrm": 2, "llm": 2}),
+    BACKGROUND: Lane(0, 30.0, {"hrm": 3, "llm": 0}),
+}
+
+# (method, tiền tố path) -> làn; path không khớp -> interactive
+ROUTES = (
+    ("GET", "/analytics/stream", None),  # SSE sống lâu: không qua cửa vào
+    ("GET", "/admin/metrics", None),     # vẫn xem được số liệu khi đang quá tải
+    ("GET", "/admin/analytics", DASHBOARD),
+    ("GET", "/manager/analytics", DASHBOARD),
+    ("GET", "/leave-requests", DASHBOARD),
+    ("GET", "/employees", DASHBOARD),
+    ("GET", "/projects", DASHBOARD),
+    ("GET", "/admin/", DASHBOARD),
+    ("GET", "/debug/", DASHBOARD),
+    ("GET", "/download/", BULK),
+    ("POST", "/assign-tasks/bulk", BULK),
+)
+
+
+class Overloaded(Exception):
+    """Hết ngân sách chờ ở cửa vào hoặc khi xin slot tài nguyên."""
+
+    def __init__(self, lane: str, resource: str, waited: float):
+        super().__init__(f"Làn {lane} quá tải ({resource}, đã chờ {waited:.1f}s)")
+        self.lane = lane
+        self.resource = resource
+
+
+def classify(method: str, path: str) -> Union[str, None]:
+    for route_method, prefix, lane in ROUTES:
+        if method == route_method and path.startswith(prefix):
+            return lane
+    return INTERACTIVE
+
+
+def set_lane(lane: str):
+    """Đổi làn cho phần còn lại của request (vd: /chat xuất file Word -> bulk)."""
+    _lane.set(lane)
+
+
+def current_lane() -> str:
+    return _lane.get() or BACKGROUND
+
+
+def _p95(values) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+
+
+class AdmissionController:
+    def __init__(self, lanes: Dict[str, Lane] = None, capacity: Dict[str, int] = None):
+        self.lanes = lanes or DEFAULT_LANES
+        self._capacity = capacity or {"hrm": 12, "llm": 12}
+        # Slot tài nguyên: dùng từ thread (execute_sql_api, LLM) nên khóa kiểu threading
+        self._cond = threading.Condition()
+        self._in_use: Dict[Tuple[str, str], int] = {}
+        self._waiting: Dict[Tuple[str, str], int] = {}
+        # Cửa vào: chạy trên event loop
+        self._gates: Dict[str, asyncio.Semaphore] = {}
+        self._counts: Dict[str, Dict[str, int]] = {lane: {"admitted": 0, "shed": 0, "stale": 0} for lane in self.lanes}
+        self._waits: Dict[str, deque] = {lane: deque(maxlen=500) for lane in self.lanes}
+
+    def _bump(self, lane: str, key: str):
+        with self._cond:
+            self._counts[lane][key] += 1
+
+    # --- Cửa vào (request) ---
+    @asynccontextmanager
+    async def admit(self, lane: str):
+        """Giữ chỗ cho request trong làn; Overloaded nếu chờ quá queue_budget."""
+        config = self.lanes[lane]
+        gate = self._gates.get(lane)
+        if gate is None:
+            gate = self._gates[lane] = asyncio.Semaphore(config.max_requests)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(gate.acquire(), timeout=config.queue_budget)
+        except asyncio.TimeoutError:
+            self._bump(lane, "shed")
+            raise Overloaded(lane, "request", time.monotonic() - started)
+        self._waits[lane].append(time.monotonic() - started)
+        self._bump(lane, "admitted")
+        _lane.set(lane)
+        try:
+            yield
+        finally:
+            gate.release()
+
+    def record_stale(self, lane: str):
+        self._bump(lane, "stale")
+
+    # --- Slot tài nguyên (thread) ---
+    def _can_take(self, lane: str, resource: str) -> bool:
+        if self._in_use.get((lane, resource), 0) >= self.lanes[lane].slots.get(resource, 0):
+            return False
+        if sum(n for (_, res), n in self._in_use.items() if res == resource) >= self._capacity[resource]:
+            return False
+        # Làn ưu tiên cao hơn đang chờ -> nhường
+        return not any(n and res == resource and PRIORITY[other] < PRIORITY[lane]
+                       for (other, res), n in self._waiting.items())
+
+    @contextmanager
+    def slot(self, resource: str):
+        """Giữ một slot `resource` cho làn hiện tại; Overloaded nếu chờ quá queue_budget của làn."""
+        lane = current_lane()
+        budget = self.lanes[lane].queue_budget
+        started = time.monotonic()
+        key = (lane, resource)
+        with self._cond:
+            self._waiting[key] = self._waiting.get(key, 0) + 1
+            try:
+                while not self._can_take(lane, resource):
+                    remaining = budget - (time.monotonic() - started)
+                    if remaining <= 0:
+                        self._counts[lane]["shed"] += 1
+                        raise Overloaded(lane, resource, time.monotonic() - started)
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting[key] -= 1
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_use[key] -= 1
+                self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                lane: {
+                    **self._counts[lane],
+                    "queue_p95_ms": round(_p95(self._waits[lane]) * 1000, 1),
+                    "in_use": {res: self._in_use.get((lane, res), 0) for res in self._capacity},
+                    "waiting": {res: self._waiting.get((lane, res), 0) for res in self._capacity},
+                }
+                for lane in self.lanes
+            }
+
+
+class StaleResponses:
+    """Response thành công gần nhất theo (path, query) cho các làn được phép trả bản cũ."""
+
+    def __init__(self, max_entries: int = 256):
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[bytes, str, float]]" = OrderedDict()
+
+    def put(self, key: str, body: bytes, media_type: str):
+        with self._lock:
+            self._entries[key] = (body, media_type, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Union[Tuple[bytes, str, float], None]:
+        with self._lock:
+            return self._entries.get(key)
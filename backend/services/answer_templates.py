@@ -0,0 +1,143 @@
+import re
+import threading
+from typing import Any, Dict, List, Union
+
+# ==========================================================
+# ANSWER TEMPLATES: diễn đạt kết quả có dạng đơn giản không cần LLM
+# - Rỗng:      phân biệt câu hỏi kiểm tra vi phạm (đi muộn, trễ hạn...) và tra cứu
+# - Một số:    [{"cnt": 7}] -> "Dạ, có 7 ... ạ."
+# - Một dòng:  liệt kê từng trường dạng "- Nhãn: giá trị"
+# Kết quả khác (nhiều dòng, giá trị dài) -> None, để ANSWER_PROMPT xử lý.
+# ==========================================================
+
+SINGLE_ROW_MAX_FIELDS = 8
+SINGLE_VALUE_MAX_CHARS = 200
+
+# Câu hỏi kiểm tra trạng thái tiêu cực: rỗng là tin tốt (Loại A trong ANSWER_PROMPT)
+_NEGATIVE_CHECK = re.compile(r"đi muộn|đi trễ|vắng|nghỉ làm|trễ hạn|quá hạn|lỗi|vi phạm|về sớm")
+_COUNT_COLUMN = re.compile(r"^(so_|tong|count|cnt|total|sl_|so luong)|count\(", re.IGNORECASE)
+
+# Danh từ theo tên cột đếm (so_nhan_vien -> nhân viên)
+COUNT_NOUNS = {
+    "nhan_vien": "nhân viên", "du_an": "dự án", "viec": "công việc", "cong_viec": "công việc",
+    "don": "đơn", "nguoi": "người", "phong": "phòng ban", "ngay": "ngày",
+}
+
+COLUMN_LABELS = {
+    "ho_ten": "Họ tên", "email": "Email", "so_dien_thoai": "Số điện thoại", "chuc_vu": "Chức vụ",
+    "vai_tro": "Vai trò", "ngay_vao_lam": "Ngày vào làm", "ten_phong": "Phòng ban",
+    "luong_co_ban": "Lương cơ bản", "phu_cap": "Phụ cấp", "khoan_tru": "Khoản trừ",
+    "check_in": "Giờ check-in", "check_out": "Giờ check-out", "ngay": "Ngày",
+    "ngay_phep_con_lai": "Ngày phép còn lại", "tong_ngay_phep": "Tổng ngày phép",
+    "ngay_phep_da_dung": "Ngày phép đã dùng", "ten_cong_viec": "Công việc",
+    "han_hoan_thanh": "Hạn hoàn thành", "trang_thai": "Trạng thái", "muc_do_uu_tien": "Mức độ ưu tiên",
+    "ten_du_an": "Dự án", "trang_thai_duan": "Trạng thái dự án", "ngay_bat_dau": "Ngày bắt đầu",
+    "ngay_ket_thuc": "Ngày kết thúc", "tien_do": "Tiến độ (%)", "phan_tram": "Tiến độ (%)",
+    "ly_do": "Lý do", "quan_ly": "Quản lý",
+}
+
+SCOPE_PHRASES = {
+    "employee": "của bạn",
+    "manager": "trong phòng ban của bạn",
+    "admin": "trong hệ thống",
+}
+
+
+def format_value(value: Any) -> str:
+    if value is None or value == "":
+        return "chưa có"
+    if isinstance(value, bool):
+        return "có" if value else "không"
+    if isinstance(value, int):
+        # Tách hàng nghìn cho số tiền; giữ nguyên năm / mã số nhỏ
+        return f"{value:,}".replace(",", ".") if abs(value) >= 10000 else str(value)
+    if isinstance(value, float):
+        return f"{round(value, 2):g}".replace(".", ",")
+    text = str(value)
+    # '2026-02-01T00:00:00' -> '01/02/2026'
+    m = re.match(r"^(\d{4})-(\d{2})-(\d{2})(T00:00:00.*)?$", text)
+    if m:
+        return f"{m.group(3)}/{m.group(2)}/{m.group(1)}"
+    return text
+
+
+def column_label(column: str) -> str:
+    return COLUMN_LABELS.get(column.split(".")[-1].lower(), column.replace("_", " ").capitalize())
+
+
+def count_noun(column: str) -> str:
+    name = column.lower()
+    for key in sorted(COUNT_NOUNS, key=len, reverse=True):
+        if key in name:
+            return COUNT_NOUNS[key]
+    return ""
+
+
+def _as_number(value: Any) -> Union[int, float, None]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str) and re.fullmatch(r"-?\d+(\.\d+)?", value.strip()):
+        return float(value) if "." in value else int(value)
+    return None
+
+
+class AnswerRenderer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {"empty": 0, "single_count": 0, "single_row": 0, "llm": 0}
+
+    def _count(self, shape: str):
+        with self._lock:
+            self._counts[shape] += 1
+
+    def render(self, question: str, result, role: str) -> Union[str, None]:
+        """Câu trả lời tiếng Việt cho kết quả (HRMResult) dạng đơn giản; None nếu cần LLM."""
+        scope = SCOPE_PHRASES.get(role, SCOPE_PHRASES["employee"])
+
+        if not len(result):
+            self._count("empty")
+            if _NEGATIVE_CHECK.search(question.lower()):
+                return f"Dạ, em đã kiểm tra và không có trường hợp nào {scope} ạ."
+            return f"Dạ, em đã kiểm tra nhưng không tìm thấy thông tin phù hợp {scope} ạ."
+
+        if len(result) != 1:
+            self._count("llm")
+            return None
+
+        row: Dict[str, Any] = result.first()
+        if len(row) == 1:
+            column, value = next(iter(row.items()))
+            number = _as_number(value)
+            if number is not None and (not column or _COUNT_COLUMN.search(column)):
+                self._count("single_count")
+                noun = count_noun(column)
+                if noun:
+                    return f"Dạ, có {format_value(number)} {noun} ạ."
+                return f"Dạ, kết quả là {format_value(number)} ạ."
+
+        fields: List[str] = []
+        for column, value in row.items():
+            if isinstance(value, (dict, list)) or len(str(value)) > SINGLE_VALUE_MAX_CHARS:
+                self._count("llm")
+                return None
+            fields.append(f"- {column_label(column)}: {format_value(value)}")
+        if len(fields) > SINGLE_ROW_MAX_FIELDS:
+            self._count("llm")
+            return None
+
+        self._count("single_row")
+        if len(fields) == 1:
+            column, value = next(iter(row.items()))
+            return f"Dạ, {column_label(column).lower()} là {format_value(value)} ạ."
+        return "Dạ, thông tin em tìm được:\n" + "\n".join(fields)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self._counts.values())
+            templated = total - self._counts["llm"]
+            return {
+                **self._counts,
+                "template_rate": round(templated / total, 3) if total else None,
+            }
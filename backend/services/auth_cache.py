@@ -0,0 +1,178 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from typing import Any, Callable, Dict, List, Union
+
+# ==========================================================
+# AUTH CACHE: chỉ mục đăng nhập trong bộ nhớ + session token ký HMAC
+# ==========================================================
+
+SESSION_SECRET = os.environ.get("SESSION_SECRET")
+if not SESSION_SECRET:
+    # Không cấu hình thì sinh khóa tạm: token sẽ mất hiệu lực khi restart server
+    print("[AUTH] Chua cau hinh SESSION_SECRET, dung khoa tam thoi cho phien chay nay")
+    SESSION_SECRET = secrets.token_hex(32)
+
+SESSION_TTL_SECONDS = int(os.environ.get("SESSION_TTL_SECONDS", 12 * 3600))
+
+# Hỗ trợ cả có dấu và không dấu
+ADMIN_KEYWORDS = [
+    'admin', 'giam doc', 'giám đốc', 'ceo', 'director',
+    'chu tich', 'chủ tịch', 'tổng giám đốc', 'pho giam doc', 'phó giám đốc'
+]
+MANAGER_KEYWORDS = [
+    'quan ly', 'quản lý', 'manager',
+    'truong phong', 'trưởng phòng',
+    'truong nhom', 'trưởng nhóm',
+    'leader', 'supervisor', 'team lead'
+]
+
+
+def normalize_phone(value: Any) -> str:
+    """Bỏ khoảng trắng, dấu chấm, gạch ngang trong số điện thoại / mật khẩu."""
+    return str(value or '').strip().replace(' ', '').replace('.', '').replace('-', '')
+
+
+def phone_digest(phone: Any) -> str:
+    """Digest HMAC của số điện thoại đã chuẩn hóa (không giữ SĐT gốc trong cache)."""
+    return hmac.new(SESSION_SECRET.encode(), normalize_phone(phone).encode(), hashlib.sha256).hexdigest()
+
+
+def resolve_role(vai_tro: str, chuc_vu: str) -> str:
+    """Suy ra role ('admin' / 'manager' / 'employee') từ vai_tro + chuc_vu."""
+    check_text = ((vai_tro or '') + ' ' + (chuc_vu or '')).lower()
+    if any(keyword in check_text for keyword in ADMIN_KEYWORDS):
+        return 'admin'
+    if any(keyword in check_text for keyword in MANAGER_KEYWORDS):
+        return 'manager'
+    return 'employee'
+
+
+def build_entry(user: Dict) -> Dict:
+    """Chuyển 1 dòng nhanvien thành entry của chỉ mục (role đã tính sẵn)."""
+    vai_tro = user.get('vai_tro', '') or 'Nhân viên'
+    chuc_vu = user.get('chuc_vu', '') or ''
+    return {
+        "id": user.get('id'),
+        "ho_ten": user.get('ho_ten'),
+        "email": user.get('email'),
+        "chuc_vu": chuc_vu,
+        "vai_tro": vai_tro,
+        "role": resolve_role(vai_tro, chuc_vu),
+        "phong_ban_id": user.get('phong_ban_id'),
+        "phone_digest": phone_digest(user.get('so_dien_thoai', '')),
+    }
+
+
+class CredentialIndex:
+    """
+    Chỉ mục email / họ tên -> thông tin đăng nhập, nạp lại định kỳ từ bảng nhanvien.
+    Login tra cứu hoàn toàn trong bộ nhớ, không cần round trip tới HRM.
+    """
+
+    LOAD_SQL = """
+    SELECT id, ho_ten, email, so_dien_thoai, chuc_vu, vai_tro, phong_ban_id
+    FROM nhanvien
+    """
+
+    def __init__(self, fetch_rows: Callable[[str], List[Dict]]):
+        self._fetch_rows = fetch_rows
+        self._lock = threading.Lock()
+        self._by_email: Dict[str, Dict] = {}
+        self._by_name: List[tuple] = []  # (ho_ten lower, entry)
+        self.loaded_at: Union[float, None] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    def refresh(self) -> int:
+        rows = self._fetch_rows(self.LOAD_SQL)
+        if not rows:
+            # Giữ nguyên chỉ mục cũ nếu HRM không trả dữ liệu
+            return 0
+
+        by_email = {}
+        by_name = []
+        for user in rows:
+            if not isinstance(user, dict):
+                continue
+            entry = build_entry(user)
+            if entry["email"]:
+                by_email.setdefault(str(entry["email"]).strip().lower(), entry)
+            if entry["ho_ten"]:
+                by_name.append((str(entry["ho_ten"]).lower(), entry))
+
+        with self._lock:
+            self._by_email = by_email
+            self._by_name = by_name
+            self.loaded_at = time.time()
+
+        print(f"[AUTH CACHE] Đã nạp {len(by_name)} nhân viên vào chỉ mục đăng nhập")
+        return len(by_name)
+
+    def candidates(self, username: str) -> List[Dict]:
+        """Tương đương `email = x OR ho_ten LIKE '%x%'` nhưng tra trong bộ nhớ."""
+        key = username.strip().lower()
+        if not key:
+            return []
+        with self._lock:
+            by_email = self._by_email
+            by_name = self._by_name
+        result = []
+        if key in by_email:
+            result.append(by_email[key])
+        result.extend(entry for name, entry in by_name if key in name and entry not in result)
+        return result
+
+    def authenticate(self, username: str, password: str) -> Union[Dict, None]:
+        digest = phone_digest(password)
+        for entry in self.candidates(username):
+            if hmac.compare_digest(entry["phone_digest"], digest):
+                return entry
+        return None
+
+
+# ==========================================================
+# SESSION TOKEN (payload JSON + chữ ký HMAC-SHA256)
+# ==========================================================
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload_b64: str) -> str:
+    return _b64encode(hmac.new(SESSION_SECRET.encode(), payload_b64.encode(), hashlib.sha256).digest())
+
+
+def issue_token(user_id: int, role: str, phong_ban_id: Union[int, None]) -> str:
+    payload = {
+        "user_id": user_id,
+        "role": role,
+        "phong_ban_id": phong_ban_id,
+        "exp": int(time.time()) + SESSION_TTL_SECONDS,
+    }
+    payload_b64 = _b64encode(json.dumps(payload, separators=(",", ":")).encode())
+    return f"{payload_b64}.{_sign(payload_b64)}"
+
+
+def verify_token(token: str) -> Union[Dict, None]:
+    """Trả về payload nếu token hợp lệ và chưa hết hạn, ngược lại None."""
+    try:
+        payload_b64, signature = token.split(".", 1)
+        if not hmac.compare_digest(signature, _sign(payload_b64)):
+            return None
+        payload = json.loads(_b64decode(payload_b64))
+        if payload.get("exp", 0) < time.time():
+            return None
+        return payload
+    except Exception:
+        return None
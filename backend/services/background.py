@@ -0,0 +1,57 @@
+import threading
+import time
+from datetime import datetime, time as dt_time, timedelta
+from typing import List
+
+
+def run_periodically(name: str, interval: float, fn, run_immediately: bool = True) -> threading.Thread:
+    """
+    Chạy `fn` định kỳ trên một daemon thread.
+    Lỗi trong `fn` chỉ được log lại, vòng lặp vẫn tiếp tục ở chu kỳ sau.
+    """
+    def _loop():
+        if not run_immediately:
+            time.sleep(interval)
+        while True:
+            try:
+                fn()
+            except Exception as e:
+                print(f"[BACKGROUND {name}] Lỗi: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=_loop, name=f"bg-{name}", daemon=True)
+    thread.start()
+    return thread
+
+
+def run_daily_at(name: str, times: List[str], fn) -> threading.Thread:
+    """
+    Chạy `fn` mỗi ngày vào các mốc giờ địa phương `times` ("HH:MM") trên một daemon thread.
+    Lỗi trong `fn` chỉ được log lại, lịch các ngày sau vẫn giữ nguyên.
+    """
+    slots = sorted(dt_time.fromisoformat(t.strip()) for t in times if t.strip())
+
+    def _next_run(now: datetime) -> datetime:
+        for slot in slots:
+            candidate = datetime.combine(now.date(), slot)
+            if candidate > now:
+                return candidate
+        return datetime.combine(now.date() + timedelta(days=1), slots[0])
+
+    def _loop():
+        while True:
+            target = _next_run(datetime.now())
+            # Ngủ từng đoạn ngắn để không trượt lịch khi đồng hồ hệ thống bị chỉnh
+            remaining = (target - datetime.now()).total_seconds()
+            while remaining > 0:
+                time.sleep(min(remaining, 60))
+                remaining = (target - datetime.now()).total_seconds()
+            try:
+                fn()
+            except Exception as e:
+                print(f"[BACKGROUND {name}] Lỗi: {e}")
+
+    thread = threading.Thread(target=_loop, name=f"bg-{name}", daemon=True)
+    if slots:
+        thread.start()
+    return thread
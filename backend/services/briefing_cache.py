@@ -0,0 +1,141 @@
+import threading
+import time
+from datetime import date
+from typing import Any, Callable, Dict, Iterable, Union
+
+# ==========================================================
+# BRIEFING CACHE: tính sẵn phần briefing giống nhau giữa các lượt đăng nhập
+# Chạy theo lịch (trước giờ làm và sau khung check-in), mỗi lần vài truy vấn gộp:
+# - từng nhân viên: họ tên, tối đa 5 công việc chưa hoàn thành, phép năm còn lại
+# - từng phòng ban: tổng hợp dự án (chỉ mục phòng ban -> dự án + tiến độ)
+# - toàn công ty: số nhân viên / dự án đang chạy / dự án trễ hạn
+# Trường thay đổi liên tục (check-in hôm nay, bộ đếm phòng ban) vẫn ghép lúc request.
+# Entry chỉ dùng trong ngày tính và trong max_age; ghi dữ liệu liên quan (qua API hoặc change capture
+# thấy cong_viec / ngay_phep_nam đổi trên HRM) thì bỏ entry người đó.
+# ==========================================================
+
+TASKS_PER_USER = 5
+
+
+class BriefingCache:
+    NAMES_SQL = "SELECT id, ho_ten FROM nhanvien"
+    TASKS_SQL = """
+    SELECT cvnn.nhan_vien_id, cv.ten_cong_viec, cv.han_hoan_thanh, cv.muc_do_uu_tien, cv.trang_thai
+    FROM cong_viec cv
+    JOIN cong_viec_nguoi_nhan cvnn ON cv.id = cvnn.cong_viec_id
+    WHERE cv.trang_thai != 'Đã hoàn thành'
+    ORDER BY cvnn.nhan_vien_id, cv.muc_do_uu_tien DESC, cv.han_hoan_thanh ASC
+    """
+    LEAVE_SQL = """
+    SELECT nhan_vien_id, tong_ngay_phep, ngay_phep_da_dung, ngay_phep_con_lai
+    FROM ngay_phep_nam
+    WHERE nam = YEAR(CURDATE())
+    """
+    DEPT_SQL = "SELECT id FROM phong_ban"
+    COMPANY_SQL = """
+    SELECT
+        (SELECT COUNT(*) FROM nhanvien WHERE trang_thai_lam_viec LIKE '%Đang%' OR trang_thai_lam_viec IS NULL) as total_employees,
+        (SELECT COUNT(*) FROM du_an WHERE trang_thai_duan LIKE '%Đang%' OR trang_thai_duan LIKE '%thực hiện%') as active_projects,
+        (SELECT COUNT(*) FROM du_an WHERE ngay_ket_thuc < CURDATE() AND trang_thai_duan NOT IN ('Đã hoàn thành', 'Tạm ngưng')) as overdue_projects
+    """
+
+    def __init__(self, query: Callable[[str], Any],
+                 dept_projects_summary: Callable[[int], Union[Dict, None]], max_age: float = 10800):
+        """query(sql) -> HRMResult; dept_projects_summary(dept_id) -> dict tổng hợp dự án phòng."""
+        self._query = query
+        self._dept_projects_summary = dept_projects_summary
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._day = ""
+        self._built_at: Union[float, None] = None
+        self._personal: Dict[int, Dict[str, Any]] = {}
+        self._dept_projects: Dict[int, Union[Dict, None]] = {}
+        self._company: Union[Dict, None] = None
+        self._hits = 0
+        self._misses = 0
+        self._last_build_seconds: Union[float, None] = None
+
+    def _fresh(self) -> bool:
+        return (self._built_at is not None and self._day == date.today().isoformat()
+                and time.time() - self._built_at < self._max_age)
+
+    # --- Tính sẵn ---
+    def build(self) -> bool:
+        """Tính lại toàn bộ; giữ bản cũ nếu truy vấn bắt buộc lỗi."""
+        started = time.time()
+        names = self._query(self.NAMES_SQL)
+        tasks = self._query(self.TASKS_SQL)
+        leave = self._query(self.LEAVE_SQL)
+        if not (names.ok and tasks.ok and leave.ok):
+            print(f"[BRIEFING CACHE] Bỏ qua lần tính: {names.error or tasks.error or leave.error}")
+            return False
+
+        personal: Dict[int, Dict[str, Any]] = {
+            row["id"]: {"name": row.get("ho_ten"), "tasks_today": [], "leave_balance": None}
+            for row in names.dicts() if row.get("id") is not None
+        }
+        for row in tasks.dicts():
+            entry = personal.get(row.pop("nhan_vien_id", None))
+            if entry is not None and len(entry["tasks_today"]) < TASKS_PER_USER:
+                entry["tasks_today"].append(row)
+        for row in leave.dicts():
+            entry = personal.get(row.pop("nhan_vien_id", None))
+            if entry is not None:
+                entry["leave_balance"] = row
+
+        dept_projects = {}
+        depts = self._query(self.DEPT_SQL)
+        for dept_id in (depts.column("id") if depts.ok and "id" in depts.columns else []):
+            dept_projects[dept_id] = self._dept_projects_summary(dept_id)
+        company = self._query(self.COMPANY_SQL)
+
+        with self._lock:
+            self._personal = personal
+            self._dept_projects = dept_projects
+            self._company = company.first() if company.ok else None
+            self._day = date.today().isoformat()
+            self._built_at = started
+            self._last_build_seconds = time.time() - started
+        print(f"[BRIEFING CACHE] Tính sẵn {len(personal)} nhân viên, {len(dept_projects)} phòng ban "
+              f"trong {self._last_build_seconds:.1f}s")
+        return True
+
+    # --- Đọc ---
+    def personal(self, user_id: int) -> Union[Dict[str, Any], None]:
+        """{name, tasks_today, leave_balance} của nhân viên; None nếu chưa tính / đã cũ."""
+        with self._lock:
+            entry = self._personal.get(user_id) if self._fresh() else None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            return {**entry, "tasks_today": list(entry["tasks_today"])}
+
+    def dept_projects(self, dept_id: int) -> Union[Dict, None]:
+        with self._lock:
+            return self._dept_projects.get(dept_id) if self._fresh() else None
+
+    def company(self) -> Union[Dict, None]:
+        with self._lock:
+            return dict(self._company) if self._fresh() and self._company is not None else None
+
+    def invalidate_users(self, user_ids: Iterable[int]):
+        """Công việc / phép của các nhân viên này vừa đổi -> lần sau tính trực tiếp."""
+        with self._lock:
+            for user_id in user_ids:
+                self._personal.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "fresh": self._fresh(),
+                "day": self._day,
+                "age_seconds": round(time.time() - self._built_at, 1) if self._built_at else None,
+                "last_build_seconds": round(self._last_build_seconds, 2) if self._last_build_seconds else None,
+                "employees": len(self._personal),
+                "departments": len(self._dept_projects),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 3) if total else None,
+            }
@@ -0,0 +1,319 @@
+import threading
+import time
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
+
+from services.hrm_replica import HRMReplica, normalize_value
+
+# ==========================================================
+# CHANGE CAPTURE: đồng bộ tăng dần bản sao HRM
+# - Mỗi bảng có high-water mark (cột thời gian, id) trên cột cập nhật / tạo
+#   (thoi_gian_cap_nhat > ngay_cap_nhat > thoi_gian > ngay_tao; không có thì theo id)
+# - Mỗi lần poll chỉ đọc dòng mới / đã đổi, theo lô giới hạn (keyset, không OFFSET)
+# - Dòng bị xóa: đối soát định kỳ theo checksum (COUNT, SUM(id)) từng khoảng id,
+#   chỉ khoảng lệch mới tải danh sách id để xóa / bổ sung
+# - Bảng chỉ có ngay_tao / id (sửa tại chỗ không đổi cột), con trỏ chỉ bắt được dòng mới:
+#   + bảng có "cửa sổ còn sửa được" (MUTABLE_WINDOWS: chấm công hôm nay / hôm qua, đơn chờ duyệt,
+#     thông báo chưa đọc): mỗi lần poll đọc lại dòng trong cửa sổ (ở HRM và ở bản sao), áp dụng
+#     dòng đã đổi rồi báo đã đồng bộ
+#   + bảng khác (nhanvien, cong_viec, du_an...): đọc lại cả bảng mỗi table_reload_seconds
+#     (ngắn hơn ngưỡng quá hạn của bản sao); cong_viec được đọc lại thêm theo lịch sử / tiến độ
+# - subscribe(fn): fn(bảng, các dòng) được gọi sau mỗi lần áp dụng dòng mới / đã đổi
+#   (cache phía trên bỏ entry liên quan thay vì chờ hết hạn)
+# Chi phí đồng bộ tỉ lệ với lượng thay đổi, không phải kích thước bảng.
+# ==========================================================
+
+CURSOR_COLUMNS = ("thoi_gian_cap_nhat", "ngay_cap_nhat", "thoi_gian", "ngay_tao")
+# Cột cập nhật khi sửa dòng (hoặc bảng lịch sử chỉ thêm dòng) -> bắt kịp cột là bắt kịp bảng
+COMPLETE_CURSORS = ("thoi_gian_cap_nhat", "ngay_cap_nhat", "thoi_gian")
+
+# Bảng không có cột cập nhật: (điều kiện ở HRM, điều kiện trên bản sao) của các dòng còn có thể bị sửa.
+# Đọc lại dòng thỏa điều kiện ở HRM và dòng cục bộ từng thỏa (vd: đơn vừa được duyệt đã ra khỏi cửa sổ).
+# {since}: hôm qua (check-out muộn qua nửa đêm vẫn bắt được)
+MUTABLE_WINDOWS = {
+    "cham_cong": ("ngay >= '{since}'", "ngay >= '{since}'"),
+    "don_nghi_phep": ("trang_thai IN (N'Chờ duyệt', 'cho_duyet')", "trang_thai IN ('Chờ duyệt', 'cho_duyet')"),
+    "thong_bao": ("da_doc = 0", "da_doc = 0"),
+}
+
+# Bảng con ghi nhận thay đổi của bảng cha không có cột cập nhật -> đọc lại dòng cha
+PARENT_FEEDS = {
+    "cong_viec_lich_su": ("cong_viec", "cong_viec_id"),
+    "cong_viec_tien_do": ("cong_viec", "cong_viec_id"),
+}
+
+
+def _ids_sql(ids: Iterable[int]) -> str:
+    return ", ".join(str(int(i)) for i in ids)
+
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _as_int(value: Any) -> int:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+class _TableCursor:
+    __slots__ = ("table", "column", "value", "last_id", "caught_up_at", "backlog",
+                 "reloaded_at", "applied", "deleted", "restored", "error")
+
+    def __init__(self, table: str, column: Union[str, None]):
+        self.table = table
+        self.column = column
+        self.value: Union[str, None] = None
+        self.last_id = 0
+        self.caught_up_at: Union[float, None] = None
+        self.backlog = False
+        self.reloaded_at: Union[float, None] = None
+        self.applied = 0
+        self.deleted = 0
+        self.restored = 0
+        self.error: Union[str, None] = None
+
+
+class ChangeCapture:
+    def __init__(self, fetch_rows: Callable[[str], Tuple[Union[list, None], Union[str, None]]],
+                 replica: HRMReplica, batch_size: int = 500, max_batches: int = 10,
+                 bucket_size: int = 1000, table_reload_seconds: float = 600):
+        """fetch_rows(sql) -> (danh sách dòng dict, lỗi) như hrm_result.raw_rows."""
+        self._fetch_rows = fetch_rows
+        self._table_reload_seconds = table_reload_seconds
+        self._replica = replica
+        self._batch_size = batch_size
+        self._max_batches = max_batches
+        self._bucket_size = bucket_size
+        self._run_lock = threading.Lock()
+        self._generation = -1
+        self._listeners: List[Callable[[str, List[dict]], None]] = []
+        self._cursors: Dict[str, _TableCursor] = {}
+        for table in replica.tables:
+            types = replica.column_types(table)
+            column = next((col for col in CURSOR_COLUMNS if col in types), None)
+            self._cursors[table] = _TableCursor(table, column)
+
+    def subscribe(self, listener: Callable[[str, List[dict]], None]):
+        self._listeners.append(listener)
+
+    def _apply(self, table: str, rows: List[dict]) -> int:
+        applied = self._replica.apply_rows(table, rows)
+        if applied:
+            for listener in self._listeners:
+                try:
+                    listener(table, rows)
+                except Exception as e:
+                    print(f"[CHANGE CAPTURE] Listener lỗi ({table}): {e}")
+        return applied
+
+    # --- High-water mark ---
+    def _seed(self):
+        """Đặt high-water mark từ dữ liệu cục bộ sau mỗi lần bản sao nạp lại toàn bộ."""
+        now = time.time()
+        for table, cur in self._cursors.items():
+            if not self._replica.loaded(table):
+                continue
+            if cur.column:
+                cur.value = self._replica.local_rows(f'SELECT MAX("{cur.column}") FROM "{table}"')[0][0]
+                cur.last_id = self._replica.local_rows(
+                    f'SELECT MAX(id) FROM "{table}" WHERE "{cur.column}" = ?', (cur.value,)
+                )[0][0] or 0
+            else:
+                cur.last_id = self._replica.local_rows(f'SELECT MAX(id) FROM "{table}"')[0][0] or 0
+            cur.caught_up_at = now - (self._replica.lag(table) or 0)
+            cur.reloaded_at = cur.caught_up_at
+            cur.backlog = False
+        self._generation = self._replica.generation
+
+    def _batch_sql(self, cur: _TableCursor) -> str:
+        if not cur.column:
+            where, order = f"id > {int(cur.last_id)}", "id"
+        elif cur.value is None:
+            where, order = f"{cur.column} IS NOT NULL", f"{cur.column}, id"
+        else:
+            value = str(cur.value).replace("'", "''")
+            where = f"{cur.column} > '{value}' OR ({cur.column} = '{value}' AND id > {int(cur.last_id)})"
+            order = f"{cur.column}, id"
+        return f"""
+        SELECT * FROM {cur.table}
+        WHERE {where}
+        ORDER BY {order}
+        LIMIT {self._batch_size}
+        """
+
+    def _fetch(self, sql: str, cur: _TableCursor) -> Union[List[dict], None]:
+        try:
+            rows, error = self._fetch_rows(sql)
+        except Exception as e:
+            rows, error = None, str(e)
+        if error is not None:
+            cur.error = error
+            print(f"[CHANGE CAPTURE] {cur.table}: {error}")
+            return None
+        return [row for row in rows if isinstance(row, dict)]
+
+    # --- Poll thay đổi ---
+    def poll(self) -> int:
+        """Đọc dòng mới / đã đổi của mọi bảng, tối đa max_batches lô mỗi bảng. Trả về số dòng áp dụng."""
+        if not self._replica.ready:
+            return 0
+        with self._run_lock:
+            if self._generation != self._replica.generation:
+                self._seed()
+            return sum(self._poll_table(cur) for cur in self._cursors.values()
+                       if self._replica.loaded(cur.table))
+
+    def _poll_table(self, cur: _TableCursor) -> int:
+        started = time.time()
+        applied = 0
+        parent_ids = set()
+        for _ in range(self._max_batches):
+            rows = self._fetch(self._batch_sql(cur), cur)
+            if rows is None:
+                return applied
+            cur.error = None
+            applied += self._apply(cur.table, rows)
+            if rows:
+                last = rows[-1]
+                if cur.column:
+                    cur.value = normalize_value(last.get(cur.column), "datetime")
+                cur.last_id = _as_int(last.get("id"))
+            if cur.table in PARENT_FEEDS:
+                parent_ids.update(_as_int(row.get(PARENT_FEEDS[cur.table][1])) for row in rows)
+            if len(rows) < self._batch_size:
+                cur.backlog = False
+                cur.caught_up_at = started
+                if cur.column in COMPLETE_CURSORS:
+                    self._replica.mark_synced(cur.table, started)
+                elif cur.table in MUTABLE_WINDOWS:
+                    applied += self._poll_window(cur, started)
+                elif started - (cur.reloaded_at or 0) >= self._table_reload_seconds:
+                    applied += self._reload_table(cur, started)
+                break
+        else:
+            # Còn lô chưa đọc: để lần poll sau, tuổi dữ liệu giữ nguyên mốc bắt kịp cũ
+            cur.backlog = True
+            print(f"[CHANGE CAPTURE] {cur.table}: còn thay đổi chưa đọc sau {self._max_batches} lô")
+
+        if parent_ids:
+            applied += self._refetch(PARENT_FEEDS[cur.table][0], parent_ids)
+        cur.applied += applied
+        return applied
+
+    def _poll_window(self, cur: _TableCursor, started: float) -> int:
+        """Đọc lại cửa sổ còn sửa được; đọc đủ -> bảng đã bắt kịp HRM tại `started`."""
+        since = (date.today() - timedelta(days=1)).isoformat()
+        remote_where, local_where = (where.format(since=since) for where in MUTABLE_WINDOWS[cur.table])
+        limit = self._batch_size * self._max_batches
+        rows = self._fetch(f"SELECT * FROM {cur.table} WHERE {remote_where} LIMIT {limit + 1}", cur)
+        if rows is None:
+            return 0
+        local_ids = [row[0] for row in self._replica.local_rows(
+            f'SELECT id FROM "{cur.table}" WHERE {local_where}')]
+        if len(rows) > limit or len(local_ids) > limit:
+            # Cửa sổ quá lớn: không đọc trọn được, tuổi dữ liệu tính theo lần nạp lại
+            print(f"[CHANGE CAPTURE] {cur.table}: cửa sổ sửa tại chỗ quá {limit} dòng, bỏ qua")
+            return 0
+        seen = {_as_int(row.get("id")) for row in rows}
+        for chunk in _chunks([i for i in local_ids if i not in seen], self._batch_size):
+            left = self._fetch(f"SELECT * FROM {cur.table} WHERE id IN ({_ids_sql(chunk)})", cur)
+            if left is None:
+                return 0
+            rows.extend(left)
+        applied = self._apply(cur.table, self._replica.changed_rows(cur.table, rows))
+        self._replica.mark_synced(cur.table, started)
+        return applied
+
+    def _reload_table(self, cur: _TableCursor, started: float) -> int:
+        """Đọc lại cả bảng không có cột cập nhật: áp dụng dòng đã đổi, xóa dòng không còn ở HRM."""
+        rows = self._fetch(f"SELECT * FROM {cur.table}", cur)
+        if rows is None:
+            return 0
+        applied = self._apply(cur.table, self._replica.changed_rows(cur.table, rows))
+        remote_ids = {_as_int(row.get("id")) for row in rows}
+        local_ids = {row[0] for row in self._replica.local_rows(f'SELECT id FROM "{cur.table}"')}
+        cur.deleted += self._replica.delete_ids(cur.table, local_ids - remote_ids)
+        cur.reloaded_at = started
+        self._replica.mark_synced(cur.table, started)
+        return applied
+
+    def _refetch(self, table: str, ids: Iterable[int]) -> int:
+        cur = self._cursors.get(table)
+        if cur is None or not self._replica.loaded(table):
+            return 0
+        applied = 0
+        for chunk in _chunks(sorted(i for i in ids if i), self._batch_size):
+            rows = self._fetch(f"SELECT * FROM {table} WHERE id IN ({_ids_sql(chunk)})", cur)
+            if rows:
+                applied += self._apply(table, rows)
+        return applied
+
+    # --- Đối soát xóa ---
+    def reconcile(self) -> int:
+        """So checksum (COUNT, SUM(id)) theo khoảng id giữa HRM và bản sao; sửa các khoảng lệch."""
+        if not self._replica.ready:
+            return 0
+        fixed = 0
+        with self._run_lock:
+            for table, cur in self._cursors.items():
+                if self._replica.loaded(table):
+                    fixed += self._reconcile_table(cur)
+        return fixed
+
+    def _reconcile_table(self, cur: _TableCursor) -> int:
+        size = self._bucket_size
+        remote = self._fetch(f"""
+        SELECT FLOOR(id / {size}) AS bucket, COUNT(*) AS cnt, SUM(id) AS id_sum
+        FROM {cur.table}
+        GROUP BY FLOOR(id / {size})
+        """, cur)
+        if remote is None:
+            return 0
+        remote_sums = {_as_int(r.get("bucket")): (_as_int(r.get("cnt")), _as_int(r.get("id_sum"))) for r in remote}
+        local_sums = {
+            bucket: (cnt, id_sum or 0)
+            for bucket, cnt, id_sum in self._replica.local_rows(
+                f'SELECT id / ? AS bucket, COUNT(*), SUM(id) FROM "{cur.table}" GROUP BY id / ?', (size, size)
+            )
+        }
+        deleted = restored = 0
+        for bucket in sorted(set(remote_sums) | set(local_sums)):
+            if remote_sums.get(bucket) == local_sums.get(bucket):
+                continue
+            low, high = bucket * size, bucket * size + size - 1
+            rows = self._fetch(f"SELECT id FROM {cur.table} WHERE id BETWEEN {low} AND {high}", cur)
+            if rows is None:
+                continue
+            remote_ids = {_as_int(r.get("id")) for r in rows}
+            local_ids = {row[0] for row in self._replica.local_rows(
+                f'SELECT id FROM "{cur.table}" WHERE id BETWEEN ? AND ?', (low, high))}
+            deleted += self._replica.delete_ids(cur.table, local_ids - remote_ids)
+            restored += self._refetch(cur.table, remote_ids - local_ids)
+        cur.deleted += deleted
+        cur.restored += restored
+        if deleted or restored:
+            print(f"[CHANGE CAPTURE] Đối soát {cur.table}: xóa {deleted}, bổ sung {restored} dòng")
+        return deleted + restored
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            table: {
+                "cursor": cur.column or "id",
+                "captures_updates": ("cursor" if cur.column in COMPLETE_CURSORS
+                                     else "window" if table in MUTABLE_WINDOWS else "reload"),
+                "reloaded_at": cur.reloaded_at,
+                "high_water": cur.value if cur.column else cur.last_id,
+                "lag_seconds": round(now - cur.caught_up_at, 1) if cur.caught_up_at else None,
+                "backlog": cur.backlog,
+                "applied": cur.applied,
+                "deleted": cur.deleted,
+                "restored": cur.restored,
+                "error": cur.error,
+            }
+            for table, cur in self._cursors.items()
+        }
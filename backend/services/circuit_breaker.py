@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Union
+
+# ==========================================================
+# CIRCUIT BREAKER: ngắt nhanh khi HRM API lỗi / chậm
+# - closed: gọi bình thường, ghi kết quả vào cửa sổ `window` lần gần nhất
+# - Tỉ lệ lỗi hoặc tỉ lệ gọi chậm (> slow_call_seconds) vượt ngưỡng (đủ min_calls mẫu)
+#   -> open: mọi lời gọi ném CircuitOpen ngay, không mở socket / giữ thread 30s
+# - Hết open_seconds -> half_open: cho tối đa half_open_probes lời gọi thử;
+#   thử thành công -> closed, thất bại -> open lại từ đầu
+# Lỗi nghiệp vụ (HRM trả success=false cho SQL sai) không tính là lỗi gateway.
+# ==========================================================
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpen(Exception):
+    """Mạch đang mở: không gọi HRM, trả lỗi ngay."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} tạm ngắt, thử lại sau {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, window: int = 20, min_calls: int = 10,
+                 failure_rate: float = 0.5, slow_call_seconds: float = 5.0, slow_rate: float = 0.5,
+                 open_seconds: float = 30.0, half_open_probes: int = 1):
+        self.name = name
+        self._min_calls = min_calls
+        self._failure_rate = failure_rate
+        self._slow_call_seconds = slow_call_seconds
+        self._slow_rate = slow_rate
+        self._open_seconds = open_seconds
+        self._half_open_probes = half_open_probes
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        # (thất bại, chậm) của các lần gọi gần nhất
+        self._calls: deque = deque(maxlen=window)
+        self._counters = {"calls": 0, "failures": 0, "slow": 0, "rejected": 0, "opened": 0}
+        self._last_error: Union[str, None] = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self._open_seconds:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def _open(self, reason: str):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._calls.clear()
+        self._counters["opened"] += 1
+        print(f"[CIRCUIT {self.name}] Mở mạch: {reason}")
+
+    def before_call(self):
+        """Ném CircuitOpen nếu không được gọi; ngược lại caller phải gọi record() sau đó."""
+        with self._lock:
+            state = self._current_state()
+            if state == OPEN or (state == HALF_OPEN and self._probes >= self._half_open_probes):
+                self._counters["rejected"] += 1
+                retry_after = max(1.0, self._open_seconds - (time.monotonic() - self._opened_at))
+                raise CircuitOpen(self.name, retry_after)
+            if state == HALF_OPEN:
+                self._probes += 1
+
+    def record(self, success: bool, duration: float, error: Union[str, None] = None):
+        slow = duration > self._slow_call_seconds
+        with self._lock:
+            self._counters["calls"] += 1
+            self._counters["failures"] += int(not success)
+            self._counters["slow"] += int(slow)
+            if not success:
+                self._last_error = error
+            if self._state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if success and not slow:
+                    self._state = CLOSED
+                    self._calls.clear()
+                    print(f"[CIRCUIT {self.name}] Đóng mạch: lời gọi thử thành công")
+                else:
+                    self._open("lời gọi thử " + ("lỗi" if not success else f"chậm {duration:.1f}s"))
+                return
+            if self._state == OPEN:
+                return
+            self._calls.append((not success, slow))
+            if len(self._calls) < self._min_calls:
+                return
+            failures = sum(1 for failed, _ in self._calls if failed) / len(self._calls)
+            slow_calls = sum(1 for _, was_slow in self._calls if was_slow) / len(self._calls)
+            if failures >= self._failure_rate:
+                self._open(f"{failures:.0%} lỗi trong {len(self._calls)} lần gọi gần nhất ({error})")
+            elif slow_calls >= self._slow_rate:
+                self._open(f"{slow_calls:.0%} lời gọi chậm hơn {self._slow_call_seconds:.0f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            return {
+                "state": state,
+                "open_for_seconds": round(time.monotonic() - self._opened_at, 1) if state != CLOSED else None,
+                "window_calls": len(self._calls),
+                "last_error": self._last_error,
+                **self._counters,
+            }
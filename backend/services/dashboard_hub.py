@@ -0,0 +1,86 @@
+import asyncio
+import json
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, List, Tuple
+
+# ==========================================================
+# DASHBOARD HUB: đẩy thay đổi số liệu dashboard qua Server-Sent Events
+# Client đăng ký theo scope ('company' hoặc 'dept:<id>'); server chỉ gửi
+# phần số liệu thay đổi (delta) sau mỗi lần bộ đếm cập nhật, kèm heartbeat.
+# ==========================================================
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+class DashboardHub:
+    def __init__(self, snapshot_fn: Callable[[str], Dict], heartbeat_seconds: float = 15):
+        self._snapshot_fn = snapshot_fn
+        self._heartbeat = heartbeat_seconds
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._last: Dict[str, Dict] = {}
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subs) for subs in self._subscribers.values())
+
+    def _subscribe(self, scope: str) -> Tuple[asyncio.AbstractEventLoop, asyncio.Queue]:
+        entry = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers.setdefault(scope, []).append(entry)
+        return entry
+
+    def _unsubscribe(self, scope: str, entry):
+        with self._lock:
+            subs = self._subscribers.get(scope, [])
+            if entry in subs:
+                subs.remove(entry)
+            if not subs:
+                self._subscribers.pop(scope, None)
+                self._last.pop(scope, None)
+
+    def publish_all(self):
+        """
+        Tính lại snapshot cho các scope đang có người nghe và gửi delta nếu có thay đổi.
+        An toàn khi gọi từ thread nền (dùng call_soon_threadsafe). Subscriber có event loop đã đóng
+        (client ngắt kết nối mà generator chưa kịp dọn) bị bỏ, không làm hỏng lượt gửi cho người khác.
+        """
+        with self._lock:
+            scopes = {scope: list(subs) for scope, subs in self._subscribers.items()}
+        for scope, subs in scopes.items():
+            try:
+                snapshot = self._snapshot_fn(scope)
+            except Exception as e:
+                print(f"[DASHBOARD HUB] Lỗi tính snapshot {scope}: {e}")
+                continue
+            last = self._last.get(scope, {})
+            delta = {key: value for key, value in snapshot.items() if last.get(key) != value}
+            if not delta:
+                continue
+            self._last[scope] = snapshot
+            for entry in subs:
+                loop, queue = entry
+                try:
+                    loop.call_soon_threadsafe(queue.put_nowait, delta)
+                except RuntimeError as e:
+                    print(f"[DASHBOARD HUB] Bỏ subscriber {scope} đã đóng: {e}")
+                    self._unsubscribe(scope, entry)
+
+    async def stream(self, scope: str) -> AsyncIterator[str]:
+        """Generator SSE: snapshot đầy đủ -> các delta -> heartbeat khi không có thay đổi."""
+        entry = self._subscribe(scope)
+        try:
+            snapshot = self._snapshot_fn(scope)
+            self._last.setdefault(scope, snapshot)
+            yield sse_event("snapshot", snapshot)
+            while True:
+                try:
+                    delta = await asyncio.wait_for(entry[1].get(), timeout=self._heartbeat)
+                    yield sse_event("delta", delta)
+                except asyncio.TimeoutError:
+                    yield sse_event("heartbeat", {"ts": int(time.time())})
+        finally:
+            self._unsubscribe(scope, entry)
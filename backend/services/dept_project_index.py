@@ -0,0 +1,147 @@
+import re
+import threading
+import time
+from datetime import date
+from typing import Callable, Dict, List, Set, Union
+
+# ==========================================================
+# DEPARTMENT -> PROJECTS INDEX
+# du_an.phong_ban là text tự do (có thể nhiều phòng, ngăn bởi dấu phẩy...),
+# nên ánh xạ sang phong_ban.id được tính sẵn một lần trong bộ nhớ
+# thay vì quét `phong_ban LIKE '%ten_phong%'` ở mỗi request.
+# ==========================================================
+
+DONE_STATUSES = ('Đã hoàn thành', 'Kết thúc')
+NOT_OVERDUE_STATUSES = ('Đã hoàn thành', 'Kết thúc', 'Tạm ngưng')
+
+_SPLIT_PATTERN = re.compile(r"[,;/|\n]+")
+
+
+def _norm(text) -> str:
+    return " ".join(str(text or "").lower().split())
+
+
+def date_str(value) -> str:
+    """Chuẩn hóa giá trị ngày từ HRM ('2026-02-01', '2026-02-01T00:00:00'...) về 'YYYY-MM-DD'."""
+    return str(value or "")[:10]
+
+
+class DepartmentProjectIndex:
+    """
+    Ánh xạ phong_ban.id <-> du_an, nạp toàn bộ định kỳ và bổ sung dự án mới
+    (id lớn hơn id lớn nhất đã biết) giữa hai lần nạp toàn bộ.
+    """
+
+    DEPT_SQL = "SELECT id, ten_phong FROM phong_ban"
+    PROJECT_SQL = """
+    SELECT d.id, d.ten_du_an, d.trang_thai_duan, d.phong_ban, d.lead_id,
+           d.ngay_bat_dau, d.ngay_ket_thuc, nv.ho_ten as lead_name
+    FROM du_an d
+    LEFT JOIN nhanvien nv ON d.lead_id = nv.id
+    """
+
+    def __init__(self, fetch_rows: Callable[[str], List[Dict]]):
+        self._fetch_rows = fetch_rows
+        self._lock = threading.Lock()
+        self._dept_names: Dict[int, str] = {}
+        self._projects: Dict[int, Dict] = {}
+        self._by_dept: Dict[int, Set[int]] = {}
+        self._max_project_id = 0
+        self.loaded_at: Union[float, None] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    # --- Ánh xạ text phong_ban -> id phòng ---
+    def match_departments(self, phong_ban_text: str, dept_names: Dict[int, str] = None) -> Set[int]:
+        """
+        Tách du_an.phong_ban theo dấu phân cách và so khớp chính xác với ten_phong.
+        Phần không khớp chính xác thì lấy tên phòng DÀI NHẤT nằm trong nó,
+        tránh việc 'Kinh doanh' khớp nhầm 'Kinh doanh quốc tế'.
+        """
+        dept_names = self._dept_names if dept_names is None else dept_names
+        by_name = {_norm(name): dept_id for dept_id, name in dept_names.items() if name}
+        matched = set()
+        for part in _SPLIT_PATTERN.split(str(phong_ban_text or "")):
+            token = _norm(part)
+            if not token:
+                continue
+            if token in by_name:
+                matched.add(by_name[token])
+                continue
+            contained = [name for name in by_name if name in token]
+            if contained:
+                matched.add(by_name[max(contained, key=len)])
+        return matched
+
+    # --- Nạp dữ liệu ---
+    def refresh(self) -> int:
+        """Nạp lại toàn bộ phòng ban + dự án (bắt được cả thay đổi trạng thái / tên phòng)."""
+        dept_rows = self._fetch_rows(self.DEPT_SQL)
+        project_rows = self._fetch_rows(self.PROJECT_SQL)
+        if not dept_rows:
+            return 0
+
+        dept_names = {row['id']: row.get('ten_phong', '') for row in dept_rows if isinstance(row, dict)}
+        projects = {}
+        by_dept: Dict[int, Set[int]] = {dept_id: set() for dept_id in dept_names}
+        for row in project_rows:
+            if not isinstance(row, dict):
+                continue
+            projects[row['id']] = row
+            for dept_id in self.match_departments(row.get('phong_ban'), dept_names):
+                by_dept[dept_id].add(row['id'])
+
+        with self._lock:
+            self._dept_names = dept_names
+            self._projects = projects
+            self._by_dept = by_dept
+            self._max_project_id = max(projects, default=0)
+            self.loaded_at = time.time()
+
+        print(f"[DEPT PROJECT INDEX] {len(dept_names)} phòng ban, {len(projects)} dự án")
+        return len(projects)
+
+    def refresh_incremental(self) -> int:
+        """Chỉ lấy dự án mới tạo (id > id lớn nhất đã biết)."""
+        if not self.ready:
+            return self.refresh()
+        rows = self._fetch_rows(self.PROJECT_SQL + f" WHERE d.id > {int(self._max_project_id)}")
+        added = 0
+        with self._lock:
+            for row in rows:
+                if not isinstance(row, dict):
+                    continue
+                self._projects[row['id']] = row
+                for dept_id in self.match_departments(row.get('phong_ban')):
+                    self._by_dept.setdefault(dept_id, set()).add(row['id'])
+                self._max_project_id = max(self._max_project_id, row['id'])
+                added += 1
+        if added:
+            print(f"[DEPT PROJECT INDEX] +{added} dự án mới")
+        return added
+
+    # --- Tra cứu ---
+    def dept_name(self, dept_id: int) -> str:
+        return self._dept_names.get(dept_id, "")
+
+    def projects_for(self, dept_id: int) -> List[Dict]:
+        with self._lock:
+            return [self._projects[pid] for pid in self._by_dept.get(dept_id, ()) if pid in self._projects]
+
+    def project_stats(self, dept_id: int, today: str = None) -> Dict:
+        """Thống kê dự án của phòng: đang chạy, đang thực hiện, danh sách trễ hạn."""
+        today = today or date.today().isoformat()
+        projects = self.projects_for(dept_id)
+        open_projects = [p for p in projects if p.get('trang_thai_duan') not in DONE_STATUSES]
+        overdue = [
+            p for p in open_projects
+            if p.get('ngay_ket_thuc') and date_str(p['ngay_ket_thuc']) < today
+            and p.get('trang_thai_duan') not in NOT_OVERDUE_STATUSES
+        ]
+        return {
+            "total_projects": len(open_projects),
+            "active_projects": sum(1 for p in projects if p.get('trang_thai_duan') == 'Đang thực hiện'),
+            "overdue": overdue,
+        }
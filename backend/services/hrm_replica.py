@@ -0,0 +1,453 @@
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import deque
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Set, Tuple, Union
+
+from services.hrm_result import HRMResult
+
+# ==========================================================
+# HRM REPLICA: bản sao chỉ-đọc các bảng HRM trong SQLite (in-memory)
+# - Nạp toàn bộ từng bảng qua execute-sql, ghi vào DB mới rồi hoán đổi (atomic)
+# - Câu SELECT đã validate được dịch phương ngữ MySQL/MSSQL -> SQLite
+#   (CURDATE, YEAR, DATE_FORMAT, CONCAT, N'...', LIKE không phân biệt hoa thường...)
+# - Giữ kết quả giống HRM: phép chia luôn ra số thực (7/2 = 3.5 như MySQL), cột chữ so sánh /
+#   GROUP BY không phân biệt hoa thường (collation HRM_CI, kể cả chữ có dấu), DATE_FORMAT
+#   chỉ nhận định dạng đã ánh xạ; định dạng lạ -> lỗi -> API từ xa
+# - Bảng chưa nạp / quá hạn, cú pháp không hỗ trợ, lỗi SQLite -> trả None
+#   để caller gọi API từ xa như cũ
+# ==========================================================
+
+# Bảng cấu hình / phân quyền không phục vụ truy vấn đọc của chatbot
+EXCLUDED_TABLES = {"cau_hinh_he_thong", "phan_quyen_chuc_nang", "luong_cau_hinh", "nhanvien_quyen", "quyen"}
+
+SQLITE_TYPES = {
+    "int": "INTEGER", "bigint": "INTEGER", "boolean": "INTEGER", "tinyint": "INTEGER",
+    "float": "REAL", "decimal": "REAL", "double": "REAL",
+}
+
+# Cú pháp SQLite không có tương đương an toàn -> chuyển sang API từ xa
+# (window function chỉ có từ SQLite 3.25)
+_UNSUPPORTED = re.compile(
+    r"\bINTERVAL\b|\bDATE_(SUB|ADD)\b|\bDATEADD\b|\bTOP\s+\d|\bOUTPUT\b|\bCONVERT\s*\(|\bCAST\s*\(.*\bAS\s+DATE\b"
+    r"|(CURDATE\(\)|CURRENT_DATE|GETDATE\(\)|NOW\(\))\s*[-+]"
+    + (r"|\bOVER\s*\(" if sqlite3.sqlite_version_info < (3, 25) else ""),
+    re.IGNORECASE,
+)
+_TABLE_REF = re.compile(r"\b(?:FROM|JOIN)\s+(?:dbo\.)?\[?([A-Za-z_]\w*)\]?", re.IGNORECASE)
+_SCHEMA_TABLE = re.compile(r"^BẢNG\s+(\w+)(\s*\(nodata\))?", re.MULTILINE)
+_SCHEMA_COLUMN = re.compile(r"^-\s*(\w+)\s*\((\w+)\)")
+
+# Kiểu HRM lưu dạng chuỗi nhưng so sánh theo thứ tự thời gian -> không dùng collation HRM_CI
+_TEMPORAL_TYPES = ("date", "datetime", "time")
+
+# DATE_FORMAT của MySQL (tên tháng / thứ tiếng Anh như lc_time_names mặc định)
+_MYSQL_FORMAT = {
+    "%Y": lambda m: f"{m.year:04d}", "%y": lambda m: f"{m.year % 100:02d}",
+    "%m": lambda m: f"{m.month:02d}", "%c": lambda m: str(m.month),
+    "%M": lambda m: m.strftime("%B"), "%b": lambda m: m.strftime("%b"),
+    "%d": lambda m: f"{m.day:02d}", "%e": lambda m: str(m.day), "%j": lambda m: m.strftime("%j"),
+    "%W": lambda m: m.strftime("%A"), "%a": lambda m: m.strftime("%a"),
+    "%H": lambda m: f"{m.hour:02d}", "%k": lambda m: str(m.hour),
+    "%h": lambda m: m.strftime("%I"), "%I": lambda m: m.strftime("%I"), "%l": lambda m: str(m.hour % 12 or 12),
+    "%i": lambda m: f"{m.minute:02d}", "%s": lambda m: f"{m.second:02d}", "%S": lambda m: f"{m.second:02d}",
+    "%p": lambda m: "AM" if m.hour < 12 else "PM", "%T": lambda m: m.strftime("%H:%M:%S"),
+    "%f": lambda m: f"{m.microsecond:06d}", "%%": lambda m: "%",
+}
+_FORMAT_SPEC = re.compile(r"%.")
+# Dấu chia (không phải /* */), bỏ qua nội dung chuỗi '...'
+_DIVISION = re.compile(r"'(?:[^']|'')*'|(?<!\*)/(?!\*)")
+
+
+def parse_schema(schema_text: str) -> Dict[str, List[Tuple[str, str]]]:
+    """Đọc core/schema_hrm.HRM_SCHEMA -> {bảng: [(cột, kiểu HRM)]}, bỏ bảng (nodata)."""
+    tables: Dict[str, List[Tuple[str, str]]] = {}
+    current = None
+    for line in schema_text.splitlines():
+        line = line.strip()
+        m = _SCHEMA_TABLE.match(line)
+        if m:
+            current = None if m.group(2) else m.group(1)
+            if current:
+                tables[current] = []
+            continue
+        m = _SCHEMA_COLUMN.match(line)
+        if m and current:
+            tables[current].append((m.group(1), m.group(2).lower()))
+    return tables
+
+
+def normalize_value(value: Any, hrm_type: str = "") -> Any:
+    """Đưa giá trị về dạng MySQL so sánh được bằng chuỗi:
+    date '2026-02-01T00:00:00' -> '2026-02-01', datetime -> '2026-02-01 08:00:00', time -> '08:00:00'."""
+    if isinstance(value, str) and hrm_type in ("date", "datetime", "time"):
+        text = value.replace("T", " ")
+        if hrm_type == "date" and len(text) >= 10 and text[4] == "-":
+            return text[:10]
+        if hrm_type == "datetime" and len(text) >= 19 and text[4] == "-":
+            return text[:19]
+        if hrm_type == "time" and len(text) > 8:
+            return text[-8:] if text[-3] == ":" else text
+        return text
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (dict, list)):
+        return str(value)
+    return value
+
+
+def _same_value(remote: Any, local: Any) -> bool:
+    """So giá trị HRM với giá trị SQLite đã lưu (12 và 12.0, 5 và '5' là như nhau)."""
+    if remote is None or local is None:
+        return remote is local
+    if isinstance(remote, (int, float)) and isinstance(local, (int, float)):
+        return float(remote) == float(local)
+    return str(remote) == str(local)
+
+
+def referenced_tables(sql: str) -> Set[str]:
+    return {name.lower() for name in _TABLE_REF.findall(sql)}
+
+
+def translate_sql(sql: str) -> Union[str, None]:
+    """Dịch câu SELECT sang SQLite; None nếu không hỗ trợ."""
+    text = sql.strip().rstrip(";").strip()
+    if not re.match(r"^(SELECT|WITH)\b", text, re.IGNORECASE) or ";" in text or _UNSUPPORTED.search(text):
+        return None
+    text = re.sub(r"\bN'", "'", text)
+    text = re.sub(r"\bdbo\.", "", text, flags=re.IGNORECASE)
+    text = re.sub(r"\bCURRENT_DATE\b(?!\s*\()", "CURDATE()", text, flags=re.IGNORECASE)
+    text = re.sub(r"\bCURRENT_TIMESTAMP\b(?!\s*\()", "NOW()", text, flags=re.IGNORECASE)
+    # SQLite chia nguyên cắt phần thập phân (COUNT(*)*100/3 = 33); MySQL trả 33.3333.
+    # `* 1.0` chèn ngay trước `/` cùng độ ưu tiên, kết hợp trái -> không đổi thứ tự tính
+    text = _DIVISION.sub(lambda m: m.group(0) if m.group(0) != "/" else " * 1.0 /", text)
+    return text
+
+
+# --- Hàm MySQL / MSSQL đăng ký cho SQLite ---
+def _to_date(value) -> Union[date, None]:
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _date_format(value, fmt):
+    if value is None or fmt is None:
+        return None
+    text = str(value)
+    try:
+        moment = datetime.fromisoformat(text) if len(text) > 8 else datetime.strptime(text[:8], "%H:%M:%S")
+    except ValueError:
+        return None
+
+    def render(m):
+        spec = _MYSQL_FORMAT.get(m.group(0))
+        if spec is None:
+            # Lỗi trong hàm -> sqlite3.Error -> truy vấn chuyển sang API thay vì trả sai định dạng
+            raise ValueError(f"DATE_FORMAT chưa hỗ trợ {m.group(0)}")
+        return spec(moment)
+    return _FORMAT_SPEC.sub(render, str(fmt))
+
+
+def _datediff(a, b):
+    da, db = _to_date(a), _to_date(b)
+    return (da - db).days if da and db else None
+
+
+def _fold(text: str) -> str:
+    return unicodedata.normalize("NFC", text).casefold()
+
+
+@lru_cache(maxsize=512)
+def _like_regex(pattern: str, escape: Union[str, None]) -> "re.Pattern":
+    out, i = [], 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if escape and ch == escape and i + 1 < len(pattern):
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        out.append(".*" if ch == "%" else "." if ch == "_" else re.escape(ch))
+        i += 1
+    return re.compile("".join(out), re.DOTALL)
+
+
+def _like(pattern, value, escape=None):
+    """LIKE không phân biệt hoa thường kể cả chữ có dấu (giống collation _ci của HRM)."""
+    if pattern is None or value is None:
+        return None
+    return _like_regex(_fold(str(pattern)), escape).fullmatch(_fold(str(value))) is not None
+
+
+def _collate_ci(a: str, b: str) -> int:
+    a, b = _fold(a), _fold(b)
+    return (a > b) - (a < b)
+
+
+def _register_functions(conn: sqlite3.Connection):
+    conn.create_collation("HRM_CI", _collate_ci)
+    conn.create_function("CURDATE", 0, lambda: date.today().isoformat())
+    conn.create_function("NOW", 0, lambda: datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    conn.create_function("GETDATE", 0, lambda: datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    conn.create_function("YEAR", 1, lambda v: _to_date(v).year if _to_date(v) else None)
+    conn.create_function("MONTH", 1, lambda v: _to_date(v).month if _to_date(v) else None)
+    conn.create_function("DAY", 1, lambda v: _to_date(v).day if _to_date(v) else None)
+    conn.create_function("DATE_FORMAT", 2, _date_format)
+    conn.create_function("DATEDIFF", 2, _datediff)
+    conn.create_function("CONCAT", -1, lambda *parts: None if any(p is None for p in parts) else "".join(str(p) for p in parts))
+    conn.create_function("ISNULL", 2, lambda v, d: d if v is None else v)
+    conn.create_function("LEN", 1, lambda v: None if v is None else len(str(v)))
+    conn.create_function("like", 2, _like)
+    conn.create_function("like", 3, _like)
+
+
+def _new_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    _register_functions(conn)
+    return conn
+
+
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class HRMReplica:
+    def __init__(self, fetch_rows: Callable[[str], Tuple[Union[list, None], Union[str, None]]],
+                 schema_text: str, max_staleness: float = 900,
+                 table_staleness: Union[Dict[str, float], None] = None):
+        """
+        fetch_rows(sql) -> (danh sách dòng dict, lỗi) như hrm_result.raw_rows.
+        table_staleness: ngưỡng quá hạn riêng của từng bảng (bảng dữ liệu trong ngày như cham_cong
+        cần chặt hơn max_staleness).
+        """
+        self._fetch_rows = fetch_rows
+        self._tables = {name: cols for name, cols in parse_schema(schema_text).items() if name not in EXCLUDED_TABLES}
+        self._max_staleness = max_staleness
+        self._table_staleness = dict(table_staleness or {})
+        self._lock = threading.RLock()
+        self._conn: Union[sqlite3.Connection, None] = None
+        self._columns: Dict[str, List[str]] = {}
+        self._synced_at: Dict[str, float] = {}
+        self._row_counts: Dict[str, int] = {}
+        # Tăng mỗi lần nạp lại toàn bộ; change capture dựa vào đây để đặt lại high-water mark
+        self.generation = 0
+        self._hits = 0
+        self._stale_hits = 0
+        self._fallbacks: Dict[str, int] = {}
+        self._latency = deque(maxlen=500)
+
+    @property
+    def ready(self) -> bool:
+        return self._conn is not None
+
+    @property
+    def tables(self) -> List[str]:
+        return list(self._tables)
+
+    def column_types(self, table: str) -> Dict[str, str]:
+        return dict(self._tables.get(table, []))
+
+    # --- Nạp dữ liệu ---
+    @staticmethod
+    def _column_type(hrm_type: Union[str, None]) -> str:
+        if hrm_type in SQLITE_TYPES:
+            return SQLITE_TYPES[hrm_type]
+        # Cột chữ so sánh không phân biệt hoa thường như collation _ci của HRM
+        return "TEXT" if hrm_type in _TEMPORAL_TYPES else "TEXT COLLATE HRM_CI"
+
+    def _create_table(self, conn: sqlite3.Connection, table: str, rows: list) -> List[str]:
+        declared = dict(self._tables.get(table, []))
+        columns = list(declared)
+        seen = set(columns)
+        for row in rows[:100]:
+            for key in row:
+                if key not in seen:
+                    seen.add(key)
+                    columns.append(key)
+        col_defs = ", ".join(
+            f'"{col}" {self._column_type(declared.get(col))}' + (" PRIMARY KEY" if col == "id" else "")
+            for col in columns
+        )
+        conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+        conn.execute(f'CREATE TABLE "{table}" ({col_defs})')
+        return columns
+
+    def _insert(self, conn: sqlite3.Connection, table: str, columns: List[str], rows: Iterable[dict]):
+        types = dict(self._tables.get(table, []))
+        placeholders = ", ".join("?" for _ in columns)
+        names = ", ".join(f'"{col}"' for col in columns)
+        conn.executemany(
+            f'INSERT OR REPLACE INTO "{table}" ({names}) VALUES ({placeholders})',
+            ([normalize_value(row.get(col), types.get(col, "")) for col in columns] for row in rows),
+        )
+
+    def refresh(self) -> int:
+        """Nạp lại toàn bộ các bảng vào một DB mới rồi hoán đổi. Trả về số bảng nạp được."""
+        conn = _new_connection()
+        columns: Dict[str, List[str]] = {}
+        synced_at: Dict[str, float] = {}
+        counts: Dict[str, int] = {}
+        for table in self._tables:
+            started = time.time()
+            try:
+                rows, error = self._fetch_rows(f"SELECT * FROM {table}")
+            except Exception as e:
+                rows, error = None, str(e)
+            if error is not None:
+                # Bảng nạp lỗi không được đánh dấu đã đồng bộ -> truy vấn vào bảng này đi API
+                print(f"[HRM REPLICA] Lỗi nạp bảng {table}: {error}")
+                continue
+            rows = [row for row in rows if isinstance(row, dict)]
+            columns[table] = self._create_table(conn, table, rows)
+            self._insert(conn, table, columns[table], rows)
+            synced_at[table] = started
+            counts[table] = len(rows)
+        conn.commit()
+        with self._lock:
+            old, self._conn = self._conn, conn
+            self._columns, self._synced_at, self._row_counts = columns, synced_at, counts
+            self.generation += 1
+        if old is not None:
+            old.close()
+        print(f"[HRM REPLICA] Nạp {len(columns)}/{len(self._tables)} bảng, {sum(counts.values())} dòng")
+        return len(columns)
+
+    # --- Cập nhật tăng dần (change capture) ---
+    def loaded(self, table: str) -> bool:
+        return table in self._columns
+
+    def apply_rows(self, table: str, rows: List[dict]) -> int:
+        """Upsert các dòng mới / đã đổi theo id; cột lạ (không có trong bảng cục bộ) bị bỏ qua."""
+        rows = [row for row in rows if isinstance(row, dict)]
+        if not rows or not self.loaded(table):
+            return 0
+        with self._lock:
+            self._insert(self._conn, table, self._columns[table], rows)
+            self._conn.commit()
+            self._row_counts[table] = self._count(table)
+        return len(rows)
+
+    def delete_ids(self, table: str, ids: Iterable[int]) -> int:
+        ids = [int(i) for i in ids]
+        if not ids or not self.loaded(table):
+            return 0
+        with self._lock:
+            self._conn.executemany(f'DELETE FROM "{table}" WHERE id = ?', ((i,) for i in ids))
+            self._conn.commit()
+            self._row_counts[table] = self._count(table)
+        return len(ids)
+
+    def changed_rows(self, table: str, rows: List[dict]) -> List[dict]:
+        """Dòng mới hoặc khác bản cục bộ (đọc lại cả cửa sổ / cả bảng mà không áp dụng dòng không đổi)."""
+        if not self.loaded(table):
+            return []
+        types = dict(self._tables.get(table, []))
+        with self._lock:
+            columns = self._columns[table]
+            ids = [row.get("id") for row in rows if row.get("id") is not None]
+            local = {}
+            names = ", ".join(f'"{col}"' for col in columns)
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                for values in self._conn.execute(
+                        f'SELECT {names} FROM "{table}" WHERE id IN ({", ".join("?" for _ in chunk)})', chunk):
+                    local[values[columns.index("id")]] = values
+        changed = []
+        for row in rows:
+            current = local.get(row.get("id"))
+            if current is None or any(not _same_value(normalize_value(row.get(col), types.get(col, "")), value)
+                                      for col, value in zip(columns, current)):
+                changed.append(row)
+        return changed
+
+    def local_rows(self, sql: str, params: tuple = ()) -> List[tuple]:
+        """Chạy SQL SQLite trực tiếp trên bản sao (không dịch, không đếm hit)."""
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall() if self._conn else []
+
+    def mark_synced(self, table: str, at: float):
+        """Bảng đã bắt kịp HRM tại thời điểm `at` (tính tuổi dữ liệu cho kiểm tra quá hạn)."""
+        with self._lock:
+            if self.loaded(table):
+                self._synced_at[table] = at
+
+    def _count(self, table: str) -> int:
+        return self._conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+
+    def lag(self, table: str) -> Union[float, None]:
+        synced = self._synced_at.get(table)
+        return None if synced is None else time.time() - synced
+
+    def max_staleness(self, table: str) -> float:
+        return self._table_staleness.get(table, self._max_staleness)
+
+    # --- Truy vấn ---
+    def _fallback(self, reason: str):
+        with self._lock:
+            self._fallbacks[reason] = self._fallbacks.get(reason, 0) + 1
+
+    def query(self, sql: str, allow_stale: bool = False) -> Union[HRMResult, None]:
+        """HRMResult từ bản sao; None nếu phải gọi API từ xa (bảng thiếu / quá hạn / không hỗ trợ / lỗi).
+        allow_stale: HRM đang ngắt mạch -> bỏ qua ngưỡng quá hạn, dữ liệu cũ vẫn hơn không có;
+        kết quả khi đó mang stale_seconds để câu trả lời ghi rõ dữ liệu cũ."""
+        if not self.ready:
+            self._fallback("not_ready")
+            return None
+        translated = translate_sql(sql)
+        if translated is None:
+            self._fallback("unsupported")
+            return None
+        tables = referenced_tables(translated)
+        if not tables or any(t not in self._synced_at for t in tables):
+            self._fallback("missing_table")
+            return None
+        stale = any(self.lag(t) > self.max_staleness(t) for t in tables)
+        if stale and not allow_stale:
+            self._fallback("stale")
+            return None
+
+        started = time.perf_counter()
+        try:
+            with self._lock:
+                cursor = self._conn.execute(translated)
+                rows = cursor.fetchall()
+                columns = tuple(d[0] for d in cursor.description or ())
+        except sqlite3.Error as e:
+            print(f"[HRM REPLICA] Không chạy được trên bản sao ({e}), chuyển sang API")
+            self._fallback("sqlite_error")
+            return None
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._hits += 1
+            self._stale_hits += int(stale)
+            self._latency.append(elapsed)
+        return HRMResult(columns, rows, stale_seconds=max(self.lag(t) for t in tables) if stale else None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            fallbacks = sum(self._fallbacks.values())
+            total = self._hits + fallbacks
+            return {
+                "ready": self.ready,
+                "hits": self._hits,
+                "stale_hits": self._stale_hits,
+                "fallbacks": dict(self._fallbacks),
+                "hit_rate": round(self._hits / total, 3) if total else None,
+                "p50_ms": round(_percentile(self._latency, 50) * 1000, 2),
+                "p95_ms": round(_percentile(self._latency, 95) * 1000, 2),
+                "tables": {
+                    table: {"rows": self._row_counts.get(table, 0), "lag_seconds": round(self.lag(table) or 0, 1),
+                            "max_staleness": self.max_staleness(table)}
+                    for table in self._synced_at
+                },
+            }
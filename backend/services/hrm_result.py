@@ -0,0 +1,124 @@
+from typing import Any, Dict, Iterator, List, Tuple, Union
+
+# ==========================================================
+# HRM RESULT: giải mã thống nhất response của execute-sql
+# Gateway trả về {'data': [...]}, list, {'success': False, 'error': ...}
+# hoặc chuỗi lỗi. HRMResult gom mọi dạng đó về một kiểu:
+# - tên cột lưu một lần, mỗi dòng là tuple (nhẹ hơn dict lặp tên cột)
+# - biến thể lỗi rõ ràng (ok = False, error = thông báo)
+# - slice() dùng chung danh sách dòng gốc, không sao chép
+# - stale_seconds: tuổi dữ liệu khi bản sao phục vụ quá hạn (HRM ngắt mạch); None = dữ liệu hiện hành
+# ==========================================================
+
+NO_RESPONSE = "Không có phản hồi từ hệ thống dữ liệu"
+
+
+def raw_rows(raw: Any) -> Tuple[Union[list, None], Union[str, None]]:
+    """(danh sách dòng gốc, lỗi) từ response thô; nơi duy nhất phân nhánh theo dạng response."""
+    if raw is None:
+        return None, NO_RESPONSE
+    if isinstance(raw, str):
+        return None, raw
+    if isinstance(raw, dict):
+        if raw.get('success') == False:
+            return None, str(raw.get('error') or raw.get('message') or 'Unknown error')
+        data = raw.get('data')
+        if data is None:
+            return [], None
+        return (data if isinstance(data, list) else [data]), None
+    if isinstance(raw, list):
+        return raw, None
+    return None, f"Response không hợp lệ: {type(raw).__name__}"
+
+
+def rejected(raw: Any) -> bool:
+    """HRM đã nhận câu lệnh nhưng từ chối (success=false: lỗi SQL / ràng buộc), khác lỗi kết nối."""
+    return isinstance(raw, dict) and raw.get('success') == False
+
+
+class HRMResult:
+    __slots__ = ("columns", "_rows", "_start", "_stop", "error", "_index", "stale_seconds")
+
+    def __init__(self, columns: Tuple[str, ...] = (), rows: List[tuple] = None,
+                 error: Union[str, None] = None, start: int = 0, stop: Union[int, None] = None,
+                 stale_seconds: Union[float, None] = None):
+        self.columns = columns
+        self._rows = rows if rows is not None else []
+        self._start = start
+        self._stop = len(self._rows) if stop is None else stop
+        self.error = error
+        self._index = None
+        self.stale_seconds = stale_seconds
+
+    @classmethod
+    def decode(cls, raw: Any) -> "HRMResult":
+        data, error = raw_rows(raw)
+        if error is not None:
+            return cls(error=error)
+        columns: List[str] = []
+        seen = set()
+        for item in data:
+            for key in (item if isinstance(item, dict) else ("value",)):
+                if key not in seen:
+                    seen.add(key)
+                    columns.append(key)
+        rows = [
+            tuple(item.get(col) for col in columns) if isinstance(item, dict) else (item,)
+            for item in data
+        ]
+        return cls(tuple(columns), rows)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def __iter__(self) -> Iterator[tuple]:
+        rows = self._rows
+        for i in range(self._start, self._stop):
+            yield rows[i]
+
+    def __repr__(self) -> str:
+        if not self.ok:
+            return f"HRMResult(error={self.error!r})"
+        return f"HRMResult(columns={list(self.columns)}, rows={len(self)})"
+
+    def _col(self, name: str) -> int:
+        if self._index is None:
+            self._index = {col: i for i, col in enumerate(self.columns)}
+        return self._index[name]
+
+    def slice(self, start: int = 0, stop: Union[int, None] = None) -> "HRMResult":
+        """Xem một đoạn dòng (preview / phân trang) mà không sao chép dữ liệu."""
+        length = len(self)
+        start = max(0, min(start, length))
+        stop = length if stop is None else max(start, min(stop, length))
+        return HRMResult(self.columns, self._rows, self.error, self._start + start, self._start + stop,
+                         self.stale_seconds)
+
+    def row(self, i: int) -> Dict[str, Any]:
+        return dict(zip(self.columns, self._rows[self._start + i]))
+
+    def first(self) -> Union[Dict[str, Any], None]:
+        return self.row(0) if len(self) else None
+
+    def scalar(self, column: str = None, default: Any = None) -> Any:
+        """Giá trị ô đầu tiên (hoặc cột chỉ định) của dòng đầu; default nếu rỗng / lỗi."""
+        if not len(self) or (column and column not in self.columns):
+            return default
+        value = self._rows[self._start][self._col(column) if column else 0]
+        return default if value is None else value
+
+    def column(self, name: str) -> list:
+        i = self._col(name)
+        return [row[i] for row in self]
+
+    def dicts(self) -> List[Dict[str, Any]]:
+        """Dạng list dict (cho code / prompt cần tên cột trên từng dòng)."""
+        columns = self.columns
+        return [dict(zip(columns, row)) for row in self]
+
+    def to_columnar(self) -> Dict[str, list]:
+        return {"columns": list(self.columns), "rows": list(self)}
@@ -0,0 +1,280 @@
+import re
+import threading
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Union
+
+# ==========================================================
+# INTENT ENGINE: đường tắt cho các câu hỏi hay gặp nhất
+# Bộ phân loại cục bộ (regex trên câu hỏi đã chuẩn hóa) nhận diện intent,
+# điền slot có kiểu (ngày, người, phòng ban) rồi chạy câu SQL mẫu đã kiểm duyệt
+# và diễn đạt câu trả lời bằng template -> bỏ qua cả 2 lần gọi LLM.
+# Không khớp / slot mơ hồ / HRM lỗi -> trả None để đi tiếp đường LLM.
+# ==========================================================
+
+LATE_THRESHOLD = '08:06:00'
+
+# Neo theo ranh giới từ ("tôi" không khớp trong "thôi"); bỏ "em" vì vừa là ngôi thứ nhất
+# vừa là cách gọi người khác ("em Lan") và dễ khớp nhầm
+_FIRST_PERSON = r"(?<!\w)(tôi|mình|tui|tớ)(?!\w)"
+# Câu có thể hỏi về chính người hỏi (rộng hơn _FIRST_PERSON, gồm cả "em"): dùng để tách khóa gộp request
+_PERSONAL = re.compile(r"(?<!\w)(tôi|mình|tui|tớ|tao|em)(?!\w)")
+# Câu nhắc tới người / phòng ban khác ("anh Nam", "phòng Kinh doanh") -> không phải hỏi về bản thân
+_OTHER_SUBJECT = re.compile(r"(?<!\w)(anh|chị|em|cô|chú|bác|bạn|ông|bà|nhân viên|phòng)(?!\w) (?!ơi\b)\w")
+# Câu hỏi nối tiếp ngữ cảnh hoặc cần tổng hợp -> để LLM xử lý
+_FOLLOW_UP = re.compile(r"^(còn|thế còn|vậy còn|so với|chi tiết|cụ thể)|so sánh|thống kê|xu hướng|tỉ lệ|tỷ lệ")
+# Yêu cầu xuất báo cáo Word cần câu tóm tắt của LLM
+_EXPORT = re.compile(r"word|docx|van ban|xuat|xuất|file")
+# Mốc thời gian chưa hỗ trợ trong slot ngày -> không đoán
+_UNSUPPORTED_PERIOD = re.compile(r"tuần|tháng|năm ngoái|năm trước|quý|từ ngày|đến ngày|gần đây|mấy ngày")
+_EXPLICIT_DATE = re.compile(r"\b(\d{1,2})[/-](\d{1,2})(?:[/-](\d{4}))?\b")
+# Phủ định / xếp hạng / tần suất / nhiều kỳ ("ai không đi muộn", "đi muộn nhiều nhất", "hay đi muộn",
+# "quá 3 lần", "tháng này") -> không phải danh sách đi muộn trong một ngày
+_NOT_LATE_LIST = r"^(?!.*(?<!\w)((không|chưa) (đi|bị)|nhất|hay|thường|lần|tháng|tuần)(?!\w))"
+_TIME = re.compile(r"(\d{1,2}):(\d{2})(?::(\d{2}))?")
+
+
+class IntentResult(NamedTuple):
+    intent: str
+    sql: str
+    data: Any
+    answer: str
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split()).rstrip(" ?.!")
+
+
+def parse_date_slot(q: str, today: date = None) -> Union[date, None]:
+    """'hôm nay' (mặc định) / 'hôm qua' / 'dd/mm[/yyyy]'; None nếu mốc thời gian không hỗ trợ."""
+    today = today or date.today()
+    if _UNSUPPORTED_PERIOD.search(q):
+        return None
+    if "hôm kia" in q:
+        return today - timedelta(days=2)
+    if "hôm qua" in q:
+        return today - timedelta(days=1)
+    m = _EXPLICIT_DATE.search(q)
+    if m:
+        try:
+            return date(int(m.group(3) or today.year), int(m.group(2)), int(m.group(1)))
+        except ValueError:
+            return None
+    return today
+
+
+def day_label(day: date, today: date = None) -> str:
+    today = today or date.today()
+    if day == today:
+        return "hôm nay"
+    if day == today - timedelta(days=1):
+        return "hôm qua"
+    return f"ngày {day.strftime('%d/%m/%Y')}"
+
+
+def time_str(value) -> str:
+    """Giờ từ HRM ('08:01:00', '08:01:00.123', '2026-02-01T08:01:00'...) -> 'HH:MM:SS'."""
+    text = str(value or "")
+    m = _TIME.search(text)
+    if not m:
+        return text
+    hour, minute, second = m.groups()
+    return f"{int(hour):02d}:{minute}:{second or '00'}"
+
+
+def data_scope(role: str, user_id: Union[int, None], dept_id: Union[int, None], personal: bool) -> str:
+    """
+    Phạm vi dữ liệu của câu trả lời (phần khóa gộp request /chat).
+    Câu hỏi về bản thân -> theo user_id với mọi role; còn lại admin theo công ty,
+    manager theo phòng ban, employee vẫn theo user_id (chỉ thấy dữ liệu của mình).
+    """
+    if personal or role not in ('admin', 'manager'):
+        return f"user:{user_id}"
+    if role == 'admin':
+        return "company"
+    return f"dept:{dept_id}"
+
+
+class _Intent(NamedTuple):
+    name: str
+    roles: tuple
+    pattern: Any
+    build: Callable  # (q, role, user_id, dept_id) -> (sql, render) hoặc None
+
+
+class IntentEngine:
+    def __init__(self, query: Callable[[str], Any],
+                 resolve_department: Callable[[str], Union[int, None]] = None):
+        """query(sql) -> HRMResult (có .ok / .error / .dicts())."""
+        self._query = query
+        self._resolve_department = resolve_department or (lambda q: None)
+        self._lock = threading.Lock()
+        self._questions = 0
+        self._hits: Dict[str, int] = {}
+        self._fallbacks: Dict[str, int] = {}
+        self._intents: List[_Intent] = [
+            _Intent("my_checkin", ("employee", "manager", "admin"),
+                    re.compile(rf"{_FIRST_PERSON}.*(check[- ]?in|chấm công)|(check[- ]?in|chấm công).*(của )?{_FIRST_PERSON}\b"),
+                    self._my_checkin),
+            _Intent("my_leave_balance", ("employee", "manager", "admin"),
+                    re.compile(rf"{_FIRST_PERSON}.*(còn|bao nhiêu).*(ngày phép|phép năm|ngày nghỉ phép)"
+                               rf"|(ngày phép|phép năm).*(của )?{_FIRST_PERSON}\b"),
+                    self._my_leave_balance),
+            _Intent("my_open_tasks", ("employee", "manager", "admin"),
+                    re.compile(rf"(công việc|task|việc).*(giao cho|của|cho) {_FIRST_PERSON}\b"
+                               rf"|{_FIRST_PERSON} (có|còn|đang có|cần làm|phải làm).*(công việc|task|việc)"),
+                    self._my_open_tasks),
+            _Intent("late_today", ("manager", "admin"),
+                    re.compile(rf"{_NOT_LATE_LIST}.*?(?:(ai|những ai|người nào|nhân viên nào|bao nhiêu người|mấy người|danh sách)"
+                               r".*(đi muộn|đi trễ)|(đi muộn|đi trễ).*(những ai|là ai|gồm ai|bao nhiêu người|mấy người))"),
+                    self._late),
+        ]
+
+    # --- Phân loại + thực thi ---
+    def answer(self, question: str, role: str, user_id: Union[int, None],
+               dept_id: Union[int, None]) -> Union[IntentResult, None]:
+        q = normalize_question(question)
+        with self._lock:
+            self._questions += 1
+        if _FOLLOW_UP.search(q) or _EXPORT.search(q):
+            return None
+
+        for intent in self._intents:
+            if role not in intent.roles or not intent.pattern.search(q):
+                continue
+            if intent.name.startswith("my_") and _OTHER_SUBJECT.search(q):
+                return None
+            built = intent.build(q, role, user_id, dept_id)
+            if built is None:
+                return None
+            sql, render = built
+            result = self._query(sql)
+            if not result.ok:
+                print(f"[INTENT] {intent.name}: HRM lỗi, chuyển sang LLM")
+                self._count(self._fallbacks, intent.name)
+                return None
+            self._count(self._hits, intent.name)
+            print(f"[INTENT] {intent.name} khớp, bỏ qua LLM")
+            return IntentResult(intent.name, sql, result, render(result.dicts()))
+        return None
+
+    def depends_on_user(self, question: str, role: str) -> bool:
+        """Câu trả lời phụ thuộc người hỏi: có từ ngôi thứ nhất hoặc khớp intent my_*."""
+        q = normalize_question(question)
+        return bool(_PERSONAL.search(q)) or any(
+            intent.name.startswith("my_") and role in intent.roles and intent.pattern.search(q)
+            for intent in self._intents
+        )
+
+    def _count(self, bucket: Dict[str, int], name: str):
+        with self._lock:
+            bucket[name] = bucket.get(name, 0) + 1
+
+    # --- Các intent ---
+    def _my_checkin(self, q, role, user_id, dept_id):
+        day = parse_date_slot(q)
+        # Lịch sử / đếm số lần cần nhiều ngày -> để LLM
+        if day is None or not user_id or re.search(r"lịch sử|các ngày|những ngày|số lần|mấy lần|bao nhiêu lần", q):
+            return None
+        sql = f"""
+        SELECT check_in, check_out
+        FROM cham_cong
+        WHERE nhan_vien_id = {int(user_id)} AND ngay = '{day.isoformat()}'
+        """
+        label = day_label(day)
+
+        def render(rows):
+            if not rows or not rows[0].get('check_in'):
+                return f"Bạn chưa có dữ liệu check-in {label}."
+            check_in = time_str(rows[0].get('check_in'))
+            status = "đi muộn" if check_in >= LATE_THRESHOLD else "đúng giờ"
+            answer = f"Bạn đã check-in {label} lúc {check_in} ({status})."
+            if rows[0].get('check_out'):
+                answer += f" Giờ check-out: {time_str(rows[0].get('check_out'))}."
+            return answer
+        return sql, render
+
+    def _my_leave_balance(self, q, role, user_id, dept_id):
+        if not user_id or _UNSUPPORTED_PERIOD.search(q):
+            return None
+        sql = f"""
+        SELECT tong_ngay_phep, ngay_phep_da_dung, ngay_phep_con_lai
+        FROM ngay_phep_nam
+        WHERE nhan_vien_id = {int(user_id)} AND nam = {date.today().year}
+        """
+
+        def render(rows):
+            if not rows:
+                return f"Chưa có dữ liệu ngày phép năm {date.today().year} của bạn."
+            row = rows[0]
+            return (f"Bạn còn {row.get('ngay_phep_con_lai')} ngày phép năm {date.today().year} "
+                    f"(tổng {row.get('tong_ngay_phep')} ngày, đã dùng {row.get('ngay_phep_da_dung')} ngày).")
+        return sql, render
+
+    def _my_open_tasks(self, q, role, user_id, dept_id):
+        # Trễ hạn / hoàn thành / theo dự án cần điều kiện khác -> để LLM
+        if not user_id or re.search(r"trễ|quá hạn|hoàn thành|xong|dự án|tiến độ", q):
+            return None
+        sql = f"""
+        SELECT cv.ten_cong_viec, cv.han_hoan_thanh, cv.muc_do_uu_tien, cv.trang_thai
+        FROM cong_viec cv
+        JOIN cong_viec_nguoi_nhan cvnn ON cv.id = cvnn.cong_viec_id
+        WHERE cvnn.nhan_vien_id = {int(user_id)}
+        AND cv.trang_thai != 'Đã hoàn thành'
+        ORDER BY cv.han_hoan_thanh ASC
+        LIMIT 20
+        """
+
+        def render(rows):
+            if not rows:
+                return "Bạn hiện không có công việc nào chưa hoàn thành."
+            lines = [f"Bạn có {len(rows)} công việc chưa hoàn thành:"]
+            for i, row in enumerate(rows, 1):
+                deadline = str(row.get('han_hoan_thanh') or "")[:10]
+                lines.append(f"{i}. {row.get('ten_cong_viec')} - hạn {deadline or 'chưa đặt'}"
+                             f" ({row.get('trang_thai')})")
+            return "\n".join(lines)
+        return sql, render
+
+    def _late(self, q, role, user_id, dept_id):
+        day = parse_date_slot(q)
+        if day is None:
+            return None
+        if role == 'manager':
+            if not dept_id:
+                return None
+            scope_dept, scope_label = int(dept_id), "phòng của bạn"
+        else:
+            scope_dept = self._resolve_department(q)
+            scope_label = "phòng ban này" if scope_dept else "toàn công ty"
+        dept_filter = f"AND nv.phong_ban_id = {scope_dept}" if scope_dept else ""
+        sql = f"""
+        SELECT nv.ho_ten, c.check_in
+        FROM cham_cong c
+        JOIN nhanvien nv ON c.nhan_vien_id = nv.id
+        WHERE c.ngay = '{day.isoformat()}' AND c.check_in >= '{LATE_THRESHOLD}' {dept_filter}
+        ORDER BY c.check_in
+        """
+        label = day_label(day)
+        count_only = re.search(r"bao nhiêu|mấy người", q)
+
+        def render(rows):
+            if not rows:
+                return f"Không có ai đi muộn {label} ({scope_label})."
+            if count_only:
+                return f"Có {len(rows)} người đi muộn {label} ({scope_label})."
+            lines = [f"Có {len(rows)} người đi muộn {label} ({scope_label}):"]
+            for i, row in enumerate(rows, 1):
+                lines.append(f"{i}. {row.get('ho_ten')} - check-in lúc {time_str(row.get('check_in'))}")
+            return "\n".join(lines)
+        return sql, render
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = sum(self._hits.values())
+            return {
+                "questions": self._questions,
+                "hits": hits,
+                "hit_rate": round(hits / self._questions, 3) if self._questions else None,
+                "by_intent": dict(self._hits),
+                "fallbacks": dict(self._fallbacks),
+            }
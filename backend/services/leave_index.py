@@ -0,0 +1,273 @@
+import threading
+import time
+from bisect import bisect_right
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+# ==========================================================
+# LEAVE INDEX: chỉ mục khoảng nghỉ phép theo nhân viên (trong bộ nhớ)
+# - Mỗi nhân viên: danh sách khoảng [tu_ngay, den_ngay] (ordinal ngày) của đơn đã duyệt / chờ duyệt,
+#   sắp theo ngày bắt đầu, kèm max(den_ngay) tích lũy -> tìm khoảng chồng lấn bằng bisect,
+#   dừng sớm khi max tích lũy < ngày bắt đầu cần kiểm tra
+# - Số ngày phép còn lại theo (nhân viên, năm) của ngay_phep_nam, so với năm của ngày bắt đầu đơn,
+#   trừ phần đã giữ chỗ bởi đơn chờ duyệt trong cùng năm; năm chưa có dòng -> không kiểm tra số ngày
+# - Đếm người nghỉ phép (đơn đã duyệt) vào một ngày, theo phòng ban
+# Nạp toàn bộ định kỳ; endpoint ghi cập nhật trực tiếp (reserve / set_status) nên không chờ chu kỳ.
+# Đơn chưa có trên HRM (đang trong hàng đợi ghi) được giữ chỗ theo write id trong bảng riêng,
+# sống qua mỗi lần nạp lại: bỏ khi HRM đã có dòng tương ứng hoặc khi lượt ghi thất bại (release).
+# ==========================================================
+
+COMPANY = None  # khóa cho tổng toàn công ty
+
+APPROVED = ("Đã duyệt", "da_duyet")
+
+
+def to_ordinal(value: Any) -> Union[int, None]:
+    """'YYYY-MM-DD' / datetime ISO / date -> ordinal ngày; None nếu không đọc được."""
+    if isinstance(value, datetime):
+        return value.date().toordinal()
+    if isinstance(value, date):
+        return value.toordinal()
+    try:
+        return date.fromisoformat(str(value)[:10]).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+class _Intervals:
+    """Khoảng của một nhân viên: (start, end, key, approved) sắp theo start, kèm max end tích lũy."""
+    __slots__ = ("items", "starts", "max_end")
+
+    def __init__(self):
+        self.items: List[Tuple[int, int, Any, bool]] = []
+        self.starts: List[int] = []
+        self.max_end: List[int] = []
+
+    def _reindex(self):
+        self.starts = [item[0] for item in self.items]
+        running = []
+        current = None
+        for item in self.items:
+            current = item[1] if current is None else max(current, item[1])
+            running.append(current)
+        self.max_end = running
+
+    def add(self, start: int, end: int, key: Any, approved: bool):
+        self.items.insert(bisect_right(self.starts, start), (start, end, key, approved))
+        self._reindex()
+
+    def remove(self, key: Any) -> bool:
+        kept = [item for item in self.items if item[2] != key]
+        if len(kept) == len(self.items):
+            return False
+        self.items = kept
+        self._reindex()
+        return True
+
+    def overlapping(self, start: int, end: int, approved_only: bool = False) -> List[Tuple[int, int, Any, bool]]:
+        found = []
+        i = bisect_right(self.starts, end) - 1
+        while i >= 0 and self.max_end[i] >= start:
+            item = self.items[i]
+            if item[1] >= start and (item[3] or not approved_only):
+                found.append(item)
+            i -= 1
+        return found
+
+
+class LeaveIndex:
+    LEAVE_SQL = """
+    SELECT id, nhanvien_id, tu_ngay, den_ngay, trang_thai
+    FROM don_nghi_phep
+    WHERE trang_thai IN (N'Đã duyệt', 'da_duyet', N'Chờ duyệt', 'cho_duyet')
+    """
+    BALANCE_SQL = """
+    SELECT nhan_vien_id, nam, ngay_phep_con_lai
+    FROM ngay_phep_nam
+    WHERE nam >= YEAR(CURDATE()) - 1
+    """
+    EMP_SQL = "SELECT id, phong_ban_id FROM nhanvien"
+
+    def __init__(self, fetch_rows: Callable[[str], Tuple[Union[list, None], Union[str, None]]]):
+        """fetch_rows(sql) -> (danh sách dòng dict, lỗi) như hrm_result.raw_rows."""
+        self._fetch_rows = fetch_rows
+        self._lock = threading.Lock()
+        self._by_emp: Dict[int, _Intervals] = {}
+        self._owner: Dict[Any, int] = {}
+        # khóa giữ chỗ -> (nhân viên, start, end, thời điểm đã ghi xuống HRM hoặc None)
+        self._reservations: Dict[Any, Tuple[int, int, int, Union[float, None]]] = {}
+        self._balance: Dict[Tuple[int, int], float] = {}
+        self._emp_dept: Dict[int, Union[int, None]] = {}
+        self._loaded_at: Union[float, None] = None
+        self._checks = 0
+        self._rejected = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._loaded_at is not None
+
+    # --- Nạp toàn bộ ---
+    def refresh(self, pending_status: Callable[[], Dict[int, bool]] = None) -> bool:
+        """
+        Dựng lại chỉ mục từ HRM; giữ bản cũ nếu truy vấn lỗi.
+        pending_status() -> {id đơn: duyệt?} của quyết định chưa ghi xuống HRM; gọi lúc đổi bản (trong lock)
+        nên quyết định xếp hàng trong khi đang nạp không bị mất. Giữ chỗ được gộp vào bản mới cùng lúc.
+        """
+        fetch_started = time.time()
+        try:
+            leave_rows, error = self._fetch_rows(self.LEAVE_SQL)
+            balance_rows, balance_error = self._fetch_rows(self.BALANCE_SQL)
+            emp_rows, emp_error = self._fetch_rows(self.EMP_SQL)
+            error = error or balance_error or emp_error
+        except Exception as e:
+            error = str(e)
+        if error is not None:
+            print(f"[LEAVE INDEX] Bỏ qua lần nạp: {error}")
+            return False
+
+        by_emp: Dict[int, _Intervals] = {}
+        owner: Dict[Any, int] = {}
+        on_hrm = set()
+        for r in leave_rows:
+            if not isinstance(r, dict):
+                continue
+            nv_id, start, end = r.get("nhanvien_id"), to_ordinal(r.get("tu_ngay")), to_ordinal(r.get("den_ngay"))
+            if nv_id is None or start is None or end is None:
+                continue
+            key = r.get("id")
+            by_emp.setdefault(int(nv_id), _Intervals()).items.append((start, end, key, r.get("trang_thai") in APPROVED))
+            owner[key] = int(nv_id)
+            on_hrm.add((int(nv_id), start, end))
+        for intervals in by_emp.values():
+            intervals.items.sort(key=lambda item: item[0])
+            intervals._reindex()
+
+        balance = {}
+        for r in balance_rows:
+            if isinstance(r, dict) and None not in (r.get("nhan_vien_id"), r.get("nam"), r.get("ngay_phep_con_lai")):
+                balance[(int(r["nhan_vien_id"]), int(r["nam"]))] = float(r["ngay_phep_con_lai"])
+        emp_dept = {int(r["id"]): r.get("phong_ban_id") for r in emp_rows
+                    if isinstance(r, dict) and r.get("id") is not None}
+
+        with self._lock:
+            for key, approved in (pending_status() if pending_status else {}).items():
+                self._apply_status(by_emp, owner, key, approved)
+            for key, (nv_id, start, end, written_at) in list(self._reservations.items()):
+                # Dòng HRM đã có (trùng khoảng chỉ có thể là chính đơn này: reserve chặn chồng lấn),
+                # hoặc đã ghi trước khi bắt đầu nạp mà không thấy (đơn đã bị xóa / từ chối) -> hết giữ chỗ
+                if (nv_id, start, end) in on_hrm or (written_at is not None and written_at <= fetch_started):
+                    del self._reservations[key]
+                    continue
+                by_emp.setdefault(nv_id, _Intervals()).add(start, end, key, False)
+                owner[key] = nv_id
+            self._by_emp = by_emp
+            self._owner = owner
+            self._balance = balance
+            self._emp_dept = emp_dept
+            self._loaded_at = time.time()
+        print(f"[LEAVE INDEX] Nạp {len(owner)} đơn của {len(by_emp)} nhân viên")
+        return True
+
+    # --- Cập nhật trực tiếp ---
+    @staticmethod
+    def _apply_status(by_emp: Dict[int, _Intervals], owner: Dict[Any, int], key: Any, approved: bool):
+        intervals = by_emp.get(owner.get(key))
+        if intervals is None:
+            return
+        item = next((item for item in intervals.items if item[2] == key), None)
+        intervals.remove(key)
+        if approved and item is not None:
+            intervals.add(item[0], item[1], key, True)
+        else:
+            owner.pop(key, None)
+
+    def set_status(self, key: Any, approved: bool):
+        """Duyệt -> khoảng tính vào người nghỉ; từ chối -> bỏ khỏi chỉ mục."""
+        with self._lock:
+            self._apply_status(self._by_emp, self._owner, key, approved)
+
+    def hold(self, key: Any, nv_id: int, tu_ngay: Any, den_ngay: Any):
+        """Giữ chỗ không kiểm tra (đơn đã nhận từ trước, vd: còn trong hàng đợi ghi khi khởi động lại)."""
+        start, end = to_ordinal(tu_ngay), to_ordinal(den_ngay)
+        if start is None or end is None:
+            return
+        with self._lock:
+            self._hold(key, int(nv_id), start, end)
+
+    def _hold(self, key: Any, nv_id: int, start: int, end: int):
+        self._reservations[key] = (nv_id, start, end, None)
+        self._by_emp.setdefault(nv_id, _Intervals()).add(start, end, key, False)
+        self._owner[key] = nv_id
+
+    def mark_written(self, key: Any):
+        """Đơn đã ghi xuống HRM: còn giữ chỗ tới lần nạp sau (lần nạp đó sẽ thấy dòng HRM)."""
+        with self._lock:
+            reservation = self._reservations.get(key)
+            if reservation is not None:
+                self._reservations[key] = reservation[:3] + (time.time(),)
+
+    def release(self, key: Any):
+        """Bỏ giữ chỗ (lượt ghi thất bại / không xếp hàng được)."""
+        with self._lock:
+            self._reservations.pop(key, None)
+            self._apply_status(self._by_emp, self._owner, key, False)
+
+    # --- Kiểm tra đơn mới ---
+    def validate(self, nv_id: int, tu_ngay: Any, den_ngay: Any) -> Union[str, None]:
+        """Lý do từ chối đơn mới (trùng khoảng / vượt số ngày phép còn lại); None nếu hợp lệ."""
+        return self.reserve(None, nv_id, tu_ngay, den_ngay)
+
+    def reserve(self, key: Any, nv_id: int, tu_ngay: Any, den_ngay: Any) -> Union[str, None]:
+        """Như validate; hợp lệ và có `key` thì thêm luôn khoảng chờ duyệt (cùng một lần giữ lock)."""
+        start, end = to_ordinal(tu_ngay), to_ordinal(den_ngay)
+        if start is None or end is None:
+            return "Ngày nghỉ không hợp lệ (định dạng YYYY-MM-DD)"
+        if end < start:
+            return "Ngày kết thúc phải sau hoặc bằng ngày bắt đầu"
+        nv_id = int(nv_id)
+        with self._lock:
+            self._checks += 1
+            intervals = self._by_emp.get(nv_id)
+            overlaps = intervals.overlapping(start, end) if intervals else []
+            if overlaps:
+                self._rejected += 1
+                first = min(overlaps, key=lambda item: item[0])
+                return (f"Trùng với đơn nghỉ {date.fromordinal(first[0]).isoformat()} → "
+                        f"{date.fromordinal(first[1]).isoformat()} đã có")
+            year = date.fromordinal(start).year
+            remaining = self._balance.get((nv_id, year))
+            if remaining is not None:
+                # Đơn chờ duyệt trong năm đã giữ chỗ số ngày phép
+                reserved = sum(item[1] - item[0] + 1 for item in (intervals.items if intervals else [])
+                               if not item[3] and date.fromordinal(item[0]).year == year)
+                requested = end - start + 1
+                if requested + reserved > remaining:
+                    self._rejected += 1
+                    return (f"Không đủ ngày phép: xin {requested} ngày, còn {remaining:g} ngày"
+                            + (f" ({reserved} ngày đang chờ duyệt)" if reserved else ""))
+            if key is not None:
+                self._hold(key, nv_id, start, end)
+            return None
+
+    # --- Đọc ---
+    def on_leave(self, day: Union[date, None] = None, dept_id: Union[int, None] = COMPANY) -> int:
+        """Số nhân viên có đơn đã duyệt phủ ngày `day` (mặc định hôm nay)."""
+        point = (day or date.today()).toordinal()
+        with self._lock:
+            return sum(
+                1 for nv_id, intervals in self._by_emp.items()
+                if (dept_id is COMPANY or self._emp_dept.get(nv_id) == dept_id)
+                and intervals.overlapping(point, point, approved_only=True)
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "age_seconds": round(time.time() - self._loaded_at, 1) if self._loaded_at else None,
+                "employees": len(self._by_emp),
+                "requests": len(self._owner),
+                "reservations": len(self._reservations),
+                "checks": self._checks,
+                "rejected": self._rejected,
+            }
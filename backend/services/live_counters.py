@@ -0,0 +1,227 @@
+import threading
+import time
+from datetime import date
+from typing import Callable, Dict, Iterable, List, Set, Union
+
+# ==========================================================
+# LIVE COUNTERS
+# Bộ đếm check-in hôm nay / nghỉ phép hôm nay / công việc (tổng, hoàn thành, trễ hạn)
+# theo phòng ban và toàn công ty, giữ trong bộ nhớ:
+# - cham_cong: đọc tăng dần theo ngay_tao
+# - cong_viec: đọc các công việc có thay đổi trong cong_viec_lich_su (theo thoi_gian)
+#   và công việc mới (id > id lớn nhất đã biết)
+# - sang ngày mới: reset check-in / nghỉ phép, tính lại trễ hạn từ bộ nhớ
+# - đối soát toàn bộ định kỳ
+# Dashboard chỉ đọc số đã tính sẵn (O(1)).
+# ==========================================================
+
+COMPLETED_STATUS = 'Đã hoàn thành'
+COMPANY = None  # khóa cho tổng toàn công ty
+
+
+def _ids_sql(ids: Iterable[int]) -> str:
+    return ", ".join(str(int(i)) for i in ids)
+
+
+def _count_by_dept(ids: Iterable[int], emp_dept: Dict[int, Union[int, None]]) -> Dict[Union[int, None], int]:
+    counts: Dict[Union[int, None], int] = {}
+    for nv_id in ids:
+        dept_id = emp_dept.get(nv_id)
+        counts[dept_id] = counts.get(dept_id, 0) + 1
+    return counts
+
+
+class LiveCounters:
+    EMP_SQL = "SELECT id, phong_ban_id FROM nhanvien"
+    CHECKIN_SQL = """
+    SELECT nhan_vien_id, ngay_tao
+    FROM cham_cong
+    WHERE ngay = CURDATE() AND check_in IS NOT NULL
+    """
+    LEAVE_SQL = """
+    SELECT DISTINCT nhanvien_id
+    FROM don_nghi_phep
+    WHERE CURDATE() BETWEEN tu_ngay AND den_ngay
+    AND trang_thai IN (N'Đã duyệt', 'da_duyet')
+    """
+    TASK_SQL = "SELECT id, trang_thai, han_hoan_thanh FROM cong_viec"
+    RECIPIENT_SQL = "SELECT cong_viec_id, nhan_vien_id FROM cong_viec_nguoi_nhan"
+    HISTORY_SQL = """
+    SELECT DISTINCT cong_viec_id, thoi_gian
+    FROM cong_viec_lich_su
+    WHERE thoi_gian > '{since}'
+    """
+    MAX_HISTORY_SQL = "SELECT MAX(thoi_gian) as max_time FROM cong_viec_lich_su"
+
+    def __init__(self, fetch_rows: Callable[[str], List[Dict]]):
+        self._fetch_rows = fetch_rows
+        self._lock = threading.Lock()
+        self._today = ""
+        self._emp_dept: Dict[int, Union[int, None]] = {}
+        self._dept_size: Dict[Union[int, None], int] = {}
+        self._checked_in: Set[int] = set()
+        self._checked_in_by_dept: Dict[Union[int, None], int] = {}
+        self._on_leave: Set[int] = set()
+        self._on_leave_by_dept: Dict[Union[int, None], int] = {}
+        self._tasks: Dict[int, Dict] = {}
+        self._task_totals: Dict[Union[int, None], Dict[str, int]] = {}
+        self._checkin_high_water = ""
+        self._history_high_water = ""
+        self._max_task_id = 0
+        self.loaded_at: Union[float, None] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None and self._today == date.today().isoformat()
+
+    # --- Tổng hợp công việc ---
+    def _task_flags(self, task: Dict) -> Dict[str, int]:
+        done = task["trang_thai"] == COMPLETED_STATUS
+        due = str(task["han_hoan_thanh"] or "")[:10]
+        return {
+            "total": 1,
+            "completed": 1 if done else 0,
+            "overdue": 1 if not done and due and due < self._today else 0,
+        }
+
+    def _apply_task(self, task: Dict, sign: int):
+        flags = self._task_flags(task)
+        for scope in [COMPANY, *task["depts"]]:
+            totals = self._task_totals.setdefault(scope, {"total": 0, "completed": 0, "overdue": 0})
+            for key, value in flags.items():
+                totals[key] += sign * value
+
+    def _set_task(self, task_id: int, row: Dict, recipients: Iterable[int]):
+        old = self._tasks.get(task_id)
+        if old:
+            self._apply_task(old, -1)
+        task = {
+            "trang_thai": row.get('trang_thai'),
+            "han_hoan_thanh": row.get('han_hoan_thanh'),
+            "depts": frozenset(self._emp_dept.get(nv_id) for nv_id in recipients
+                               if self._emp_dept.get(nv_id) is not None),
+        }
+        self._tasks[task_id] = task
+        self._apply_task(task, +1)
+        self._max_task_id = max(self._max_task_id, task_id)
+
+    def _rebuild_task_totals(self):
+        self._task_totals = {}
+        for task in self._tasks.values():
+            self._apply_task(task, +1)
+
+    def _fetch_tasks(self, where: str = ""):
+        rows = [r for r in self._fetch_rows(self.TASK_SQL + where) if isinstance(r, dict)]
+        recipients: Dict[int, List[int]] = {}
+        if rows:
+            recipient_where = f" WHERE cong_viec_id IN ({_ids_sql(r['id'] for r in rows)})" if where else ""
+            for r in self._fetch_rows(self.RECIPIENT_SQL + recipient_where):
+                recipients.setdefault(r.get('cong_viec_id'), []).append(r.get('nhan_vien_id'))
+        return rows, recipients
+
+    def _load_tasks(self, where: str) -> int:
+        rows, recipients = self._fetch_tasks(where)
+        with self._lock:
+            for row in rows:
+                self._set_task(row['id'], row, recipients.get(row['id'], []))
+        return len(rows)
+
+    # --- Nạp / đối soát ---
+    def reconcile(self) -> bool:
+        """Đối soát toàn bộ: nhân viên, check-in, nghỉ phép, công việc."""
+        emp_rows = self._fetch_rows(self.EMP_SQL)
+        if not emp_rows:
+            return False
+        checkin_rows = self._fetch_rows(self.CHECKIN_SQL)
+        leave_rows = self._fetch_rows(self.LEAVE_SQL)
+        max_history = self._fetch_rows(self.MAX_HISTORY_SQL)
+        task_rows, recipients = self._fetch_tasks()
+
+        # Dựng lại toàn bộ trong một lần giữ lock để không lộ trạng thái dở dang
+        with self._lock:
+            self._today = date.today().isoformat()
+            self._emp_dept = {r['id']: r.get('phong_ban_id') for r in emp_rows if isinstance(r, dict)}
+            self._dept_size = _count_by_dept(self._emp_dept, self._emp_dept)
+            self._checked_in = {r.get('nhan_vien_id') for r in checkin_rows}
+            self._checked_in_by_dept = _count_by_dept(self._checked_in, self._emp_dept)
+            self._checkin_high_water = max((str(r.get('ngay_tao') or '') for r in checkin_rows), default="")
+            self._on_leave = {r.get('nhanvien_id') for r in leave_rows}
+            self._on_leave_by_dept = _count_by_dept(self._on_leave, self._emp_dept)
+            self._tasks = {}
+            self._task_totals = {}
+            self._max_task_id = 0
+            for row in task_rows:
+                self._set_task(row['id'], row, recipients.get(row['id'], []))
+            if max_history and max_history[0].get('max_time'):
+                self._history_high_water = str(max_history[0]['max_time'])
+            self.loaded_at = time.time()
+
+        print(f"[LIVE COUNTERS] Đối soát: {len(self._checked_in)} check-in, "
+              f"{len(self._on_leave)} nghỉ phép, {len(self._tasks)} công việc")
+        return True
+
+    def tick(self) -> int:
+        """Đọc thay đổi mới; sang ngày mới thì reset bộ đếm trong ngày."""
+        if self.loaded_at is None:
+            return int(self.reconcile())
+        if self._today != date.today().isoformat():
+            with self._lock:
+                self._today = date.today().isoformat()
+                self._checked_in = set()
+                self._checked_in_by_dept = {}
+                self._checkin_high_water = ""
+                self._rebuild_task_totals()
+            # Danh sách nghỉ phép phụ thuộc ngày -> nạp lại
+            self.refresh_leave()
+
+        changes = 0
+        checkin_where = f" AND ngay_tao > '{self._checkin_high_water}'" if self._checkin_high_water else ""
+        checkin_rows = self._fetch_rows(self.CHECKIN_SQL + checkin_where)
+        with self._lock:
+            for row in checkin_rows:
+                nv_id = row.get('nhan_vien_id')
+                if nv_id not in self._checked_in:
+                    self._checked_in.add(nv_id)
+                    dept_id = self._emp_dept.get(nv_id)
+                    self._checked_in_by_dept[dept_id] = self._checked_in_by_dept.get(dept_id, 0) + 1
+                    changes += 1
+                self._checkin_high_water = max(self._checkin_high_water, str(row.get('ngay_tao') or ''))
+
+        changes += self._load_tasks(f" WHERE id > {int(self._max_task_id)}")
+
+        history = self._fetch_rows(self.HISTORY_SQL.format(since=self._history_high_water or '1900-01-01'))
+        changed_ids = {r.get('cong_viec_id') for r in history if r.get('cong_viec_id') is not None}
+        if changed_ids:
+            changes += self._load_tasks(f" WHERE id IN ({_ids_sql(changed_ids)})")
+        self._history_high_water = max([self._history_high_water] + [str(r.get('thoi_gian') or '') for r in history])
+        return changes
+
+    def refresh_leave(self):
+        rows = self._fetch_rows(self.LEAVE_SQL)
+        with self._lock:
+            self._on_leave = {r.get('nhanvien_id') for r in rows}
+            self._on_leave_by_dept = _count_by_dept(self._on_leave, self._emp_dept)
+
+    # --- Cập nhật trực tiếp từ các endpoint ghi ---
+    def record_task(self, task_id: int, row: Dict, recipients: Iterable[int]):
+        with self._lock:
+            self._set_task(task_id, row, recipients)
+
+    # --- Đọc (O(1)) ---
+    def employees(self, dept_id: Union[int, None] = COMPANY) -> int:
+        if dept_id is COMPANY:
+            return len(self._emp_dept)
+        return self._dept_size.get(dept_id, 0)
+
+    def checked_in(self, dept_id: Union[int, None] = COMPANY) -> int:
+        if dept_id is COMPANY:
+            return len(self._checked_in)
+        return self._checked_in_by_dept.get(dept_id, 0)
+
+    def on_leave(self, dept_id: Union[int, None] = COMPANY) -> int:
+        if dept_id is COMPANY:
+            return len(self._on_leave)
+        return self._on_leave_by_dept.get(dept_id, 0)
+
+    def tasks(self, dept_id: Union[int, None] = COMPANY) -> Dict[str, int]:
+        return dict(self._task_totals.get(dept_id, {"total": 0, "completed": 0, "overdue": 0}))
@@ -0,0 +1,135 @@
+import threading
+import time
+from typing import Callable, Dict, List, Union
+
+# ==========================================================
+# LATEST PROGRESS SNAPSHOT
+# Giữ "tiến độ mới nhất của từng công việc" (cong_viec_tien_do) trong bộ nhớ,
+# cập nhật tăng dần theo thoi_gian_cap_nhat, kèm tổng hợp theo dự án
+# để không phải dùng subquery tương quan MAX(thoi_gian_cap_nhat) mỗi lần.
+# ==========================================================
+
+
+class LatestProgressSnapshot:
+    """
+    - _latest: cong_viec_id -> (thoi_gian_cap_nhat, id, phan_tram)
+    - _task_project: cong_viec_id -> du_an_id
+    - _project_sum / _project_count: tổng và số công việc có tiến độ theo dự án
+      (AVG tính O(1), giống AVG(td.phan_tram) của LEFT JOIN cũ)
+    """
+
+    TASK_SQL = "SELECT id, du_an_id FROM cong_viec"
+    LATEST_SQL = """
+    SELECT td.id, td.cong_viec_id, td.phan_tram, td.thoi_gian_cap_nhat
+    FROM cong_viec_tien_do td
+    JOIN (
+        SELECT cong_viec_id, MAX(thoi_gian_cap_nhat) as max_time
+        FROM cong_viec_tien_do
+        GROUP BY cong_viec_id
+    ) latest ON latest.cong_viec_id = td.cong_viec_id AND latest.max_time = td.thoi_gian_cap_nhat
+    """
+    CHANGES_SQL = """
+    SELECT id, cong_viec_id, phan_tram, thoi_gian_cap_nhat
+    FROM cong_viec_tien_do
+    WHERE thoi_gian_cap_nhat >= '{since}'
+    ORDER BY thoi_gian_cap_nhat
+    """
+
+    def __init__(self, fetch_rows: Callable[[str], List[Dict]]):
+        self._fetch_rows = fetch_rows
+        self._lock = threading.Lock()
+        self._latest: Dict[int, tuple] = {}
+        self._task_project: Dict[int, Union[int, None]] = {}
+        self._project_sum: Dict[int, float] = {}
+        self._project_count: Dict[int, int] = {}
+        self._max_task_id = 0
+        self._high_water = ""
+        self.loaded_at: Union[float, None] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    # --- Cập nhật tổng hợp theo dự án ---
+    def _add_to_project(self, task_id: int, value: float, sign: int):
+        project_id = self._task_project.get(task_id)
+        if project_id is None:
+            return
+        self._project_sum[project_id] = self._project_sum.get(project_id, 0) + sign * value
+        self._project_count[project_id] = self._project_count.get(project_id, 0) + sign
+
+    def _apply(self, row: Dict) -> bool:
+        """Áp dụng 1 dòng tiến độ nếu nó mới hơn bản đang giữ. Gọi khi đã giữ lock."""
+        task_id = row.get('cong_viec_id')
+        key = (str(row.get('thoi_gian_cap_nhat') or ''), row.get('id') or 0)
+        current = self._latest.get(task_id)
+        if current and current[:2] >= key:
+            return False
+        value = float(row.get('phan_tram') or 0)
+        if current:
+            self._add_to_project(task_id, current[2], -1)
+        self._latest[task_id] = (key[0], key[1], value)
+        self._add_to_project(task_id, value, +1)
+        if key[0] > self._high_water:
+            self._high_water = key[0]
+        return True
+
+    def _rebuild_projects(self):
+        self._project_sum = {}
+        self._project_count = {}
+        for task_id, (_, _, value) in self._latest.items():
+            self._add_to_project(task_id, value, +1)
+
+    # --- Nạp dữ liệu ---
+    def refresh(self) -> int:
+        """Nạp lại toàn bộ snapshot (đối soát định kỳ)."""
+        task_rows = self._fetch_rows(self.TASK_SQL)
+        latest_rows = self._fetch_rows(self.LATEST_SQL)
+        if not task_rows:
+            return 0
+        with self._lock:
+            self._task_project = {r['id']: r.get('du_an_id') for r in task_rows if isinstance(r, dict)}
+            self._max_task_id = max(self._task_project, default=0)
+            self._latest = {}
+            self._high_water = ""
+            for row in latest_rows:
+                if isinstance(row, dict):
+                    self._apply(row)
+            self._rebuild_projects()
+            self.loaded_at = time.time()
+        print(f"[PROGRESS SNAPSHOT] {len(self._latest)} công việc có tiến độ")
+        return len(self._latest)
+
+    def refresh_incremental(self) -> int:
+        """Chỉ đọc công việc mới và các dòng tiến độ từ high-water mark trở đi."""
+        if not self.ready:
+            return self.refresh()
+        new_tasks = self._fetch_rows(f"{self.TASK_SQL} WHERE id > {int(self._max_task_id)}")
+        changes = self._fetch_rows(self.CHANGES_SQL.format(since=self._high_water.replace("'", "''")))
+        applied = 0
+        with self._lock:
+            for row in new_tasks:
+                if isinstance(row, dict):
+                    self._task_project[row['id']] = row.get('du_an_id')
+                    self._max_task_id = max(self._max_task_id, row['id'])
+            for row in changes:
+                if isinstance(row, dict) and self._apply(row):
+                    applied += 1
+        return applied
+
+    def record(self, row: Dict):
+        """Ghi nhận ngay một dòng tiến độ mới (khi chính backend ghi vào HRM)."""
+        with self._lock:
+            self._apply(row)
+
+    # --- Tra cứu ---
+    def task_progress(self, task_id: int) -> Union[float, None]:
+        current = self._latest.get(task_id)
+        return current[2] if current else None
+
+    def project_progress(self, project_id: int) -> int:
+        """Trung bình tiến độ mới nhất các công việc của dự án (0 nếu chưa có)."""
+        count = self._project_count.get(project_id, 0)
+        if count <= 0:
+            return 0
+        return int(round(self._project_sum.get(project_id, 0) / count))
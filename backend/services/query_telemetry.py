@@ -0,0 +1,192 @@
+import contextvars
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Union
+
+# ==========================================================
+# QUERY TELEMETRY: thống kê câu lệnh HRM theo mẫu (fingerprint)
+# - Fingerprint: bỏ literal (chuỗi, số, danh sách IN), gộp khoảng trắng, chữ thường
+# - Mỗi mẫu: số lần, lỗi, tổng / max thời gian, số dòng, số byte,
+#   endpoint và role gọi, percentile trên cửa sổ SAMPLE_WINDOW lần gần nhất
+# - Bộ nhớ giới hạn MAX_FINGERPRINTS mẫu (đầy thì bỏ mẫu tốn ít thời gian nhất)
+# - Snapshot định kỳ ra file JSON, nạp lại khi khởi động
+# Endpoint / role lấy từ contextvars (middleware HTTP đặt, asyncio.to_thread mang theo);
+# job nền không có context -> dùng tên thread (bg-<tên job>).
+# ==========================================================
+
+MAX_FINGERPRINTS = 500
+SAMPLE_WINDOW = 256
+MAX_CALLERS = 20
+
+_caller = contextvars.ContextVar("hrm_query_caller", default=(None, None))
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_STRING = re.compile(r"N?'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bin\s*\(\s*\?(?:\s*,\s*\?)*\s*\)")
+
+
+def set_caller(endpoint: str = None, role: Union[str, None] = None):
+    """Gắn endpoint / role cho các câu lệnh HRM chạy tiếp trong context hiện tại."""
+    current_endpoint, current_role = _caller.get()
+    _caller.set((endpoint or current_endpoint, role or current_role))
+
+
+def fingerprint(sql: str) -> str:
+    text = _COMMENTS.sub(" ", sql)
+    text = _STRING.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = " ".join(text.lower().split())
+    return _IN_LIST.sub("in (?)", text).rstrip(" ;")
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class _Template:
+    __slots__ = ("text", "count", "errors", "total_ms", "max_ms", "rows", "bytes",
+                 "samples", "endpoints", "roles", "last_seen")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+        self.endpoints: Dict[str, int] = {}
+        self.roles: Dict[str, int] = {}
+        self.last_seen = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {slot: (list(getattr(self, slot)) if slot == "samples" else getattr(self, slot))
+                for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "_Template":
+        template = cls(data.get("text", ""))
+        for slot in cls.__slots__:
+            if slot == "samples":
+                template.samples.extend(data.get("samples", []))
+            elif slot in data:
+                setattr(template, slot, data[slot])
+        return template
+
+
+def _bump(counter: Dict[str, int], key: str):
+    if key in counter or len(counter) < MAX_CALLERS:
+        counter[key] = counter.get(key, 0) + 1
+
+
+class QueryTelemetry:
+    def __init__(self, snapshot_path: Union[str, None] = None):
+        self._snapshot_path = snapshot_path
+        self._lock = threading.Lock()
+        self._templates: Dict[str, _Template] = {}
+        self._since = time.time()
+        if snapshot_path:
+            self._load()
+
+    def record(self, sql: str, duration: float, rows: Union[int, None], size: int, error: bool = False):
+        endpoint, role = _caller.get()
+        endpoint = endpoint or threading.current_thread().name
+        text = fingerprint(sql)
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+        ms = duration * 1000
+        with self._lock:
+            template = self._templates.get(key)
+            if template is None:
+                if len(self._templates) >= MAX_FINGERPRINTS:
+                    del self._templates[min(self._templates, key=lambda k: self._templates[k].total_ms)]
+                template = self._templates[key] = _Template(text)
+            template.count += 1
+            template.errors += int(error)
+            template.total_ms += ms
+            template.max_ms = max(template.max_ms, ms)
+            template.rows += rows or 0
+            template.bytes += size
+            template.samples.append(round(ms, 1))
+            template.last_seen = time.time()
+            _bump(template.endpoints, endpoint)
+            _bump(template.roles, role or "unknown")
+
+    def top(self, limit: int = 20, order_by: str = "total_ms") -> List[Dict[str, Any]]:
+        """Các mẫu câu lệnh tốn thời gian nhất (hoặc theo p95_ms / count / bytes)."""
+        with self._lock:
+            items = [(key, t, sorted(t.samples)) for key, t in self._templates.items()]
+        report = []
+        for key, t, ordered in items:
+            report.append({
+                "fingerprint": key,
+                "sql": t.text,
+                "count": t.count,
+                "errors": t.errors,
+                "total_ms": round(t.total_ms, 1),
+                "avg_ms": round(t.total_ms / t.count, 1) if t.count else 0,
+                "p50_ms": _percentile(ordered, 50),
+                "p95_ms": _percentile(ordered, 95),
+                "p99_ms": _percentile(ordered, 99),
+                "max_ms": round(t.max_ms, 1),
+                "avg_rows": round(t.rows / t.count, 1) if t.count else 0,
+                "total_bytes": t.bytes,
+                "endpoints": dict(sorted(t.endpoints.items(), key=lambda kv: -kv[1])),
+                "roles": dict(t.roles),
+            })
+        report.sort(key=lambda item: item.get(order_by, 0), reverse=True)
+        return report[:limit]
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            templates = list(self._templates.values())
+        return {
+            "since": self._since,
+            "fingerprints": len(templates),
+            "statements": sum(t.count for t in templates),
+            "errors": sum(t.errors for t in templates),
+            "total_ms": round(sum(t.total_ms for t in templates), 1),
+            "total_bytes": sum(t.bytes for t in templates),
+        }
+
+    # --- Snapshot ---
+    def snapshot(self):
+        """Ghi toàn bộ thống kê ra file (ghi file tạm rồi đổi tên, không để lại file dở)."""
+        if not self._snapshot_path:
+            return
+        with self._lock:
+            payload = {
+                "since": self._since,
+                "saved_at": time.time(),
+                "templates": {key: t.to_dict() for key, t in self._templates.items()},
+            }
+        directory = os.path.dirname(self._snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self._snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, self._snapshot_path)
+
+    def _load(self):
+        try:
+            with open(self._snapshot_path, encoding="utf-8") as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[QUERY TELEMETRY] Không đọc được snapshot {self._snapshot_path}: {e}")
+            return
+        self._since = payload.get("since", self._since)
+        templates = payload.get("templates", {})
+        for key in sorted(templates, key=lambda k: templates[k].get("total_ms", 0), reverse=True)[:MAX_FINGERPRINTS]:
+            self._templates[key] = _Template.from_dict(templates[key])
+        print(f"[QUERY TELEMETRY] Nạp {len(self._templates)} mẫu câu lệnh từ snapshot")
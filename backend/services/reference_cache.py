@@ -0,0 +1,66 @@
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Tuple, Union
+
+# ==========================================================
+# REFERENCE DATA CACHE: danh sách ít thay đổi (nhân viên, dự án)
+# lưu theo (loại, phạm vi) và đánh version bằng ETag
+# ==========================================================
+
+
+def compute_etag(data: Any) -> str:
+    raw = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str).encode()
+    return '"' + hashlib.sha1(raw).hexdigest() + '"'
+
+
+class ReferenceCache:
+    """
+    Cache cho dữ liệu tham chiếu, khóa theo (kind, scope), ví dụ ("employees", "dept:3").
+    - get(): trả entry đang có, tự nạp nếu chưa có hoặc đã quá max_age
+    - refresh_all(): nạp lại mọi khóa đã biết (chạy nền định kỳ)
+    - invalidate(): bỏ entry để lần đọc sau nạp lại từ HRM
+    """
+
+    def __init__(self, loaders: Dict[str, Callable[[str], Any]], max_age: float = 3600):
+        self._loaders = loaders
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], Dict] = {}
+        self._known_keys = set()
+
+    def _load(self, kind: str, scope: str) -> Dict:
+        data = self._loaders[kind](scope)
+        entry = {"data": data, "etag": compute_etag(data), "loaded_at": time.time()}
+        with self._lock:
+            self._entries[(kind, scope)] = entry
+            self._known_keys.add((kind, scope))
+        return entry
+
+    def get(self, kind: str, scope: str) -> Dict:
+        with self._lock:
+            entry = self._entries.get((kind, scope))
+        if entry and time.time() - entry["loaded_at"] < self._max_age:
+            return entry
+        return self._load(kind, scope)
+
+    def peek(self, kind: str, scope: str) -> Union[Dict, None]:
+        """Trả entry hiện có (kể cả đã cũ) mà không nạp lại."""
+        with self._lock:
+            return self._entries.get((kind, scope))
+
+    def invalidate(self, kind: Union[str, None] = None):
+        with self._lock:
+            for key in list(self._entries):
+                if kind is None or key[0] == kind:
+                    del self._entries[key]
+
+    def refresh_all(self):
+        with self._lock:
+            keys = list(self._known_keys)
+        for kind, scope in keys:
+            try:
+                self._load(kind, scope)
+            except Exception as e:
+                print(f"[REFERENCE CACHE] Không thể làm mới {kind}/{scope}: {e}")
@@ -0,0 +1,107 @@
+import re
+from typing import Dict, Set, Union
+
+from services.query_guard import _aliases, _closing_paren, _depths, _mask_strings
+
+# ==========================================================
+# ROW SCOPE: kiểm tra SQL của employee / manager chỉ đọc dữ liệu trong phạm vi phiên
+# Mỗi bảng được tham chiếu phải có điều kiện trên ĐÚNG cột mang phạm vi của bảng đó
+# (alias được phân giải như query_guard), không nằm trong nhóm OR:
+# - user_id: cột nhân viên của bảng (cham_cong.nhan_vien_id, don_nghi_phep.nhanvien_id, nhanvien.id...)
+# - dept_id (manager): nhanvien.phong_ban_id / cong_viec.phong_ban_id; bảng theo nhân viên
+#   (cham_cong, don_nghi_phep...) đi kèm nhanvien đã lọc phòng ban thì coi như trong phạm vi
+# - bảng con của công việc: trong phạm vi khi cong_viec / cong_viec_nguoi_nhan đã trong phạm vi
+# - bảng dùng chung (tài liệu, phòng ban, dự án, lịch) không cần điều kiện
+# Bảng khác (cấu hình, phân quyền...) -> ngoài phạm vi.
+# ==========================================================
+
+SHARED_TABLES = {"tai_lieu", "phong_ban", "du_an", "lich_trinh"}
+
+# Cột = user_id giới hạn bảng về dữ liệu của chính người hỏi
+USER_COLUMNS = {
+    "nhanvien": ("id",),
+    "cham_cong": ("nhan_vien_id",),
+    "don_nghi_phep": ("nhanvien_id", "nhan_vien_id"),
+    "v_don_nghi_phep_chi_tiet": ("nhan_vien_id",),
+    "ngay_phep_nam": ("nhan_vien_id",),
+    "luong": ("nhan_vien_id",),
+    "luu_kpi": ("nhan_vien_id",),
+    "nhan_su_lich_su": ("nhan_vien_id",),
+    "cong_viec_nguoi_nhan": ("nhan_vien_id",),
+    "cong_viec": ("nguoi_giao_id",),
+    "thong_bao": ("nguoi_nhan_id",),
+}
+
+# Cột = dept_id giới hạn bảng về phòng ban của manager
+DEPT_COLUMNS = {
+    "nhanvien": ("phong_ban_id",),
+    "cong_viec": ("phong_ban_id",),
+}
+
+# Bảng theo nhân viên: trong phạm vi phòng ban khi câu lệnh có nhanvien đã lọc phong_ban_id
+EMPLOYEE_KEYED = {"cham_cong", "don_nghi_phep", "v_don_nghi_phep_chi_tiet", "ngay_phep_nam", "luong",
+                  "luu_kpi", "nhan_su_lich_su", "cong_viec_nguoi_nhan"}
+
+# Bảng con của công việc: theo phạm vi của cong_viec / cong_viec_nguoi_nhan trong cùng câu lệnh
+TASK_TABLES = {"cong_viec", "cong_viec_tien_do", "cong_viec_lich_su", "cong_viec_danh_gia",
+               "cong_viec_quy_trinh", "file_dinh_kem"}
+
+_EQUALS = re.compile(
+    r"(?:\b(\w+)\.)?\b(\w+)\s*(?:=\s*'?(\d+)\b'?|IN\s*\(\s*'?(\d+)'?\s*\))", re.IGNORECASE)
+_OR = re.compile(r"\bOR\b", re.IGNORECASE)
+# EXTRACT(YEAR FROM ngay), TRIM(x FROM y)...: FROM trong hàm, không phải tên bảng
+_FROM_FUNCTION = re.compile(r"\b(EXTRACT|TRIM|SUBSTRING|POSITION)\s*\([^()]*\)", re.IGNORECASE)
+
+
+def _level(masked: str, depths, pos: int):
+    """(đầu, cuối) của mức ngoặc chứa vị trí pos (cả câu lệnh nếu ở mức ngoài cùng)."""
+    depth = depths[pos]
+    if depth == 0:
+        return 0, len(masked)
+    start = next(i for i in range(pos, -1, -1) if masked[i] == "(" and depths[i] == depth)
+    end = _closing_paren(masked, start)
+    return start + 1, (end if end != -1 else len(masked))
+
+
+def _scoped_tables(sql: str, masked: str, aliases: Dict[str, str],
+                   value: int, columns: Dict[str, tuple]) -> Set[str]:
+    """Bảng có điều kiện `cột phạm vi = value` (hoặc IN (value)) không nằm trong nhóm OR."""
+    depths = _depths(masked)
+    scoped = set()
+    for m in _EQUALS.finditer(sql):
+        number = m.group(3) or m.group(4)
+        # Bỏ qua khớp nằm trong chuỗi ký tự
+        if int(number) != value or masked[m.start()] != sql[m.start()]:
+            continue
+        start, end = _level(masked, depths, m.start())
+        depth = depths[m.start()]
+        if any(depths[o.start()] == depth for o in _OR.finditer(masked, start, end)):
+            continue
+        column = m.group(2).lower()
+        if m.group(1):
+            candidates = {aliases.get(m.group(1).lower())}
+        else:
+            # Cột không tiền tố: thuộc các bảng khai báo ở cùng mức truy vấn
+            candidates = set(_aliases(masked[start:end], top_only=True).values())
+        scoped |= {table for table in candidates if column in columns.get(table, ())}
+    return scoped
+
+
+def scope_violation(sql: str, role: str, user_id: Union[int, None],
+                    dept_id: Union[int, None]) -> Union[str, None]:
+    """Bảng đầu tiên (theo tên) không có điều kiện phạm vi của phiên; None nếu mọi bảng đều trong phạm vi."""
+    masked = _FROM_FUNCTION.sub(lambda m: " " * len(m.group(0)), _mask_strings(sql))
+    aliases = _aliases(masked)
+    tables = set(aliases.values())
+    covered = set(SHARED_TABLES)
+    if user_id is not None:
+        covered |= _scoped_tables(sql, masked, aliases, int(user_id), USER_COLUMNS)
+    if role == 'manager' and dept_id is not None:
+        dept_scoped = _scoped_tables(sql, masked, aliases, int(dept_id), DEPT_COLUMNS)
+        covered |= dept_scoped
+        if "nhanvien" in dept_scoped:
+            covered |= EMPLOYEE_KEYED
+    if covered & {"cong_viec", "cong_viec_nguoi_nhan"} & tables:
+        covered |= TASK_TABLES
+    missing = sorted(tables - covered)
+    return missing[0] if missing else None
@@ -0,0 +1,32 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+# ==========================================================
+# SINGLE-FLIGHT: gộp các lời gọi trùng khóa đang chạy đồng thời
+# Request đầu tiên (leader) khởi chạy tác vụ; các request trùng khóa đến sau
+# chờ cùng một tác vụ và nhận chung kết quả (hoặc chung lỗi).
+# ==========================================================
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.started = 0
+        self.shared = 0
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+            print(f"[SINGLE-FLIGHT {self.name}] Dùng chung kết quả đang tính ({self.shared} lần)")
+        else:
+            self.started += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t: self._inflight.pop(key, None))
+        # shield: client của leader ngắt kết nối không hủy tác vụ của các request khác
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {"started": self.started, "shared": self.shared, "in_flight": len(self._inflight)}
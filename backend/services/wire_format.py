@@ -0,0 +1,40 @@
+import gzip
+import json
+from typing import Any, Tuple, Union
+
+# ==========================================================
+# WIRE FORMAT: mã hóa gọn cho response lớn
+# - Dạng cột: {"columns": [...], "rows": [[...], ...]} (HRMResult.to_columnar)
+#   thay vì list dict lặp tên cột
+# - JSON nhanh bằng orjson (nếu có), nén gzip / brotli theo Accept-Encoding
+# ==========================================================
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn, thiếu thì dùng json chuẩn
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = 1024
+
+
+def dumps(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+
+
+def negotiate_encoding(body: bytes, accept_encoding: Union[str, None]) -> Tuple[bytes, Union[str, None]]:
+    """Nén body theo Accept-Encoding của client (ưu tiên br, rồi gzip); body nhỏ giữ nguyên."""
+    if len(body) < COMPRESS_MIN_BYTES or not accept_encoding:
+        return body, None
+    accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+    if "br" in accepted and brotli is not None:
+        return brotli.compress(body, quality=4), "br"
+    if "gzip" in accepted:
+        return gzip.compress(body, compresslevel=5), "gzip"
+    return body, None
@@ -0,0 +1,332 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Type, Union
+
+# ==========================================================
+# WRITE QUEUE: ghi HRM kiểu write-behind, bền qua file append-only
+# - enqueue(): ghi một dòng JSON vào log (flush + fsync) rồi trả id ngay
+#   -> độ trễ ghi của người dùng là ghi file cục bộ, không phải round trip HRM
+# - Gộp: item mới cùng coalesce_key (vd: duyệt cùng một đơn) thay item cũ chưa gửi
+# - drain(): lấy các item đến hạn, nhóm theo loại, mỗi nhóm tối đa batch_size item
+#   gửi bằng MỘT handler (một câu lệnh / một batch SQL)
+# - Lỗi: thử lại với backoff lũy thừa có jitter; quá max_attempts -> failed
+# - Khởi động lại: đọc lại log, item chưa xong được gửi tiếp (at-least-once);
+#   log được nén lại (chỉ giữ item còn sống + kết quả gần nhất) khi quá dài
+# Handler nhận list payload, trả list kết quả cùng thứ tự (None nếu không có gì để trả);
+# ném exception -> cả nhóm thử lại. Exception thuộc `transient` (HRM ngắt mạch / quá tải)
+# chỉ dời lịch gửi, không tính vào max_attempts: sự cố kéo dài không làm item bị failed.
+# Handler ném Rejected (HRM từ chối câu lệnh: vi phạm khóa ngoại, success=false) -> lô được
+# chia đôi gửi lại ngay để tách item hỏng; item đơn lẻ bị từ chối -> failed, không thử lại.
+# Gửi lại là at-least-once: handler phải idempotent (lần gửi trước có thể đã ghi dù hết giờ chờ).
+# subscribe(fn): fn(trạng thái item) được gọi khi item done / failed (vd: bỏ giữ chỗ khi ghi lỗi).
+# ==========================================================
+
+QUEUED, DONE, FAILED, SUPERSEDED = "queued", "done", "failed", "superseded"
+FINISHED = (DONE, FAILED, SUPERSEDED)
+
+# Giữ kết quả của item đã xong để UI còn tra được trạng thái
+MAX_FINISHED = 2000
+
+
+class Rejected(Exception):
+    """HRM từ chối câu lệnh (lỗi dữ liệu / ràng buộc): gửi lại y nguyên vẫn bị từ chối."""
+
+
+class WriteItem:
+    __slots__ = ("id", "kind", "payload", "coalesce_key", "status", "attempts",
+                 "next_attempt_at", "error", "result", "created_at", "updated_at")
+
+    def __init__(self, kind: str, payload: Dict[str, Any], coalesce_key: Union[str, None] = None,
+                 item_id: Union[str, None] = None, created_at: Union[float, None] = None):
+        self.id = item_id or uuid.uuid4().hex
+        self.kind = kind
+        self.payload = payload
+        self.coalesce_key = coalesce_key
+        self.status = QUEUED
+        self.attempts = 0
+        self.next_attempt_at = 0.0
+        self.error: Union[str, None] = None
+        self.result: Any = None
+        self.created_at = created_at or time.time()
+        self.updated_at = self.created_at
+
+    def public(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "attempts": self.attempts,
+            "error": self.error,
+            "result": self.result,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class WriteQueue:
+    def __init__(self, log_path: str, handlers: Dict[str, Callable[[List[Dict[str, Any]]], List[Any]]],
+                 batch_size: int = 50, max_attempts: int = 8, base_backoff: float = 1.0,
+                 max_backoff: float = 60.0, compact_after: int = 5000,
+                 transient: Tuple[Type[BaseException], ...] = ()):
+        self._log_path = log_path
+        self._handlers = handlers
+        self._batch_size = batch_size
+        self._max_attempts = max_attempts
+        self._base_backoff = base_backoff
+        self._max_backoff = max_backoff
+        self._compact_after = compact_after
+        self._transient = transient
+        self._lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._items: "OrderedDict[str, WriteItem]" = OrderedDict()
+        self._by_key: Dict[str, str] = {}
+        self._log_lines = 0
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._counters = {"enqueued": 0, "coalesced": 0, "sent": 0, "batches": 0, "retries": 0, "failed": 0,
+                          "rejected": 0, "splits": 0}
+        directory = os.path.dirname(log_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._replay()
+        self._log = open(log_path, "a", encoding="utf-8")
+
+    # --- Log append-only ---
+    def _append(self, records: Iterable[Dict[str, Any]]):
+        lines = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+        if not lines:
+            return
+        self._log.write(lines)
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self._log_lines += lines.count("\n")
+
+    def _replay(self):
+        try:
+            with open(self._log_path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Dòng ghi dở khi tiến trình bị dừng giữa chừng
+                continue
+            self._log_lines += 1
+            if record.get("op") == "enqueue":
+                item = WriteItem(record["kind"], record["payload"], record.get("coalesce_key"),
+                                 item_id=record["id"], created_at=record.get("created_at"))
+                self._items[item.id] = item
+                if item.coalesce_key:
+                    self._by_key[item.coalesce_key] = item.id
+            elif record.get("op") == "update" and record.get("id") in self._items:
+                item = self._items[record["id"]]
+                for field in ("status", "attempts", "error", "result", "updated_at"):
+                    if field in record:
+                        setattr(item, field, record[field])
+        pending = sum(1 for item in self._items.values() if item.status == QUEUED)
+        self._trim_finished()
+        if self._items:
+            print(f"[WRITE QUEUE] Nạp lại {len(self._items)} item từ log, {pending} item chờ gửi")
+
+    def _trim_finished(self):
+        finished = [item_id for item_id, item in self._items.items() if item.status in FINISHED]
+        for item_id in finished[:max(0, len(finished) - MAX_FINISHED)]:
+            item = self._items.pop(item_id)
+            if item.coalesce_key and self._by_key.get(item.coalesce_key) == item_id:
+                del self._by_key[item.coalesce_key]
+
+    def _compact(self):
+        """Viết lại log chỉ gồm trạng thái hiện tại (file tạm rồi đổi tên)."""
+        records = []
+        for item in self._items.values():
+            records.append({"op": "enqueue", "id": item.id, "kind": item.kind, "payload": item.payload,
+                            "coalesce_key": item.coalesce_key, "created_at": item.created_at})
+            if item.status != QUEUED or item.attempts:
+                records.append(self._update_record(item))
+        tmp_path = self._log_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._log.close()
+        os.replace(tmp_path, self._log_path)
+        self._log = open(self._log_path, "a", encoding="utf-8")
+        self._log_lines = len(records)
+
+    @staticmethod
+    def _update_record(item: WriteItem) -> Dict[str, Any]:
+        return {"op": "update", "id": item.id, "status": item.status, "attempts": item.attempts,
+                "error": item.error, "result": item.result, "updated_at": item.updated_at}
+
+    # --- Ghi ---
+    def enqueue(self, kind: str, payload: Dict[str, Any], coalesce_key: Union[str, None] = None,
+                item_id: Union[str, None] = None) -> Dict[str, Any]:
+        """Ghi bền item vào log rồi trả trạng thái; chưa gọi HRM. item_id: id do caller sinh trước (mặc định uuid)."""
+        return self.enqueue_many(kind, [payload], [coalesce_key], [item_id])[0]
+
+    def enqueue_many(self, kind: str, payloads: List[Dict[str, Any]],
+                     coalesce_keys: Union[List[Union[str, None]], None] = None,
+                     item_ids: Union[List[Union[str, None]], None] = None) -> List[Dict[str, Any]]:
+        """Như enqueue cho nhiều item, một lần ghi log (một fsync)."""
+        if kind not in self._handlers:
+            raise ValueError(f"Không có handler cho loại ghi {kind}")
+        keys = coalesce_keys or [None] * len(payloads)
+        ids = item_ids or [None] * len(payloads)
+        items = [WriteItem(kind, payload, key, item_id=item_id) for payload, key, item_id in zip(payloads, keys, ids)]
+        with self._lock:
+            records = []
+            superseded = []
+            latest: Dict[str, WriteItem] = {}
+            for item in items:
+                records.append({"op": "enqueue", "id": item.id, "kind": kind, "payload": item.payload,
+                                "coalesce_key": item.coalesce_key, "created_at": item.created_at})
+                if not item.coalesce_key:
+                    continue
+                previous = latest.get(item.coalesce_key) or self._items.get(self._by_key.get(item.coalesce_key))
+                if previous is not None and previous.status == QUEUED:
+                    superseded.append((previous, item))
+                    records.append({**self._update_record(previous), "status": SUPERSEDED,
+                                    "result": {"superseded_by": item.id}, "updated_at": item.created_at})
+                latest[item.coalesce_key] = item
+            # Ghi log trước, rồi mới đổi trạng thái trong bộ nhớ
+            self._append(records)
+            for previous, item in superseded:
+                previous.status = SUPERSEDED
+                previous.result = {"superseded_by": item.id}
+                previous.updated_at = item.created_at
+            for item in items:
+                self._items[item.id] = item
+                if item.coalesce_key:
+                    self._by_key[item.coalesce_key] = item.id
+            self._counters["enqueued"] += len(items)
+            self._counters["coalesced"] += len(superseded)
+            return [item.public() for item in items]
+
+    def pending(self, kind: str) -> List[Dict[str, Any]]:
+        """Payload các item `kind` chưa gửi xong (để lớp đọc phủ lên dữ liệu HRM)."""
+        with self._lock:
+            return [item.payload for item in self._items.values() if item.kind == kind and item.status == QUEUED]
+
+    def pending_by_id(self, kind: str) -> Dict[str, Dict[str, Any]]:
+        """Như pending, kèm id item (vd: dựng lại giữ chỗ theo write id sau khi khởi động lại)."""
+        with self._lock:
+            return {item.id: item.payload for item in self._items.values()
+                    if item.kind == kind and item.status == QUEUED}
+
+    def subscribe(self, listener: Callable[[Dict[str, Any]], None]):
+        self._listeners.append(listener)
+
+    def status(self, item_id: str) -> Union[Dict[str, Any], None]:
+        with self._lock:
+            item = self._items.get(item_id)
+            return item.public() if item is not None else None
+
+    # --- Gửi ---
+    def drain(self) -> int:
+        """Gửi mọi item đến hạn theo nhóm loại / lô. Trả về số item đã gửi thành công."""
+        sent = 0
+        with self._drain_lock:
+            while True:
+                batch = self._next_batch()
+                if not batch:
+                    break
+                done = self._send(batch)
+                if done is None:
+                    # HRM lỗi: các lô còn lại chờ lần drain sau thay vì dồn thêm lỗi
+                    break
+                sent += done
+            with self._lock:
+                self._trim_finished()
+                if self._log_lines > self._compact_after:
+                    self._compact()
+        return sent
+
+    def _next_batch(self) -> List[WriteItem]:
+        now = time.time()
+        with self._lock:
+            due = [item for item in self._items.values() if item.status == QUEUED and item.next_attempt_at <= now]
+            if not due:
+                return []
+            kind = due[0].kind
+            return [item for item in due if item.kind == kind][:self._batch_size]
+
+    def _send(self, batch: List[WriteItem]) -> Union[int, None]:
+        """Gửi một lô; trả số item thành công, None nếu HRM lỗi (drain dừng)."""
+        kind = batch[0].kind
+        try:
+            results = self._handlers[kind]([item.payload for item in batch])
+        except Rejected as e:
+            error = str(e) or type(e).__name__
+            if len(batch) == 1:
+                self._finish(batch, error=error, rejected=True)
+                print(f"[WRITE QUEUE] Item {kind} {batch[0].id} bị HRM từ chối: {error}")
+                return 0
+            # Một item hỏng làm cả câu lệnh bị từ chối: chia đôi để phần còn lại vẫn được ghi
+            with self._lock:
+                self._counters["splits"] += 1
+            half = len(batch) // 2
+            sent = 0
+            for part in (batch[:half], batch[half:]):
+                done = self._send(part)
+                if done is None:
+                    return None
+                sent += done
+            return sent
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            self._finish(batch, error=error, transient=isinstance(e, self._transient))
+            print(f"[WRITE QUEUE] Lô {kind} ({len(batch)} item) lỗi, thử lại sau: {error}")
+            return None
+        self._finish(batch, results=results)
+        return len(batch)
+
+    def _finish(self, batch: List[WriteItem], results: Union[List[Any], None] = None,
+                error: Union[str, None] = None, transient: bool = False, rejected: bool = False):
+        """Ghi kết quả một lần gửi: done / failed / hẹn lại với backoff."""
+        now = time.time()
+        with self._lock:
+            self._counters["batches"] += 1
+            for idx, item in enumerate(batch):
+                item.attempts += 0 if transient else 1
+                item.updated_at = now
+                if error is None:
+                    item.status = DONE
+                    item.error = None
+                    item.result = results[idx] if results and idx < len(results) else None
+                    self._counters["sent"] += 1
+                elif rejected or item.attempts >= self._max_attempts:
+                    item.status = FAILED
+                    item.error = error
+                    self._counters["failed"] += 1
+                    self._counters["rejected"] += int(rejected)
+                else:
+                    item.error = error
+                    backoff = min(self._max_backoff, self._base_backoff * (2 ** max(0, item.attempts - 1)))
+                    item.next_attempt_at = now + random.uniform(backoff / 2, backoff)
+                    self._counters["retries"] += 1
+            self._append(self._update_record(item) for item in batch)
+            finished = [item.public() for item in batch if item.status in FINISHED]
+        for public in finished:
+            for listener in self._listeners:
+                try:
+                    listener(public)
+                except Exception as e:
+                    print(f"[WRITE QUEUE] Listener lỗi ({public['kind']} {public['id']}): {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            queued = [item for item in self._items.values() if item.status == QUEUED]
+            return {
+                **self._counters,
+                "queued": len(queued),
+                "oldest_queued_seconds": round(time.time() - min(i.created_at for i in queued), 1) if queued else None,
+                "by_kind": {kind: sum(1 for i in queued if i.kind == kind) for kind in self._handlers},
+                "log_lines": self._log_lines,
+            }
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Cho phép import `services.*` / `core.*` như khi chạy từ thư mục backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,123 @@
+import sqlite3
+from datetime import date
+
+import pytest
+
+from services.change_capture import ChangeCapture
+from services.hrm_replica import HRMReplica
+
+SCHEMA = """
+BẢNG cham_cong:
+- id (int)
+- nhan_vien_id (int)
+- ngay (date)
+- check_in (time)
+- check_out (time)
+- ngay_tao (datetime)
+
+BẢNG don_nghi_phep:
+- id (int)
+- nhanvien_id (int)
+- trang_thai (varchar)
+- ngay_tao (datetime)
+
+BẢNG nhanvien:
+- id (int)
+- ho_ten (varchar)
+- phong_ban_id (int)
+- ngay_tao (datetime)
+"""
+
+TODAY = date.today().isoformat()
+
+
+class FakeHRM:
+    """HRM giả bằng một DB SQLite riêng; fetch_rows chạy thẳng câu SQL (bỏ tiền tố N'...')."""
+
+    def __init__(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(f"""
+        CREATE TABLE cham_cong (id INTEGER PRIMARY KEY, nhan_vien_id INTEGER, ngay TEXT,
+                                check_in TEXT, check_out TEXT, ngay_tao TEXT);
+        CREATE TABLE don_nghi_phep (id INTEGER PRIMARY KEY, nhanvien_id INTEGER, trang_thai TEXT, ngay_tao TEXT);
+        CREATE TABLE nhanvien (id INTEGER PRIMARY KEY, ho_ten TEXT, phong_ban_id INTEGER, ngay_tao TEXT);
+        INSERT INTO cham_cong VALUES (1, 5, '{TODAY}', '08:00:00', NULL, '{TODAY} 08:00:00');
+        INSERT INTO cham_cong VALUES (2, 6, '2020-01-02', '08:00:00', '17:00:00', '2020-01-02 08:00:00');
+        INSERT INTO don_nghi_phep VALUES (1, 5, 'Chờ duyệt', '2026-01-01 09:00:00');
+        INSERT INTO nhanvien VALUES (5, 'An', 1, '2020-01-01 00:00:00');
+        INSERT INTO nhanvien VALUES (6, 'Bình', 1, '2020-01-01 00:00:00');
+        """)
+
+    def __call__(self, sql):
+        rows = self.conn.execute(sql.replace("N'", "'")).fetchall()
+        return [dict(row) for row in rows], None
+
+    def execute(self, sql):
+        self.conn.execute(sql)
+
+
+@pytest.fixture
+def hrm():
+    return FakeHRM()
+
+
+@pytest.fixture
+def replica(hrm):
+    replica = HRMReplica(hrm, SCHEMA)
+    replica.refresh()
+    return replica
+
+
+def capture(hrm, replica, **kwargs):
+    cdc = ChangeCapture(hrm, replica, **kwargs)
+    events = []
+    cdc.subscribe(lambda table, rows: events.append((table, [row["id"] for row in rows])))
+    return cdc, events
+
+
+def local(replica, sql):
+    return replica.local_rows(sql)
+
+
+def test_in_place_checkout_is_captured_and_table_marked_synced(hrm, replica):
+    cdc, events = capture(hrm, replica, table_reload_seconds=3600)
+    replica.mark_synced("cham_cong", 0)
+    hrm.execute("UPDATE cham_cong SET check_out = '17:30:00' WHERE id = 1")
+
+    cdc.poll()
+    assert local(replica, "SELECT check_out FROM cham_cong WHERE id = 1") == [("17:30:00",)]
+    assert ("cham_cong", [1]) in events
+    assert replica.lag("cham_cong") < 5
+
+
+def test_unchanged_window_rows_do_not_notify(hrm, replica):
+    cdc, events = capture(hrm, replica, table_reload_seconds=3600)
+    cdc.poll()
+    cdc.poll()
+    assert all(table != "cham_cong" for table, _ in events)
+
+
+def test_pending_leave_leaving_window_is_captured(hrm, replica):
+    cdc, events = capture(hrm, replica, table_reload_seconds=3600)
+    hrm.execute("UPDATE don_nghi_phep SET trang_thai = 'Đã duyệt' WHERE id = 1")
+
+    cdc.poll()
+    assert local(replica, "SELECT trang_thai FROM don_nghi_phep WHERE id = 1") == [("Đã duyệt",)]
+    assert ("don_nghi_phep", [1]) in events
+
+
+def test_tables_without_update_column_reload_on_interval(hrm, replica):
+    cdc, events = capture(hrm, replica, table_reload_seconds=3600)
+    hrm.execute("UPDATE nhanvien SET phong_ban_id = 2 WHERE id = 5")
+    hrm.execute("DELETE FROM nhanvien WHERE id = 6")
+
+    cdc.poll()
+    assert local(replica, "SELECT phong_ban_id FROM nhanvien WHERE id = 5") == [(1,)]
+
+    cdc, events = capture(hrm, replica, table_reload_seconds=0)
+    replica.mark_synced("nhanvien", 0)
+    cdc.poll()
+    assert local(replica, "SELECT id, phong_ban_id FROM nhanvien") == [(5, 2)]
+    assert events == [("nhanvien", [5])]
+    assert replica.lag("nhanvien") < 5
@@ -0,0 +1,19 @@
+import asyncio
+
+from services.dashboard_hub import DashboardHub
+
+
+def test_closed_subscriber_is_dropped_without_breaking_others():
+    hub = DashboardHub(lambda scope: {"on_leave": 3})
+    dead = asyncio.new_event_loop()
+    dead.close()
+    live = asyncio.new_event_loop()
+    live_queue = asyncio.Queue()
+    hub._subscribers["company"] = [(dead, asyncio.Queue()), (live, live_queue)]
+
+    hub.publish_all()
+    live.run_until_complete(asyncio.sleep(0))
+    live.close()
+
+    assert live_queue.get_nowait() == {"on_leave": 3}
+    assert hub.subscriber_count() == 1
@@ -0,0 +1,58 @@
+import pytest
+
+from services.hrm_replica import HRMReplica, translate_sql
+
+SCHEMA = """
+BẢNG don_nghi_phep:
+- id (int)
+- nhanvien_id (int)
+- tu_ngay (date)
+- trang_thai (varchar)
+"""
+
+ROWS = [
+    {"id": 1, "nhanvien_id": 5, "tu_ngay": "2026-02-03T00:00:00", "trang_thai": "Đã duyệt"},
+    {"id": 2, "nhanvien_id": 5, "tu_ngay": "2026-02-10T00:00:00", "trang_thai": "đã duyệt"},
+    {"id": 3, "nhanvien_id": 6, "tu_ngay": "2026-03-01T00:00:00", "trang_thai": "Chờ duyệt"},
+]
+
+
+@pytest.fixture
+def replica():
+    replica = HRMReplica(lambda sql: (ROWS, None), SCHEMA)
+    replica.refresh()
+    return replica
+
+
+def scalar(replica, sql):
+    result = replica.query(sql)
+    assert result is not None and result.ok, sql
+    return result.dicts()[0]["v"]
+
+
+def test_division_keeps_fraction_like_mysql(replica):
+    assert scalar(replica, "SELECT 7/2 AS v FROM don_nghi_phep LIMIT 1") == 3.5
+    pct = scalar(replica, "SELECT COUNT(*)*100/9 AS v FROM don_nghi_phep")
+    assert pct == pytest.approx(33.333, abs=0.001)
+
+
+def test_division_rewrite_skips_strings():
+    assert translate_sql("SELECT '1/2' AS v FROM t") == "SELECT '1/2' AS v FROM t"
+    assert translate_sql("SELECT a/b AS v FROM t") == "SELECT a * 1.0 /b AS v FROM t"
+
+
+def test_text_equality_is_case_insensitive(replica):
+    assert scalar(replica, "SELECT COUNT(*) AS v FROM don_nghi_phep WHERE trang_thai = N'đã duyệt'") == 2
+    groups = replica.query("SELECT trang_thai, COUNT(*) AS n FROM don_nghi_phep GROUP BY trang_thai")
+    assert len(groups) == 2
+
+
+def test_date_format_month_and_weekday_names(replica):
+    assert scalar(replica, "SELECT DATE_FORMAT(tu_ngay, '%M %Y') AS v FROM don_nghi_phep WHERE id = 1") \
+        == "February 2026"
+    assert scalar(replica, "SELECT DATE_FORMAT(tu_ngay, '%W %e/%c') AS v FROM don_nghi_phep WHERE id = 1") \
+        == "Tuesday 3/2"
+
+
+def test_unmapped_date_format_falls_back_to_hrm(replica):
+    assert replica.query("SELECT DATE_FORMAT(tu_ngay, '%U') AS v FROM don_nghi_phep") is None
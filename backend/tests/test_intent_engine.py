@@ -0,0 +1,79 @@
+import pytest
+
+from services.intent_engine import IntentEngine, data_scope, time_str
+
+
+class FakeResult:
+    ok = True
+    error = None
+
+    def dicts(self):
+        return []
+
+
+@pytest.fixture
+def engine():
+    return IntentEngine(lambda sql: FakeResult())
+
+
+@pytest.mark.parametrize("question", [
+    "Cho xem check-in của anh Nam hôm nay",
+    "Xem có việc gì của phòng Kinh doanh không",
+    "Công việc của em Lan là gì",
+])
+def test_questions_about_others_fall_back_to_llm(engine, question):
+    assert engine.answer(question, "manager", 5, 2) is None
+
+
+@pytest.mark.parametrize("question, intent", [
+    ("Hôm nay tôi check-in lúc mấy giờ", "my_checkin"),
+    ("Tôi còn bao nhiêu ngày phép", "my_leave_balance"),
+    ("Công việc của tôi là gì", "my_open_tasks"),
+])
+def test_first_person_questions_use_shortcut(engine, question, intent):
+    assert engine.answer(question, "manager", 5, 2).intent == intent
+
+
+@pytest.mark.parametrize("role", ["admin", "manager"])
+def test_personal_questions_are_scoped_to_the_user(engine, role):
+    question = "Tôi check-in lúc mấy giờ"
+    assert engine.depends_on_user(question, role)
+    scopes = {data_scope(role, user_id, 3, engine.depends_on_user(question, role)) for user_id in (1, 2)}
+    assert len(scopes) == 2
+
+
+def test_shared_questions_coalesce_per_company_or_department(engine):
+    question = "Hôm nay ai đi muộn"
+    assert not engine.depends_on_user(question, "manager")
+    assert data_scope("manager", 1, 3, False) == data_scope("manager", 2, 3, False) == "dept:3"
+    assert data_scope("manager", 1, 4, False) != "dept:3"
+    assert data_scope("admin", 1, None, False) == data_scope("admin", 2, None, False) == "company"
+    assert data_scope("employee", 1, 3, False) != data_scope("employee", 2, 3, False)
+
+
+@pytest.mark.parametrize("question", [
+    "Ai không đi muộn hôm nay",
+    "Nhân viên nào đi muộn nhiều nhất",
+    "Ai hay đi muộn nhất",
+    "Những ai đi muộn quá 3 lần",
+    "Ai thường đi trễ",
+])
+def test_late_variants_are_not_the_daily_late_list(engine, question):
+    assert engine.answer(question, "admin", 1, None) is None
+
+
+@pytest.mark.parametrize("question", ["Hôm nay ai đi muộn", "Đi muộn hôm qua gồm những ai"])
+def test_daily_late_list_uses_shortcut(engine, question):
+    assert engine.answer(question, "admin", 1, None).intent == "late_today"
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("08:01:00", "08:01:00"),
+    ("08:01:00.123", "08:01:00"),
+    ("08:01:00.1234567", "08:01:00"),
+    ("2026-02-01T08:01:00", "08:01:00"),
+    ("2026-02-01 08:01:00.5", "08:01:00"),
+    ("8:01", "08:01:00"),
+])
+def test_time_str(value, expected):
+    assert time_str(value) == expected
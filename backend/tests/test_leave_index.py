@@ -0,0 +1,112 @@
+from services.leave_index import LeaveIndex
+
+
+class FakeHRM:
+    """fetch_rows giả: đơn nghỉ phép / số ngày phép hiện có; `during_fetch` chạy giữa lúc đang nạp."""
+
+    def __init__(self, balance=12, year=2026):
+        self.leaves = []
+        self.balance = balance
+        self.year = year
+        self.during_fetch = None
+
+    def __call__(self, sql):
+        if "FROM don_nghi_phep" in sql:
+            rows = [dict(row) for row in self.leaves]
+            if self.during_fetch:
+                hook, self.during_fetch = self.during_fetch, None
+                hook()
+            return rows, None
+        if "FROM ngay_phep_nam" in sql:
+            return [{"nhan_vien_id": 7, "nam": self.year, "ngay_phep_con_lai": self.balance}], None
+        return [{"id": 7, "phong_ban_id": 1}], None
+
+    def insert(self, row_id, tu_ngay, den_ngay, trang_thai="Chờ duyệt"):
+        self.leaves.append({"id": row_id, "nhanvien_id": 7, "tu_ngay": tu_ngay,
+                            "den_ngay": den_ngay, "trang_thai": trang_thai})
+
+
+def loaded_index(hrm):
+    index = LeaveIndex(hrm)
+    assert index.refresh()
+    return index
+
+
+def test_reservation_made_during_refresh_survives_swap():
+    hrm = FakeHRM()
+    index = loaded_index(hrm)
+    hrm.during_fetch = lambda: index.reserve("w1", 7, "2026-11-02", "2026-11-03")
+
+    assert index.refresh()
+    assert "Trùng" in index.validate(7, "2026-11-03", "2026-11-04")
+    assert index.stats()["reservations"] == 1
+
+
+def test_written_reservation_is_not_double_counted():
+    hrm = FakeHRM(balance=3)
+    index = loaded_index(hrm)
+    assert index.reserve("w1", 7, "2026-11-02", "2026-11-03") is None
+
+    # Lượt ghi xong giữa chừng: lần nạp thấy dòng HRM, giữ chỗ được bỏ thay vì tính hai lần
+    hrm.insert(101, "2026-11-02", "2026-11-03")
+    index.mark_written("w1")
+    assert index.refresh()
+    assert index.stats()["reservations"] == 0
+    assert index.stats()["requests"] == 1
+    assert index.validate(7, "2026-11-10", "2026-11-10") is None
+
+
+def test_written_reservation_dropped_when_row_missing_after_write():
+    hrm = FakeHRM()
+    index = loaded_index(hrm)
+    index.reserve("w1", 7, "2026-11-02", "2026-11-03")
+    index.mark_written("w1")
+
+    # Ghi xong trước lần nạp nhưng HRM không còn dòng (đã xóa / từ chối)
+    assert index.refresh()
+    assert index.validate(7, "2026-11-02", "2026-11-03") is None
+
+
+def test_release_frees_the_range():
+    hrm = FakeHRM()
+    index = loaded_index(hrm)
+    index.reserve("w1", 7, "2026-11-02", "2026-11-03")
+    index.release("w1")
+
+    assert index.validate(7, "2026-11-02", "2026-11-03") is None
+    assert index.refresh()
+    assert index.validate(7, "2026-11-02", "2026-11-03") is None
+
+
+def test_hold_before_first_load_is_merged():
+    hrm = FakeHRM()
+    index = LeaveIndex(hrm)
+    index.hold("w1", 7, "2026-11-02", "2026-11-03")
+
+    assert index.refresh()
+    assert index.validate(7, "2026-11-02", "2026-11-02") is not None
+
+
+def test_queued_decision_applied_at_swap():
+    hrm = FakeHRM()
+    hrm.insert(101, "2026-11-02", "2026-11-03")
+    index = loaded_index(hrm)
+    decisions = {}
+    hrm.during_fetch = lambda: decisions.update({101: False})
+
+    assert index.refresh(lambda: decisions)
+    assert index.validate(7, "2026-11-02", "2026-11-03") is None
+
+
+def test_balance_checked_against_year_of_start_date():
+    hrm = FakeHRM(balance=2, year=2026)
+    index = loaded_index(hrm)
+
+    assert "Không đủ ngày phép" in index.validate(7, "2026-11-02", "2026-11-04")
+    # Năm 2027 chưa có dòng ngay_phep_nam -> không dùng số dư 2026 để chặn
+    assert index.validate(7, "2027-01-04", "2027-01-08") is None
+
+    hrm.year = 2027
+    assert index.refresh()
+    assert "Không đủ ngày phép" in index.validate(7, "2027-01-04", "2027-01-08")
+    assert index.validate(7, "2026-11-02", "2026-11-04") is None
@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+
+from core.llm_executor import LLMDeadlineExceeded, LLMExecutor
+
+
+class FakeLLM:
+    """LLM giả: mỗi lần gọi lấy (độ trễ, kết quả hoặc exception) kế tiếp trong kịch bản."""
+
+    def __init__(self, *script):
+        self._script = list(script)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def __call__(self):
+        with self._lock:
+            delay, outcome = self._script[min(self.calls, len(self._script) - 1)]
+            self.calls += 1
+        time.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def wait_until(predicate, timeout=2.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end and not predicate():
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_deadline_exceeded_and_abandoned_call_released():
+    executor = LLMExecutor({"sql": 0.1}, hedge_default_delay=5)
+    llm = FakeLLM((0.3, "SELECT 1"))
+    with pytest.raises(LLMDeadlineExceeded):
+        executor.call("sql", llm)
+    assert executor.stats()["deadline_exceeded"] == 1
+    assert executor.stats()["abandoned_in_flight"] == 1
+    assert wait_until(lambda: executor.stats()["abandoned_in_flight"] == 0)
+
+
+def test_hedge_wins_when_primary_is_slow():
+    executor = LLMExecutor({"sql": 2}, hedge_default_delay=0.05)
+    llm = FakeLLM((0.5, "slow"), (0.0, "fast"))
+    assert executor.call("sql", llm) == "fast"
+    stats = executor.stats()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+    assert wait_until(lambda: executor.stats()["abandoned_in_flight"] == 0)
+
+
+def test_hedge_skipped_when_abandoned_cap_reached():
+    executor = LLMExecutor({"sql": 2}, hedge_default_delay=0.05, max_abandoned=0)
+    llm = FakeLLM((0.2, "only"))
+    assert executor.call("sql", llm) == "only"
+    assert llm.calls == 1
+    assert executor.stats()["hedges_skipped"] == 1
+
+
+def test_retry_after_error():
+    executor = LLMExecutor({"sql": 5}, hedge_default_delay=5)
+    llm = FakeLLM((0.0, RuntimeError("rate limited")), (0.0, "SELECT 1"))
+    assert executor.call("sql", llm) == "SELECT 1"
+    assert executor.stats()["retries"] == 1
@@ -0,0 +1,99 @@
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+from services.query_guard import QueryGuard
+
+SINCE = (date.today() - timedelta(days=90)).isoformat()
+
+
+def test_left_join_anti_join_is_left_alone():
+    sql = "SELECT nv.ho_ten FROM nhanvien nv LEFT JOIN cham_cong cc ON cc.nhan_vien_id = nv.id WHERE cc.id IS NULL"
+    decision = QueryGuard().review(sql)
+    assert decision.sql == sql and decision.rejected is None
+
+
+def test_left_join_is_bounded_in_on_clause():
+    sql = ("SELECT nv.ho_ten, cc.check_in FROM nhanvien nv LEFT JOIN cham_cong cc ON cc.nhan_vien_id = nv.id "
+           "ORDER BY nv.ho_ten")
+    decision = QueryGuard().review(sql)
+    assert decision.sql == (f"SELECT nv.ho_ten, cc.check_in FROM nhanvien nv LEFT JOIN cham_cong cc "
+                            f"ON (cc.nhan_vien_id = nv.id) AND cc.ngay >= '{SINCE}' ORDER BY nv.ho_ten")
+
+
+def test_inner_join_is_bounded_in_where():
+    sql = "SELECT nv.ho_ten FROM cham_cong cc JOIN nhanvien nv ON cc.nhan_vien_id = nv.id LIMIT 10"
+    decision = QueryGuard().review(sql)
+    assert f"WHERE cc.ngay >= '{SINCE}'" in decision.sql
+
+
+def test_right_join_is_left_alone():
+    sql = "SELECT * FROM nhanvien nv RIGHT JOIN cham_cong cc ON cc.nhan_vien_id = nv.id"
+    assert QueryGuard().review(sql).sql == sql
+
+
+def test_unbounded_aggregate_is_rejected_not_truncated():
+    decision = QueryGuard().review("SELECT COUNT(*) FROM cham_cong")
+    assert decision.rejected == "unbounded_history_aggregate"
+    assert decision.sql == "SELECT COUNT(*) FROM cham_cong"
+
+
+def test_dated_aggregate_passes():
+    sql = ("SELECT nv.ho_ten, COUNT(*) FROM nhanvien nv JOIN cham_cong cc ON cc.nhan_vien_id = nv.id "
+           "WHERE cc.ngay >= '2026-01-01' GROUP BY nv.ho_ten")
+    decision = QueryGuard().review(sql)
+    assert decision.sql == sql and decision.rejected is None
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT COUNT(*) FROM cham_cong cc WHERE DATE_FORMAT(cc.ngay, '%Y-%m') = DATE_FORMAT(CURDATE(), '%Y-%m')",
+    "SELECT COUNT(*) FROM cham_cong cc WHERE cc.ngay LIKE '2026-02%'",
+    "SELECT COUNT(*) FROM cham_cong cc WHERE EXTRACT(MONTH FROM cc.ngay) = 2 AND EXTRACT(YEAR FROM cc.ngay) = 2026",
+    "SELECT COUNT(*) FROM cham_cong WHERE '2026-02-01' <= ngay",
+])
+def test_date_predicates_through_functions_count_as_bounds(sql):
+    decision = QueryGuard().review(sql)
+    assert decision.sql == sql and decision.rejected is None
+
+
+def test_group_by_date_function_is_not_a_bound():
+    decision = QueryGuard().review("SELECT YEAR(ngay), COUNT(*) FROM cham_cong GROUP BY YEAR(ngay)")
+    assert decision.rejected == "unbounded_history_aggregate"
+
+
+def test_truncated_listing_carries_note():
+    decision = QueryGuard(cham_cong_days=30).review("SELECT * FROM cham_cong cc")
+    assert decision.rewrites == ["cham_cong_date_bound"]
+    assert "30 ngày" in decision.note
+    assert QueryGuard().review("SELECT * FROM cham_cong WHERE ngay = CURDATE()").note is None
+
+
+def test_not_in_keeps_null_semantics_for_nullable_columns():
+    sql = ("SELECT nv.ho_ten FROM nhanvien nv WHERE nv.quan_ly_id NOT IN "
+           "(SELECT nhan_vien_id FROM cham_cong WHERE ngay = CURDATE())")
+    assert QueryGuard().review(sql).sql == (
+        "SELECT nv.ho_ten FROM nhanvien nv WHERE (nv.quan_ly_id IS NOT NULL AND NOT EXISTS "
+        "(SELECT 1 FROM cham_cong WHERE (ngay = CURDATE()) AND "
+        "(cham_cong.nhan_vien_id = nv.quan_ly_id OR cham_cong.nhan_vien_id IS NULL)))")
+
+
+def test_not_in_on_key_columns_is_a_plain_anti_join():
+    sql = "SELECT ho_ten FROM nhanvien nv WHERE nv.id NOT IN (SELECT p.id FROM phong_ban p)"
+    assert QueryGuard().review(sql).sql == \
+        "SELECT ho_ten FROM nhanvien nv WHERE NOT EXISTS (SELECT 1 FROM phong_ban p WHERE p.id = nv.id)"
+
+
+def test_not_in_rewrite_matches_sqlite_results():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+    CREATE TABLE nhanvien (id INTEGER, quan_ly_id INTEGER);
+    CREATE TABLE cham_cong (nhan_vien_id INTEGER);
+    INSERT INTO nhanvien VALUES (1, 10), (2, 20), (3, NULL);
+    INSERT INTO cham_cong VALUES (10);
+    """)
+    sql = "SELECT id FROM nhanvien nv WHERE nv.quan_ly_id NOT IN (SELECT nhan_vien_id FROM cham_cong)"
+    rewritten = QueryGuard().review(sql).sql
+    assert conn.execute(rewritten).fetchall() == conn.execute(sql).fetchall() == [(2,)]
+    conn.execute("INSERT INTO cham_cong VALUES (NULL)")
+    assert conn.execute(rewritten).fetchall() == conn.execute(sql).fetchall() == []
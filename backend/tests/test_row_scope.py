@@ -0,0 +1,51 @@
+import pytest
+
+from services.row_scope import scope_violation
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT check_in, check_out FROM cham_cong WHERE nhan_vien_id = 5 AND ngay = CURRENT_DATE",
+    "SELECT * FROM don_nghi_phep WHERE nhanvien_id = '5'",
+    "SELECT cv.ten_cong_viec FROM cong_viec cv JOIN cong_viec_nguoi_nhan cvnn ON cv.id = cvnn.cong_viec_id "
+    "WHERE cvnn.nhan_vien_id = 5 AND cv.trang_thai != 'Đã hoàn thành'",
+    "SELECT ten_tai_lieu, mo_ta FROM tai_lieu",
+    "SELECT COUNT(*) FROM cham_cong c WHERE c.nhan_vien_id = 5 AND EXTRACT(MONTH FROM c.ngay) = 2",
+])
+def test_employee_queries_in_scope(sql):
+    assert scope_violation(sql, "employee", 5, None) is None
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT nv.ho_ten, nv.luong_co_ban FROM nhanvien nv WHERE nv.phong_ban_id = 5",
+    "SELECT * FROM cong_viec WHERE du_an_id = 5",
+    "SELECT * FROM luong WHERE nhan_vien_id = 6",
+    "SELECT * FROM luong WHERE nhan_vien_id = 5 OR 1 = 1",
+    "SELECT * FROM luong WHERE ghi_chu = 'nhan_vien_id = 5'",
+    "SELECT * FROM cau_hinh_he_thong WHERE id = 5",
+])
+def test_employee_bypasses_rejected(sql):
+    assert scope_violation(sql, "employee", 5, None) is not None
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT nv.ho_ten, c.check_in FROM cham_cong c JOIN nhanvien nv ON c.nhan_vien_id = nv.id "
+    "WHERE c.ngay = CURRENT_DATE AND c.check_in >= '08:06:00' AND nv.phong_ban_id = 3",
+    "SELECT nv.ho_ten FROM nhanvien nv WHERE nv.phong_ban_id = 3 "
+    "AND nv.id NOT IN (SELECT nhan_vien_id FROM cham_cong WHERE ngay = CURRENT_DATE)",
+    "SELECT ten_cong_viec FROM cong_viec WHERE nguoi_giao_id = 7",
+    "SELECT d.ten_du_an FROM du_an d "
+    "WHERE d.phong_ban LIKE CONCAT('%', (SELECT ten_phong FROM phong_ban WHERE id = 3), '%')",
+])
+def test_manager_queries_in_scope(sql):
+    assert scope_violation(sql, "manager", 7, 3) is None
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT ho_ten, luong_co_ban FROM nhanvien nv WHERE nv.id = 3",
+    "SELECT nv.ho_ten, c.check_in FROM cham_cong c JOIN nhanvien nv ON c.nhan_vien_id = nv.id "
+    "WHERE nv.phong_ban_id = 4",
+    "SELECT * FROM cham_cong WHERE nhan_vien_id = 3",
+    "SELECT * FROM nhanvien WHERE phong_ban_id = 3 OR phong_ban_id = 4",
+])
+def test_manager_bypasses_rejected(sql):
+    assert scope_violation(sql, "manager", 7, 3) is not None
@@ -0,0 +1,81 @@
+from services.write_queue import DONE, FAILED, QUEUED, Rejected, WriteQueue
+
+
+class FakeHRM:
+    """Handler giả: từ chối cả lô nếu lô chứa payload hỏng, lỗi kết nối khi `down`."""
+
+    def __init__(self):
+        self.down = False
+        self.batches = []
+
+    def __call__(self, payloads):
+        self.batches.append([p["n"] for p in payloads])
+        if self.down:
+            raise RuntimeError("timeout")
+        bad = [p["n"] for p in payloads if p.get("bad")]
+        if bad:
+            raise Rejected(f"FK violation: {bad}")
+        return [p["n"] * 10 for p in payloads]
+
+
+def make_queue(tmp_path, hrm, **kwargs):
+    return WriteQueue(str(tmp_path / "writes.log"), {"write": hrm}, **kwargs)
+
+
+def test_rejected_batch_is_split_and_only_bad_item_fails(tmp_path):
+    hrm = FakeHRM()
+    queue = make_queue(tmp_path, hrm)
+    items = queue.enqueue_many("write", [{"n": n, "bad": n == 3} for n in range(5)])
+
+    assert queue.drain() == 4
+    statuses = {item["id"]: queue.status(item["id"]) for item in items}
+    assert [s["status"] for s in statuses.values()] == [DONE, DONE, DONE, FAILED, DONE]
+    assert [s["result"] for s in statuses.values()] == [0, 10, 20, None, 40]
+    failed = statuses[items[3]["id"]]
+    assert failed["attempts"] == 1 and "FK violation" in failed["error"]
+    assert queue.stats()["rejected"] == 1
+
+    # Item bị từ chối không được gửi lại
+    calls = len(hrm.batches)
+    assert queue.drain() == 0
+    assert len(hrm.batches) == calls
+
+
+def test_connection_error_retries_whole_batch(tmp_path):
+    hrm = FakeHRM()
+    hrm.down = True
+    queue = make_queue(tmp_path, hrm, base_backoff=0.0, max_backoff=0.0)
+    items = queue.enqueue_many("write", [{"n": n} for n in range(3)])
+
+    assert queue.drain() == 0
+    assert hrm.batches == [[0, 1, 2]]
+    assert all(queue.status(item["id"])["status"] == QUEUED for item in items)
+
+    hrm.down = False
+    assert queue.drain() == 3
+    assert all(queue.status(item["id"])["status"] == DONE for item in items)
+
+
+def test_rejection_survives_restart(tmp_path):
+    hrm = FakeHRM()
+    queue = make_queue(tmp_path, hrm)
+    item = queue.enqueue("write", {"n": 1, "bad": True})
+    queue.drain()
+
+    reloaded = make_queue(tmp_path, FakeHRM())
+    assert reloaded.status(item["id"])["status"] == FAILED
+    assert reloaded.drain() == 0
+
+
+def test_listener_sees_finished_items_with_caller_id(tmp_path):
+    hrm = FakeHRM()
+    queue = make_queue(tmp_path, hrm)
+    finished = []
+    queue.subscribe(lambda item: finished.append((item["id"], item["status"])))
+    queue.enqueue("write", {"n": 1}, item_id="ok")
+    queue.enqueue("write", {"n": 2, "bad": True}, item_id="bad")
+    assert set(queue.pending_by_id("write")) == {"ok", "bad"}
+
+    queue.drain()
+    assert sorted(finished) == [("bad", FAILED), ("ok", DONE)]
+    assert queue.pending_by_id("write") == {}
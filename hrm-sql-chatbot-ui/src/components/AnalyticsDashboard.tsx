@@ -88,24 +88,46 @@ export default function AnalyticsDashboard({ role, userId, deptId, onClose }: An
   const [isLive, setIsLive] = useState(true);
   const [lastUpdate, setLastUpdate] = useState(new Date());
 
+  const API_BASE = import.meta.env.VITE_API_BASE || 'http://127.0.0.1:8000';
+
   useEffect(() => {
     fetchData();
-    
-    const interval = setInterval(() => {
-      if (isLive) {
-        fetchData();
-        setLastUpdate(new Date());
-      }
-    }, 30000);
+  }, [role, userId, deptId]);
 
-    return () => clearInterval(interval);
-  }, [isLive, role, userId, deptId]);
+  // Live: server chỉ đẩy số liệu khi có thay đổi (SSE), không poll định kỳ
+  useEffect(() => {
+    if (!isLive) return;
+
+    const streamUrl = role === 'admin'
+      ? `${API_BASE}/analytics/stream?role=admin`
+      : `${API_BASE}/analytics/stream?role=manager&dept_id=${deptId}`;
+    const source = new EventSource(streamUrl);
+
+    // Server tính sẵn trường dẫn xuất (task_completion_rate, checkedInPercent) trong từng delta;
+    // snapshot_only (xếp hạng, sức khỏe dự án...) giữ nguyên số liệu lúc tải dashboard
+    const applyStats = (event: MessageEvent) => {
+      const { task_completion_rate, ...changes } = JSON.parse(event.data);
+      delete changes.snapshot_only;
+      setData(prev => {
+        if (!prev) return prev;
+        return {
+          ...prev,
+          stats: { ...prev.stats, ...changes },
+          task_completion_rate: task_completion_rate ?? prev.task_completion_rate
+        };
+      });
+      setLastUpdate(new Date());
+    };
+
+    source.addEventListener('snapshot', applyStats);
+    source.addEventListener('delta', applyStats);
+
+    return () => source.close();
+  }, [isLive, role, deptId]);
 
   const fetchData = async () => {
     setLoading(true);
     try {
-      const API_BASE = import.meta.env.VITE_API_BASE || 'http://127.0.0.1:8000';
-      
       // Hiện tại chỉ có admin analytics được nâng cấp
       const url = role === 'admin' 
         ? `${API_BASE}/admin/analytics`
@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react';
 import './ActionForms.css';
+import { watchWrites } from '../services/writeStatus';
 
 interface LeaveRequest {
   id: number;
@@ -12,6 +13,8 @@ interface LeaveRequest {
   ly_do: string;
   trang_thai: string;
   ngay_tao: string;
+  pending_write?: boolean;
+  write_error?: string;
 }
 
 interface LeaveApprovalPanelProps {
@@ -22,54 +25,106 @@ interface LeaveApprovalPanelProps {
 export default function LeaveApprovalPanel({ adminId, onClose }: LeaveApprovalPanelProps) {
   const [requests, setRequests] = useState<LeaveRequest[]>([]);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [processing, setProcessing] = useState<number | null>(null);
+  const [selected, setSelected] = useState<Set<number>>(new Set());
+  const [bulkProcessing, setBulkProcessing] = useState(false);
   const [filter, setFilter] = useState<'pending' | 'all'>('pending');
 
   const API_BASE = import.meta.env.VITE_API_BASE || 'http://127.0.0.1:8000';
+  const PAGE_SIZE = 50;
 
   useEffect(() => {
+    setSelected(new Set());
     fetchRequests();
   }, [filter]);
 
-  const fetchRequests = async () => {
-    setLoading(true);
+  // Phân trang keyset: trang sau đọc tiếp từ next_cursor của trang trước
+  const fetchRequests = async (cursor: string | null = null) => {
+    if (cursor) {
+      setLoadingMore(true);
+    } else {
+      setLoading(true);
+    }
     try {
-      const response = await fetch(`${API_BASE}/leave-requests?status=${filter}`);
+      const params = new URLSearchParams({ status: filter, limit: String(PAGE_SIZE) });
+      if (cursor) params.set('cursor', cursor);
+      const response = await fetch(`${API_BASE}/leave-requests?${params}`);
       const data = await response.json();
       if (data.success) {
-        setRequests(data.requests);
+        setRequests(prev => cursor ? [...prev, ...data.requests] : data.requests);
+        setNextCursor(data.next_cursor || null);
       }
     } catch (error) {
       console.error('Error fetching leave requests:', error);
-      // Demo data
-      setRequests([
-        {
-          id: 1,
-          nhan_vien_id: 3,
-          ho_ten: 'Lê Văn Cường',
-          phong_ban: 'Phòng Kỹ thuật',
-          tu_ngay: '2026-02-05',
-          den_ngay: '2026-02-07',
-          so_ngay: 3,
-          ly_do: 'Về quê có việc gia đình',
-          trang_thai: 'Chờ duyệt',
-          ngay_tao: '2026-02-01'
-        },
-        {
-          id: 2,
-          nhan_vien_id: 4,
-          ho_ten: 'Phạm Thị Dung',
-          phong_ban: 'Phòng Kinh doanh',
-          tu_ngay: '2026-02-10',
-          den_ngay: '2026-02-12',
-          so_ngay: 3,
-          ly_do: 'Khám sức khỏe định kỳ',
-          trang_thai: 'Chờ duyệt',
-          ngay_tao: '2026-02-01'
-        }
-      ]);
     } finally {
       setLoading(false);
+      setLoadingMore(false);
+    }
+  };
+
+  const markStatus = (ids: number[], approved: boolean) => {
+    const idSet = new Set(ids);
+    setRequests(prev => prev.map(req =>
+      idSet.has(req.id)
+        ? {...req, trang_thai: approved ? 'Đã duyệt' : 'Từ chối', pending_write: true, write_error: undefined}
+        : req
+    ));
+  };
+
+  // Theo dõi quyết định đã xếp hàng ghi; HRM không ghi được -> trả đơn về chờ duyệt và hiện lý do
+  const trackWrites = (writeIds: Record<string, string>) => {
+    const requestByWrite = new Map(Object.entries(writeIds).map(([requestId, writeId]) => [writeId, Number(requestId)]));
+    watchWrites(API_BASE, Array.from(requestByWrite.keys()), (write) => {
+      // superseded: quyết định sau cùng cho đơn này đang được theo dõi riêng
+      if (write.status === 'superseded') return;
+      const requestId = requestByWrite.get(write.id);
+      setRequests(prev => prev.map(req => {
+        if (req.id !== requestId) return req;
+        return write.status === 'failed'
+          ? {...req, trang_thai: 'Chờ duyệt', pending_write: false, write_error: write.error || 'Không ghi được quyết định'}
+          : {...req, pending_write: false, write_error: undefined};
+      }));
+    });
+  };
+
+  const toggleSelected = (requestId: number) => {
+    setSelected(prev => {
+      const next = new Set(prev);
+      if (next.has(requestId)) {
+        next.delete(requestId);
+      } else {
+        next.add(requestId);
+      }
+      return next;
+    });
+  };
+
+  const handleBulkApprove = async (approved: boolean) => {
+    const ids = Array.from(selected);
+    if (ids.length === 0) return;
+    setBulkProcessing(true);
+    try {
+      const response = await fetch(`${API_BASE}/leave-approve/bulk`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          request_ids: ids,
+          admin_id: adminId,
+          approved: approved
+        })
+      });
+      const data = await response.json();
+      if (data.success) {
+        markStatus(ids, approved);
+        setSelected(new Set());
+        trackWrites(data.write_ids || {});
+      }
+    } catch (error) {
+      console.error('Error approving requests:', error);
+    } finally {
+      setBulkProcessing(false);
     }
   };
 
@@ -88,20 +143,16 @@ export default function LeaveApprovalPanel({ adminId, onClose }: LeaveApprovalPa
       const data = await response.json();
       if (data.success) {
         // Update local state
-        setRequests(prev => prev.map(req => 
-          req.id === requestId 
-            ? {...req, trang_thai: approved ? 'Đã duyệt' : 'Từ chối'}
-            : req
-        ));
+        markStatus([requestId], approved);
+        if (data.write_id) trackWrites({ [requestId]: data.write_id });
+        setSelected(prev => {
+          const next = new Set(prev);
+          next.delete(requestId);
+          return next;
+        });
       }
     } catch (error) {
       console.error('Error approving request:', error);
-      // Demo mode - update locally
-      setRequests(prev => prev.map(req => 
-        req.id === requestId 
-          ? {...req, trang_thai: approved ? 'Đã duyệt' : 'Từ chối'}
-          : req
-      ));
     } finally {
       setProcessing(null);
     }
@@ -120,7 +171,14 @@ export default function LeaveApprovalPanel({ adminId, onClose }: LeaveApprovalPa
     }
   };
 
-  const pendingCount = requests.filter(r => r.trang_thai === 'Chờ duyệt').length;
+  const pendingRequests = requests.filter(r => r.trang_thai === 'Chờ duyệt');
+  // Chỉ đếm các trang đã tải; còn trang sau thì hiện dấu "+"
+  const pendingCount = `${pendingRequests.length}${nextCursor && filter === 'pending' ? '+' : ''}`;
+  const allPendingSelected = pendingRequests.length > 0 && pendingRequests.every(r => selected.has(r.id));
+
+  const toggleSelectAll = () => {
+    setSelected(allPendingSelected ? new Set() : new Set(pendingRequests.map(r => r.id)));
+  };
 
   return (
     <div className="action-modal-overlay" onClick={onClose}>
@@ -149,6 +207,29 @@ export default function LeaveApprovalPanel({ adminId, onClose }: LeaveApprovalPa
           </button>
         </div>
 
+        {pendingRequests.length > 0 && (
+          <div className="bulk-actions">
+            <label className="bulk-select-all">
+              <input type="checkbox" checked={allPendingSelected} onChange={toggleSelectAll} />
+              Chọn tất cả ({selected.size} đã chọn)
+            </label>
+            <button
+              className="btn-reject"
+              onClick={() => handleBulkApprove(false)}
+              disabled={selected.size === 0 || bulkProcessing}
+            >
+              ❌ Từ chối đã chọn
+            </button>
+            <button
+              className="btn-approve"
+              onClick={() => handleBulkApprove(true)}
+              disabled={selected.size === 0 || bulkProcessing}
+            >
+              {bulkProcessing ? <span className="spinner"></span> : <>✅ Duyệt đã chọn</>}
+            </button>
+          </div>
+        )}
+
         <div className="approval-content">
           {loading ? (
             <div className="loading-state">
@@ -166,6 +247,13 @@ export default function LeaveApprovalPanel({ adminId, onClose }: LeaveApprovalPa
                 <div key={request.id} className="request-card">
                   <div className="request-header">
                     <div className="employee-info">
+                      {request.trang_thai === 'Chờ duyệt' && (
+                        <input
+                          type="checkbox"
+                          checked={selected.has(request.id)}
+                          onChange={() => toggleSelected(request.id)}
+                        />
+                      )}
                       <span className="employee-avatar">👤</span>
                       <div>
                         <strong>{request.ho_ten}</strong>
@@ -173,9 +261,14 @@ export default function LeaveApprovalPanel({ adminId, onClose }: LeaveApprovalPa
                       </div>
                     </div>
                     <span className={`status-badge ${getStatusClass(request.trang_thai)}`}>
-                      {request.trang_thai}
+                      {request.trang_thai}{request.pending_write ? ' (đang ghi)' : ''}
                     </span>
                   </div>
+                  {request.write_error && (
+                    <div className="form-error">
+                      <span>⚠️</span> Chưa ghi được quyết định: {request.write_error}
+                    </div>
+                  )}
 
                   <div className="request-details">
                     <div className="detail-row">
@@ -219,6 +312,15 @@ export default function LeaveApprovalPanel({ adminId, onClose }: LeaveApprovalPa
                   )}
                 </div>
               ))}
+              {nextCursor && (
+                <button
+                  className="load-more-btn"
+                  onClick={() => fetchRequests(nextCursor)}
+                  disabled={loadingMore}
+                >
+                  {loadingMore ? <span className="spinner"></span> : <>Tải thêm</>}
+                </button>
+              )}
             </div>
           )}
         </div>
@@ -5,7 +5,7 @@ interface LeaveRequestFormProps {
   userId: number;
   userName: string;
   onClose: () => void;
-  onSubmit: (data: LeaveRequestData) => void;
+  onSubmit: (data: LeaveRequestData) => Promise<void> | void;
 }
 
 interface LeaveRequestData {
@@ -63,7 +63,7 @@ export default function LeaveRequestForm({ userId, userName, onClose, onSubmit }
         ly_do: formData.ly_do.trim()
       });
     } catch (err) {
-      setError('Có lỗi xảy ra. Vui lòng thử lại.');
+      setError(err instanceof Error && err.message ? err.message : 'Có lỗi xảy ra. Vui lòng thử lại.');
     } finally {
       setLoading(false);
     }
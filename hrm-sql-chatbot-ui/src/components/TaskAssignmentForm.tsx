@@ -19,7 +19,7 @@ interface TaskAssignmentFormProps {
   userRole: string;
   userPhongBanId?: number | null;
   onClose: () => void;
-  onSubmit: (data: TaskData) => void;
+  onSubmit: (data: TaskData) => Promise<void> | void;
 }
 
 interface TaskData {
@@ -57,9 +57,10 @@ export default function TaskAssignmentForm({ userId, userRole, userPhongBanId, o
   const fetchData = async () => {
     try {
       // Fetch employees and projects
+      // cache: 'no-cache' -> trình duyệt gửi If-None-Match, server trả 304 nếu danh sách không đổi
       const [empRes, projRes] = await Promise.all([
-        fetch(`${API_BASE}/employees?role=${userRole}&phong_ban_id=${userPhongBanId || ''}`),
-        fetch(`${API_BASE}/projects`)
+        fetch(`${API_BASE}/employees?role=${userRole}&phong_ban_id=${userPhongBanId || ''}`, { cache: 'no-cache' }),
+        fetch(`${API_BASE}/projects`, { cache: 'no-cache' })
       ]);
       
       const empData = await empRes.json();
@@ -124,7 +125,7 @@ export default function TaskAssignmentForm({ userId, userRole, userPhongBanId, o
         muc_do_uu_tien: formData.muc_do_uu_tien
       });
     } catch (err) {
-      setError('Có lỗi xảy ra. Vui lòng thử lại.');
+      setError(err instanceof Error && err.message ? err.message : 'Có lỗi xảy ra. Vui lòng thử lại.');
     } finally {
       setSubmitting(false);
     }
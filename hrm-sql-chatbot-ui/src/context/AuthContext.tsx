@@ -8,6 +8,7 @@ export interface User {
   vai_tro: string;
   role: 'admin' | 'manager' | 'employee';
   phong_ban_id: number | null;
+  token?: string; // Session token do /login cấp
 }
 
 interface AuthContextType {
@@ -11,18 +11,62 @@ import ExportChat from "../components/ExportChat";
 import KeyboardShortcuts from "../components/KeyboardShortcuts";
 import AnalyticsDashboard from "../components/AnalyticsDashboard";
 import { MOCK_MODE, getMockChatResponse } from "../services/mockData";
+import { watchWrites } from "../services/writeStatus";
 import "../App.css";
 
 const API_BASE = import.meta.env.VITE_API_BASE || 'http://127.0.0.1:8000';
 const API_URL = `${API_BASE}/chat`;
 
+interface ResultTable {
+  columns: string[];
+  rows: unknown[][];   // chỉ các dòng xem trước (server cắt sẵn)
+  total?: number;      // tổng số dòng của kết quả
+}
+
 interface Message {
   role: "user" | "bot";
   text: string;
   timestamp: Date;
   downloadUrl?: string;
+  table?: ResultTable;
 }
 
+// Số dòng hiển thị trong bảng kết quả (bản đầy đủ tải qua file Word)
+const TABLE_PREVIEW_ROWS = 50;
+
+const tableTotal = (table: ResultTable) => table.total ?? table.rows.length;
+
+// Lỗi từ API: FastAPI trả `detail` (chuỗi, hoặc danh sách lỗi validate), endpoint cũ trả `message`
+const apiErrorMessage = (result: any, status: number): string => {
+  const detail = result?.detail;
+  if (typeof detail === 'string' && detail) return detail;
+  if (Array.isArray(detail) && detail.length) return detail.map((d: any) => d?.msg || String(d)).join('; ');
+  return result?.message || `Có lỗi xảy ra (HTTP ${status})`;
+};
+
+// Gửi form hành động; lỗi (422 trùng đơn / không đủ phép, 503 quá tải...) ném Error mang lý do để form hiển thị
+const postAction = async (path: string, body: unknown) => {
+  let response: Response;
+  try {
+    response = await fetch(`${API_BASE}${path}`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(body)
+    });
+  } catch {
+    throw new Error('Lỗi kết nối backend. Vui lòng thử lại sau.');
+  }
+  const result = await response.json().catch(() => ({}));
+  if (!response.ok || !result.success) {
+    throw new Error(apiErrorMessage(result, response.status));
+  }
+  return result;
+};
+
+const isResultTable = (data: unknown): data is ResultTable =>
+  !!data && typeof data === 'object' &&
+  Array.isArray((data as ResultTable).columns) && Array.isArray((data as ResultTable).rows);
+
 interface ChatPageProps {
   roleTitle: string;
   roleColor: string;
@@ -97,13 +141,17 @@ export default function ChatPage({ roleTitle, roleColor, suggestedQuestions }: C
       }));
       const res = await fetch(API_URL, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: {
+          "Content-Type": "application/json",
+          ...(user?.token ? { Authorization: `Bearer ${user.token}` } : {})
+        },
         body: JSON.stringify({ 
           question: messageText,
           user_id: user?.id || null,
           role: user?.role || 'employee',
           phong_ban_id: user?.phong_ban_id || null,
-          conversation_history: conversationHistory  // Context Memory
+          conversation_history: conversationHistory,  // Context Memory
+          compact: true  // data dạng cột {columns, rows}
         }),
       });
       const data = await res.json();
@@ -114,7 +162,8 @@ export default function ChatPage({ roleTitle, roleColor, suggestedQuestions }: C
             role: "bot", 
             text: data.answer, 
             timestamp: new Date(),
-            downloadUrl: data.download_url
+            downloadUrl: data.download_url,
+            table: isResultTable(data.data) && tableTotal(data.data) > 1 ? data.data : undefined
           },
         ]);
         setIsTyping(false);
@@ -165,33 +214,28 @@ export default function ChatPage({ roleTitle, roleColor, suggestedQuestions }: C
     den_ngay: string;
     ly_do: string;
   }) => {
-    try {
-      const response = await fetch(`${API_BASE}/leave-request`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(data)
-      });
-      const result = await response.json();
-      
-      if (result.success) {
-        setActiveAction(null);
-        setMessages(prev => [...prev, {
-          role: 'bot',
-          text: `✅ **Đơn nghỉ phép đã được gửi thành công!**\n\n📅 Từ: ${data.tu_ngay}\n📅 Đến: ${data.den_ngay}\n📝 Lý do: ${data.ly_do}\n\n⏳ Đơn đang chờ duyệt từ cấp trên.`,
-          timestamp: new Date()
-        }]);
-      } else {
-        throw new Error(result.message || 'Có lỗi xảy ra');
-      }
-    } catch (error) {
-      // Demo mode fallback
-      setActiveAction(null);
+    // Lỗi được ném tiếp cho form: form giữ nguyên dữ liệu và hiện lý do
+    const result = await postAction('/leave-request', data);
+    setActiveAction(null);
+    setMessages(prev => [...prev, {
+      role: 'bot',
+      text: `✅ **Đơn nghỉ phép đã được gửi thành công!**\n\n📅 Từ: ${data.tu_ngay}\n📅 Đến: ${data.den_ngay}\n📝 Lý do: ${data.ly_do}\n\n⏳ Đơn đang chờ duyệt từ cấp trên.`,
+      timestamp: new Date()
+    }]);
+    notifyFailedWrite(result.write_id, `Đơn nghỉ phép ${data.tu_ngay} → ${data.den_ngay}`);
+  };
+
+  // Lượt ghi đã nhận (202) nhưng HRM không ghi được -> báo lại trong hội thoại kèm lý do
+  const notifyFailedWrite = (writeId: string | undefined, label: string) => {
+    if (!writeId) return;
+    watchWrites(API_BASE, [writeId], (write) => {
+      if (write.status !== 'failed') return;
       setMessages(prev => [...prev, {
         role: 'bot',
-        text: `✅ **Đơn nghỉ phép đã được gửi thành công!** _(Demo mode)_\n\n📅 Từ: ${data.tu_ngay}\n📅 Đến: ${data.den_ngay}\n📝 Lý do: ${data.ly_do}\n\n⏳ Đơn đang chờ duyệt từ cấp trên.`,
+        text: `❌ **${label} chưa được ghi vào hệ thống.**\n\n${write.error || 'Không rõ lý do'}\n\nVui lòng kiểm tra lại và gửi lại.`,
         timestamp: new Date()
       }]);
-    }
+    });
   };
 
   // Handle Task Assignment Submit
@@ -204,33 +248,14 @@ export default function ChatPage({ roleTitle, roleColor, suggestedQuestions }: C
     han_hoan_thanh: string;
     muc_do_uu_tien: string;
   }) => {
-    try {
-      const response = await fetch(`${API_BASE}/assign-task`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(data)
-      });
-      const result = await response.json();
-      
-      if (result.success) {
-        setActiveAction(null);
-        setMessages(prev => [...prev, {
-          role: 'bot',
-          text: `✅ **Công việc đã được giao thành công!**\n\n📌 Tên: ${data.ten_cong_viec}\n👥 Số người nhận: ${data.nguoi_nhan_ids.length}\n📅 Hạn: ${data.han_hoan_thanh}\n⚡ Ưu tiên: ${data.muc_do_uu_tien}`,
-          timestamp: new Date()
-        }]);
-      } else {
-        throw new Error(result.message || 'Có lỗi xảy ra');
-      }
-    } catch (error) {
-      // Demo mode fallback
-      setActiveAction(null);
-      setMessages(prev => [...prev, {
-        role: 'bot',
-        text: `✅ **Công việc đã được giao thành công!** _(Demo mode)_\n\n📌 Tên: ${data.ten_cong_viec}\n👥 Số người nhận: ${data.nguoi_nhan_ids.length}\n📅 Hạn: ${data.han_hoan_thanh}\n⚡ Ưu tiên: ${data.muc_do_uu_tien}`,
-        timestamp: new Date()
-      }]);
-    }
+    const result = await postAction('/assign-task', data);
+    setActiveAction(null);
+    setMessages(prev => [...prev, {
+      role: 'bot',
+      text: `✅ **Công việc đã được giao thành công!**\n\n📌 Tên: ${data.ten_cong_viec}\n👥 Số người nhận: ${data.nguoi_nhan_ids.length}\n📅 Hạn: ${data.han_hoan_thanh}\n⚡ Ưu tiên: ${data.muc_do_uu_tien}`,
+      timestamp: new Date()
+    }]);
+    notifyFailedWrite(result.write_id, `Công việc "${data.ten_cong_viec}"`);
   };
 
   return (
@@ -446,6 +471,32 @@ export default function ChatPage({ roleTitle, roleColor, suggestedQuestions }: C
                         <span className="message-time">{formatTime(m.timestamp)}</span>
                       </div>
                       <div className="message-text">{m.text}</div>
+                      {m.table && (
+                        <details className="result-table">
+                          <summary>📋 Xem dữ liệu ({tableTotal(m.table)} dòng)</summary>
+                          <div className="result-table-scroll">
+                            <table>
+                              <thead>
+                                <tr>
+                                  {m.table.columns.map((col) => <th key={col}>{col}</th>)}
+                                </tr>
+                              </thead>
+                              <tbody>
+                                {m.table.rows.slice(0, TABLE_PREVIEW_ROWS).map((row, r) => (
+                                  <tr key={r}>
+                                    {row.map((cell, c) => <td key={c}>{cell == null ? '' : String(cell)}</td>)}
+                                  </tr>
+                                ))}
+                              </tbody>
+                            </table>
+                          </div>
+                          {tableTotal(m.table) > Math.min(m.table.rows.length, TABLE_PREVIEW_ROWS) && (
+                            <p className="result-table-note">
+                              Hiển thị {Math.min(m.table.rows.length, TABLE_PREVIEW_ROWS)}/{tableTotal(m.table)} dòng đầu
+                            </p>
+                          )}
+                        </details>
+                      )}
                       {m.downloadUrl && (
                         <button 
                           className="download-button"
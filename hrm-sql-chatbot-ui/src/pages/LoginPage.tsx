@@ -33,7 +33,7 @@ export default function LoginPage() {
       }
       const user = data.user || (data.data && data.data[0]);
       if (data.success && user) {
-        login(user);
+        login(data.token ? { ...user, token: data.token } : user);
         switch (user.role || user.vai_tro) {
           case 'admin':
           case 'Admin':
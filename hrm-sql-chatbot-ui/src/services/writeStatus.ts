@@ -0,0 +1,52 @@
+// Theo dõi lượt ghi đã xếp hàng: endpoint ghi trả 202 + write_id ngay khi vào hàng đợi,
+// việc ghi xuống HRM diễn ra sau -> hỏi GET /writes?ids=... tới khi xong / thất bại
+
+export interface WriteStatus {
+  id: string;
+  kind: string;
+  status: 'queued' | 'done' | 'failed' | 'superseded';
+  attempts: number;
+  error: string | null;
+  result: unknown;
+}
+
+const POLL_INTERVAL_MS = 2000;
+// Quá thời gian này vẫn chưa gửi được (HRM ngắt mạch lâu) thì thôi theo dõi; lượt ghi vẫn nằm trong hàng đợi
+const MAX_POLLS = 90;
+
+// Gọi onFinished đúng một lần cho mỗi lượt ghi khi nó rời trạng thái queued
+export const watchWrites = (
+  apiBase: string,
+  writeIds: string[],
+  onFinished: (write: WriteStatus) => void
+) => {
+  const pending = new Set(writeIds.filter(Boolean));
+  let polls = 0;
+
+  const poll = async () => {
+    polls += 1;
+    try {
+      const ids = Array.from(pending).join(',');
+      const response = await fetch(`${apiBase}/writes?ids=${encodeURIComponent(ids)}`);
+      if (response.ok) {
+        const statuses: Record<string, WriteStatus | null> = await response.json();
+        for (const id of Array.from(pending)) {
+          const write = statuses[id];
+          if (write && write.status !== 'queued') {
+            pending.delete(id);
+            onFinished(write);
+          }
+        }
+      }
+    } catch {
+      // Mất kết nối tạm thời: hỏi lại ở lượt sau
+    }
+    if (pending.size > 0 && polls < MAX_POLLS) {
+      setTimeout(poll, POLL_INTERVAL_MS);
+    }
+  };
+
+  if (pending.size > 0) {
+    setTimeout(poll, POLL_INTERVAL_MS);
+  }
+};